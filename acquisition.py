@@ -0,0 +1,541 @@
+"""Acquisition worker: instrument I/O for one PSU/meter pair (rig) and the sample writer thread.
+
+run_measurement_test_db() runs a complete test on one rig. It is started by the scheduler in
+scheduler.py, and all its status/live rows are keyed by the rig id.
+"""
+import asyncio
+import collections
+import csv
+import datetime
+import functools
+import json
+import os
+import queue
+import re
+import threading
+import time
+
+import numpy as np
+import serial # pyvisa (~0.2 s to import) is imported where a PSU is opened or a run starts, so pages importing this module stay fast
+
+from live_db import DB_FILE, DEFAULT_RIG_ID, DbWriter, update_status_many
+from online_stats import LiveRunStats
+from run_catalog import DEFAULT_DB_FILE as CATALOG_DB_FILE, record_run, summary_from_online_stats
+from run_format import (RunFileWriter, RUN_FILE_EXTENSION, TIME_COLUMN, FLAG_COLUMN, FLAG_OK, FLAG_MISSING, FLAG_ERROR,
+                        PSU_READBACK_COLUMNS, local_utc_offset_sec, run_file_columns)
+from burst_capture import (DEFAULT_BURST_INTERVAL_SEC, DEFAULT_PRE_TRIGGER_SEC, DEFAULT_POST_TRIGGER_SEC, BurstCapture,
+                           EventFileWriter, events_filename_for, parse_triggers)
+from meter_log import LOG_POLL_INTERVAL_SEC, MeterLogReader
+from instrument_io import PSU_READBACK_TIMEOUT_SEC, ConcurrentSampler, DeviceBusy, read_line, read_psu_values
+from stage_timing import TimingMetrics, metrics_filename_for
+from sim_instruments import is_simulated_port, open_simulated_meter, open_simulated_psu
+
+# --- Configuration ---
+DATA_RECORD_INTERVAL_SEC = 1.0
+MIN_SAMPLE_INTERVAL_SEC = 0.05 # Lower bound for the configurable sample interval
+MIN_STANDARD_SAMPLE_INTERVAL_SEC = 0.5 # A Standard sample takes >= 400 ms (four fetches with fixed sleeps)
+METER_RESPONSE_TIMEOUT_SEC = 0.5 # High-rate mode: deadline for all fetch responses of one sample
+METER_SAMPLE_TIMEOUT_SEC = 2.0 # Whole meter fetch of one sample, either mode
+LOG_FINAL_DOWNLOAD_ATTEMPTS = 5 # Buffered mode: block downloads tried after the stop before giving up on the rest
+METER_FETCH_COMMANDS = [b":FETCh VOLTage\n", b":FETCh CURRent\n", b":FETCh power\n", b":FETCh energy\n"]
+ACQ_MODE_STANDARD = "Standard"; ACQ_MODE_HIGH_RATE = "High-rate"; ACQ_MODE_BUFFERED = "Buffered (meter log)"
+DB_FLUSH_INTERVAL_SEC = 0.5 # Writer thread drains the sample queue and commits once per interval
+SAMPLE_QUEUE_MAX = 10000 # Bounded queue between acquisition and writer; new samples are dropped when full
+SAMPLE_WRITE_DELAY_LIMIT_SEC = 2.0 # Samples written later than this after acquisition count as delayed
+METRICS_PUBLISH_INTERVAL_SEC = 2.0 # Timing metrics are pushed to the rig status and metrics file this often
+CSV_HEADER = ['Timestamp', 'Elapsed Time (s)', 'Voltage (V)', 'Current (A)', 'Power (W)', 'Energy (Wh)']
+CSV_DIR = "csv"
+
+
+def csv_filename_for(rig_id, when=None):
+    """Final CSV path for a run; the rig id keeps concurrent runs from colliding."""
+    rig_slug = re.sub(r'[^A-Za-z0-9]+', '-', rig_id).strip('-') or 'rig'
+    return os.path.join(CSV_DIR, f"PSU_Meter_Test_{(when or datetime.datetime.now()).strftime('%Y%m%d_%H%M%S')}_{rig_slug}.csv")
+
+
+# --- Device Communication Functions ---
+def connect_psu(resource_string, baud_rate):
+    import pyvisa
+    rm = pyvisa.ResourceManager('@py'); psu = rm.open_resource(resource_string, baud_rate=baud_rate, data_bits=8, parity=pyvisa.constants.Parity.none, stop_bits=pyvisa.constants.StopBits.one)
+    psu.read_termination='\n'; psu.write_termination='\n'; psu.timeout=5000; return rm, psu
+def connect_meter(port, baud_rate, timeout):
+    meter = serial.Serial(port, baud_rate, serial.EIGHTBITS, serial.PARITY_NONE, serial.STOPBITS_ONE, timeout=timeout); return meter
+def open_psu(psu_port):
+    """Connects the PSU on a serial port, or a simulated one for 'sim://' ports."""
+    if is_simulated_port(psu_port): return open_simulated_psu(psu_port)
+    return connect_psu(f'ASRL{psu_port}::INSTR', 115200)
+def open_meter(meter_port):
+    if is_simulated_port(meter_port): return open_simulated_meter(meter_port, 2)
+    return connect_meter(meter_port, 115200, 2)
+def setup_psu(psu, voltage, current_limit):
+    psu.write(f'VOLTage {voltage}'); time.sleep(0.2); psu.write(f'CURRent {current_limit}'); time.sleep(0.2)
+def setup_meter(meter):
+    meter.write(b":FUNCtion:mode DC\n"); time.sleep(0.1); meter.write(b":FUNCtion:ENERgy reset\n"); time.sleep(0.1); meter.write(b":FUNCtion:ecmode MAN\n"); time.sleep(0.1)
+    now=datetime.datetime.now(); year=now.strftime("%y"); month=now.strftime("%m"); day=now.strftime("%d"); hour=now.strftime("%H"); minute=now.strftime("%M"); second=now.strftime("%S")
+    meter.write(f":SYSTem:year {year}\n".encode('utf-8')); time.sleep(0.05); meter.write(f":SYSTem:MONth {month}\n".encode('utf-8')); time.sleep(0.05)
+    meter.write(f":SYSTem:date {day}\n".encode('utf-8')); time.sleep(0.05); meter.write(f":SYSTem:hour {hour}\n".encode('utf-8')); time.sleep(0.05)
+    meter.write(f":SYSTem:MINute {minute}\n".encode('utf-8')); time.sleep(0.05); meter.write(f":SYSTem:SECond {second}\n".encode('utf-8')); time.sleep(0.2)
+
+def command_stage(command):
+    """Timing stage name of a meter command, e.g. 'meter :FETCh VOLTage'."""
+    return "meter " + command.decode('utf-8').strip()
+def discard_late_responses(meter, outstanding, timeout=METER_RESPONSE_TIMEOUT_SEC):
+    """Reads and drops up to `outstanding` responses still in flight (waiting at most timeout), then clears the
+    input buffer, so replies that arrive late are never read as the next sample's values. Returns how many never arrived."""
+    deadline = time.monotonic() + timeout
+    while outstanding > 0:
+        if read_line(meter, deadline) is None: break # Nothing more arrived: the rest were dropped by the meter
+        outstanding -= 1
+    meter.reset_input_buffer()
+    return outstanding
+def fetch_meter_values_fast(meter, response_timeout=METER_RESPONSE_TIMEOUT_SEC, metrics=None):
+    """High-rate fetch: sends all queries back-to-back, then reads the responses against one deadline.
+    Returns [voltage, current, power, energy]; a value is None if its response missed the deadline.
+    After a missed deadline or a garbled response the replies still in flight are discarded before returning. If some
+    reply never arrives at all, the meter dropped one and the responses read may be shifted, so all values are None.
+    With metrics, each command's latency is recorded as the time from the write to its response."""
+    meter.reset_input_buffer()
+    sent_at = time.monotonic(); meter.write(b"".join(METER_FETCH_COMMANDS))
+    deadline = time.monotonic() + response_timeout
+    values = []
+    for index, command in enumerate(METER_FETCH_COMMANDS):
+        try: line = read_line(meter, deadline); value = None if line is None else float(line)
+        except ValueError: discard_late_responses(meter, len(METER_FETCH_COMMANDS) - index - 1, response_timeout); raise
+        if value is None: # Later responses would be misaligned: drop them and leave them as None
+            if metrics: metrics.increment('late response drains')
+            if discard_late_responses(meter, len(METER_FETCH_COMMANDS) - index, response_timeout): values = []
+            break
+        if metrics: metrics.record(command_stage(command), time.monotonic() - sent_at)
+        values.append(value)
+    return values + [None] * (len(METER_FETCH_COMMANDS) - len(values))
+def fetch_meter_values_standard(meter, metrics=None):
+    """Original fetch: one query at a time with a fixed 100 ms settle before each read."""
+    values = []
+    for command in METER_FETCH_COMMANDS:
+        value = None; sent_at = time.monotonic()
+        meter.reset_input_buffer()
+        meter.write(command); time.sleep(0.1)
+        if meter.in_waiting > 0: value = float(meter.readline().decode('utf-8').strip())
+        if metrics: metrics.record(command_stage(command), time.monotonic() - sent_at)
+        values.append(value)
+    return values
+
+
+# --- Sample Writer Thread (consumer side of the acquisition queue) ---
+SampleBlock = collections.namedtuple('SampleBlock', 'epochs elapsed_seconds values enqueued_at') # Arrays; values is (n, channels), NaN = missing
+
+
+class SampleWriter(threading.Thread):
+    """Drains raw samples from a bounded queue to the CSV and the live table in bulk.
+
+    The acquisition loop only calls put_sample()/set_status(), so filesystem or SQLite
+    stalls never delay instrument reads. Overflow policy: when the queue is full the new
+    sample is dropped and counted in 'dropped_samples'; samples written more than
+    SAMPLE_WRITE_DELAY_LIMIT_SEC after acquisition are counted in 'delayed_samples'.
+
+    Writer stages ('csv write', 'db flush', ...) are timed into metrics, which is published
+    to the 'timing_metrics' status key and the run's metrics file every METRICS_PUBLISH_INTERVAL_SEC.
+    Every written sample also updates the run's LiveRunStats, published to 'live_stats' on each drain.
+    Burst events queued with put_event() are encoded and appended to events_filename here, off the acquisition thread.
+    """
+    def __init__(self, rig_id, csv_filename, run_filename=None, queue_size=SAMPLE_QUEUE_MAX, drain_interval=DB_FLUSH_INTERVAL_SEC,
+                 metrics=None, stats=None, psu_readback=False, events_filename=None):
+        super().__init__(daemon=True)
+        self.rig_id = rig_id; self.csv_filename = csv_filename; self.run_filename = run_filename; self.drain_interval = drain_interval
+        self.metrics = metrics or TimingMetrics(); self.metrics_filename = metrics_filename_for(csv_filename)
+        self.stats = stats or LiveRunStats()
+        self.csv_header = CSV_HEADER + (PSU_READBACK_COLUMNS if psu_readback else []); self.run_file_columns = run_file_columns(psu_readback)
+        self.run_writer = None # Optional binary (.vrun) output next to the CSV
+        self.samples = queue.Queue(maxsize=queue_size)
+        self.events = queue.Queue() # Completed burst events; at most MAX_EVENTS_PER_RUN per run
+        self.event_writer = EventFileWriter(events_filename, self.csv_header[2:]) if events_filename else None # File created on the first event
+        self.status_lock = threading.Lock(); self.pending_status = {}; self.final_status = {}
+        self.csv_requested = False; self.stop_requested = threading.Event(); self.final_status_published = False
+        self.dropped_samples = 0; self.delayed_samples = 0; self.written_samples = 0
+
+    # --- Producer side (acquisition thread) ---
+    def set_status(self, key, value):
+        with self.status_lock: self.pending_status[key] = value
+
+    def open_csv(self):
+        """Requests the CSV to be created; samples put after this call go to the file."""
+        self.csv_requested = True
+
+    def put_sample(self, timestamp, elapsed_seconds, values, is_error=False):
+        """Queues one raw sample (epoch timestamp, elapsed s, [V, I, P, E]) without blocking."""
+        try: self.samples.put_nowait((timestamp, elapsed_seconds, values, is_error, time.monotonic()))
+        except queue.Full:
+            self.dropped_samples += 1
+            if self.dropped_samples == 1 or self.dropped_samples % 100 == 0: print(f"THREAD[{self.rig_id}]: Sample queue full, dropped {self.dropped_samples} sample(s)")
+
+    def put_block(self, epochs, elapsed_seconds, values):
+        """Queues a block of samples (epoch and elapsed arrays, (n, channels) value array with NaN for missing) as one item."""
+        if not len(epochs): return
+        try: self.samples.put_nowait(SampleBlock(epochs, elapsed_seconds, values, time.monotonic()))
+        except queue.Full:
+            self.dropped_samples += len(epochs); print(f"THREAD[{self.rig_id}]: Sample queue full, dropped a block of {len(epochs)} sample(s)")
+
+    def put_event(self, event):
+        """Queues a completed burst event (see BurstCapture) for the events file."""
+        self.events.put_nowait(event)
+
+    def close(self, final_status):
+        """Drains everything left, closes the CSV, then publishes final_status and stops.
+        If the writer thread died (e.g. the DB could not be opened), final_status is published directly."""
+        self.final_status = final_status; self.stop_requested.set(); self.join()
+        if not self.final_status_published:
+            print(f"WRITER[{self.rig_id}]: Writer thread had stopped, publishing the final status directly"); update_status_many(self.rig_id, final_status)
+
+    # --- Consumer side (writer thread) ---
+    def run(self):
+        db_writer = None; csv_file = None; csv_writer = None
+        next_publish = time.monotonic() + METRICS_PUBLISH_INTERVAL_SEC
+        try:
+            db_writer = DbWriter(self.rig_id, run_name=os.path.splitext(os.path.basename(self.csv_filename))[0])
+            while True:
+                stopping = self.stop_requested.wait(self.drain_interval)
+                batch = []
+                try:
+                    while True: batch.append(self.samples.get_nowait())
+                except queue.Empty: pass
+                if self.csv_requested and csv_file is None: # Checked after draining so no queued sample misses the file
+                    try:
+                        csv_file = open(self.csv_filename, 'w', newline=''); csv_writer = csv.writer(csv_file)
+                        csv_writer.writerow(self.csv_header); print(f"WRITER[{self.rig_id}]: Final CSV opened: {self.csv_filename}")
+                        if self.run_filename: self.run_writer = RunFileWriter(self.run_filename, self.run_file_columns,
+                                                                              metadata={'source': os.path.basename(self.csv_filename)})
+                    except OSError as e:
+                        print(f"WRITER[{self.rig_id}]: CSV open error: {e}"); db_writer.update_status('last_error', f"CSV open error: {e}")
+                        self.csv_requested = False
+                if batch:
+                    self.write_batch(batch, csv_writer, db_writer)
+                    if csv_file is not None: db_writer.update_status('live_stats', json.dumps(self.stats.snapshot()))
+                self.write_events(db_writer)
+                with self.status_lock: status, self.pending_status = self.pending_status, {}
+                for key, value in status.items(): db_writer.update_status(key, value)
+                db_writer.update_status('dropped_samples', self.dropped_samples)
+                db_writer.update_status('delayed_samples', self.delayed_samples)
+                if stopping and self.samples.empty(): break
+                if time.monotonic() >= next_publish:
+                    self.publish_metrics(db_writer, csv_file is not None); next_publish = time.monotonic() + METRICS_PUBLISH_INTERVAL_SEC
+                with self.metrics.time('db flush'): db_writer.flush()
+        finally:
+            if self.event_writer:
+                self.write_events(db_writer)
+                try: self.event_writer.close()
+                except OSError as e: print(f"WRITER[{self.rig_id}]: Burst event file close error: {e}")
+            if csv_file:
+                try: csv_file.close(); print(f"WRITER[{self.rig_id}]: Final CSV closed ({self.written_samples} rows).")
+                except OSError as e: print(f"WRITER[{self.rig_id}]: CSV close error: {e}")
+            if self.run_writer:
+                try: self.run_writer.metadata['stats'] = self.stats.snapshot(); self.run_writer.close(); print(f"WRITER[{self.rig_id}]: Binary run file written: {self.run_filename}")
+                except OSError as e: print(f"WRITER[{self.rig_id}]: Binary run file error: {e}")
+            if db_writer:
+                self.publish_metrics(db_writer, csv_file is not None)
+                for key, value in self.final_status.items(): db_writer.update_status(key, value) # Only after the CSV is complete
+                db_writer.close(); self.final_status_published = self.stop_requested.is_set() # Else the thread died mid-run
+
+    def write_events(self, db_writer):
+        try:
+            while True:
+                event = self.events.get_nowait()
+                try:
+                    with self.metrics.time('event write'): self.event_writer.write(event)
+                except OSError as e: print(f"WRITER[{self.rig_id}]: Burst event write error: {e}"); db_writer.update_status('last_error', f"Burst event write error: {e}")
+        except queue.Empty: pass
+
+    def write_batch(self, batch, csv_writer, db_writer):
+        """Writes queued items in order: runs of single samples together, SampleBlocks vectorized."""
+        samples = []
+        for item in batch:
+            if not isinstance(item, SampleBlock): samples.append(item); continue
+            if samples: self.write_samples(samples, csv_writer, db_writer); samples = []
+            self.write_block(item, csv_writer, db_writer)
+        if samples: self.write_samples(samples, csv_writer, db_writer)
+
+    def write_samples(self, batch, csv_writer, db_writer):
+        now = time.monotonic(); rows = []
+        for timestamp, elapsed_seconds, values, is_error, enqueued_at in batch:
+            self.metrics.record('sample queue wait', now - enqueued_at)
+            if now - enqueued_at > SAMPLE_WRITE_DELAY_LIMIT_SEC: self.delayed_samples += 1
+            timestamp_str = datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+            if csv_writer: self.stats.update(timestamp, elapsed_seconds, None if is_error else values[:4]) # Only samples that reach the file
+            if is_error: rows.append([timestamp_str, f"{elapsed_seconds:.3f}"] + ['ERROR'] * (len(self.csv_header) - 2)); continue
+            rows.append([timestamp_str, f"{elapsed_seconds:.3f}"] + [val if val is not None else 'N/A' for val in values])
+            v_val, i_val = values[0], values[1]
+            if v_val is not None and i_val is not None: db_writer.add_live_data(elapsed_seconds, v_val, i_val)
+        if csv_writer:
+            try:
+                with self.metrics.time('csv write'): csv_writer.writerows(rows)
+            except OSError as e: print(f"WRITER[{self.rig_id}]: CSV write error: {e}"); db_writer.update_status('last_error', f"CSV write error: {e}")
+        if self.run_writer:
+            try:
+                with self.metrics.time('vrun write'): self.run_writer.append(self.run_columns(batch))
+            except OSError as e: print(f"WRITER[{self.rig_id}]: Binary run file write error: {e}")
+        self.written_samples += len(rows)
+
+    def write_block(self, block, csv_writer, db_writer):
+        """write_samples() for one SampleBlock, with array operations instead of a loop per sample."""
+        epochs, elapsed_seconds, values, enqueued_at = block; count = len(epochs); wait = time.monotonic() - enqueued_at
+        self.metrics.record('sample queue wait', wait)
+        if wait > SAMPLE_WRITE_DELAY_LIMIT_SEC: self.delayed_samples += count
+        missing = np.isnan(values)
+        if csv_writer:
+            self.stats.update_block(epochs, elapsed_seconds, values[:, :4])
+            offset = local_utc_offset_sec(datetime.datetime.fromtimestamp(epochs[0]))
+            local_ms = np.floor((epochs + offset) * 1000).astype('int64').astype('datetime64[ms]') # Truncated like the per-sample path
+            cells = values.astype(str); cells[missing] = 'N/A'
+            rows = np.column_stack([np.char.replace(np.datetime_as_string(local_ms, unit='ms'), 'T', ' '),
+                                    np.char.mod('%.3f', elapsed_seconds), cells]).tolist()
+            try:
+                with self.metrics.time('csv write'): csv_writer.writerows(rows)
+            except OSError as e: print(f"WRITER[{self.rig_id}]: CSV write error: {e}"); db_writer.update_status('last_error', f"CSV write error: {e}")
+        db_writer.add_live_block(elapsed_seconds, values[:, 0], values[:, 1])
+        if self.run_writer:
+            columns = {TIME_COLUMN: epochs, 'Elapsed Time (s)': elapsed_seconds,
+                       FLAG_COLUMN: np.where(missing.any(axis=1), FLAG_MISSING, FLAG_OK)}
+            columns.update((name, values[:, index]) for index, name in enumerate(self.csv_header[2:]))
+            try:
+                with self.metrics.time('vrun write'): self.run_writer.append(columns)
+            except OSError as e: print(f"WRITER[{self.rig_id}]: Binary run file write error: {e}")
+        self.written_samples += count
+
+    def publish_metrics(self, db_writer, write_file):
+        """Pushes a compact per-stage summary to the rig status and the full snapshot to the metrics file."""
+        snapshot = self.metrics.snapshot()
+        compact = {'counters': snapshot['counters'],
+                   'stages': {stage: {key: value for key, value in summary.items() if key != 'histogram'}
+                              for stage, summary in snapshot['stages'].items()}}
+        db_writer.update_status('timing_metrics', json.dumps(compact))
+        if not write_file: return
+        try: self.metrics.write_json(self.metrics_filename, {'rig_id': self.rig_id, 'csv_file': os.path.basename(self.csv_filename)})
+        except OSError as e: print(f"WRITER[{self.rig_id}]: Metrics file write error: {e}")
+
+    def run_columns(self, batch):
+        """Converts a batch of raw samples to .vrun columns (NaN + flag for N/A and ERROR)."""
+        nan = float('nan'); columns = {name: [] for name in [TIME_COLUMN] + self.csv_header[1:] + [FLAG_COLUMN]}
+        for timestamp, elapsed_seconds, values, is_error, _ in batch:
+            columns[TIME_COLUMN].append(timestamp); columns['Elapsed Time (s)'].append(elapsed_seconds)
+            for name, val in zip(self.csv_header[2:], values or [None] * (len(self.csv_header) - 2)): columns[name].append(nan if val is None else val)
+            if is_error: columns[FLAG_COLUMN].append(FLAG_ERROR)
+            else: columns[FLAG_COLUMN].append(FLAG_MISSING if None in values else FLAG_OK)
+        return columns
+
+
+def run_meter_log_loop(meter, sample_writer, stop_event, duration, log_interval, metrics, rig_id, commands=None):
+    """Buffered mode: the meter logs every log_interval; the records are downloaded in blocks every LOG_POLL_INTERVAL_SEC
+    and queued as SampleBlocks. Elapsed times are the meter's own record times, anchored at the log start.
+    After the duration or a stop, the records logged up to then are still downloaded. Returns an error message or ''."""
+    reader = MeterLogReader(meter, commands, metrics=metrics)
+    reader.start(log_interval); start_time = time.time(); start_mono = time.monotonic()
+    print(f"THREAD[{rig_id}]: Meter logging every {log_interval} s")
+
+    def queue_records(records):
+        records = records[records[:, 0] < duration] # Logged after the duration, before the stop command arrived
+        sample_writer.put_block(start_time + records[:, 0], records[:, 0], records[:, 1:])
+        sample_writer.set_status('missed_responses', reader.failed_blocks)
+
+    try:
+        while not stop_event.is_set():
+            elapsed_seconds = time.monotonic() - start_mono
+            if elapsed_seconds >= duration: print(f"THREAD[{rig_id}]: Duration reached."); break
+            with metrics.time('log download'): queue_records(reader.download())
+            sample_writer.set_status('remaining_time', max(0, duration - elapsed_seconds))
+            stop_event.wait(LOG_POLL_INTERVAL_SEC)
+        reader.stop()
+        for _ in range(LOG_FINAL_DOWNLOAD_ATTEMPTS): # Whatever the meter logged before the stop
+            with metrics.time('log download'): queue_records(reader.download())
+            if reader.pending() == 0: break
+        else: print(f"THREAD[{rig_id}]: Meter log not fully downloaded ({reader.logged - reader.next_index} record(s) left)")
+        print(f"THREAD[{rig_id}]: Meter log downloaded: {reader.next_index} record(s), {reader.failed_blocks} block retries")
+        return ""
+    except serial.SerialException as e:
+        print(f"THREAD[{rig_id}]: ERROR (SerialException): {e}"); return f"SerialException: {e}"
+
+
+# --- Background Test Function ---
+def run_measurement_test_db(psu_port, meter_port, voltage, current_limit, duration, stop_event,
+                            sample_interval=DATA_RECORD_INTERVAL_SEC, acq_mode=ACQ_MODE_STANDARD, write_binary=False,
+                            rig_id=DEFAULT_RIG_ID, battery_capacity_mah=None, psu_readback=False, burst_triggers=None,
+                            burst_interval=DEFAULT_BURST_INTERVAL_SEC, burst_pre_sec=DEFAULT_PRE_TRIGGER_SEC, burst_post_sec=DEFAULT_POST_TRIGGER_SEC,
+                            meter_log_commands=None):
+    """Acquires samples on one rig and hands them to a SampleWriter thread, which writes status/data to DB and the final CSV.
+    With burst_triggers (see burst_capture; High-rate mode only), samples are taken every burst_interval and trigger events are written to
+    '<run>.events.jsonl', while the CSV/DB keep one sample per sample_interval. In ACQ_MODE_BUFFERED the meter logs every
+    sample_interval on its own clock (see run_meter_log_loop; meter_log_commands overrides meter_log's command templates)."""
+    import pyvisa
+    if acq_mode == ACQ_MODE_BUFFERED and (psu_readback or burst_triggers):
+        print(f"THREAD[{rig_id}]: PSU readback and burst capture are not available with the meter log, ignored")
+        psu_readback = False; burst_triggers = None
+    if acq_mode == ACQ_MODE_STANDARD and sample_interval < MIN_STANDARD_SAMPLE_INTERVAL_SEC:
+        print(f"THREAD[{rig_id}]: Warning: a {ACQ_MODE_STANDARD} sample takes >= 400 ms, so a {sample_interval} s interval will overrun every sample")
+    psu = None; meter = None; rm = None; sampler = None; burst = None
+    test_start_time = 0; final_status = "Unknown"; error_msg = ""; missed_responses = 0; psu_idn = None
+    final_filename = csv_filename_for(rig_id)
+
+    run_filename = os.path.splitext(final_filename)[0] + RUN_FILE_EXTENSION if write_binary else None
+    metrics = TimingMetrics()
+    sample_writer = SampleWriter(rig_id, final_filename, run_filename, metrics=metrics, stats=LiveRunStats(battery_capacity_mah),
+                                 psu_readback=psu_readback, events_filename=events_filename_for(final_filename)); sample_writer.start()
+    sample_writer.set_status('status_text', 'Connecting...'); sample_writer.set_status('current_csv_filename', final_filename)
+    sample_writer.set_status('last_error', ''); sample_writer.set_status('missed_responses', 0)
+    sample_writer.set_status('overruns', 0); sample_writer.set_status('skipped_samples', 0); sample_writer.set_status('burst_events', 0)
+
+    try:
+        triggers = parse_triggers(burst_triggers) if isinstance(burst_triggers, str) else list(burst_triggers or [])
+        if triggers and acq_mode != ACQ_MODE_HIGH_RATE: # A Standard sample takes >= 400 ms, so burst windows would hold a fraction of their time
+            raise ValueError(f"Burst capture needs the {ACQ_MODE_HIGH_RATE} acquisition mode")
+        loop_interval = min(burst_interval, sample_interval) if triggers else sample_interval
+        if triggers:
+            burst = BurstCapture(triggers, sample_writer.put_event, round(burst_pre_sec / loop_interval), round(burst_post_sec / loop_interval))
+            print(f"THREAD[{rig_id}]: Burst capture every {loop_interval} s on {', '.join(map(str, triggers))}")
+        print(f"THREAD[{rig_id}]: Connecting..."); rm, psu = open_psu(psu_port); meter = open_meter(meter_port)
+        print(f"THREAD[{rig_id}]: Devices Connected.")
+        try:
+            with metrics.time('psu *IDN?'): psu_idn = psu.query('*IDN?').strip()
+            sample_writer.set_status('psu_idn', psu_idn)
+        except Exception: sample_writer.set_status('psu_idn', 'IDN Failed')
+        sample_writer.set_status('meter_port_name', meter.name); print(f"THREAD[{rig_id}]: Meter Connected: {meter.name}")
+        sample_writer.set_status('status_text', 'Configuring...')
+
+        print(f"THREAD[{rig_id}]: Configuring...")
+        with metrics.time('psu setup'): setup_psu(psu, voltage, current_limit)
+        with metrics.time('meter setup'): setup_meter(meter)
+        print(f"THREAD[{rig_id}]: Configured.")
+        print(f"THREAD[{rig_id}]: Turning PSU ON..."); psu.write('OUTPut ON'); time.sleep(1); print(f"THREAD[{rig_id}]: PSU ON.")
+        print(f"THREAD[{rig_id}]: Starting Meter..."); meter.write(b":FUNCtion:ENERgy run\n"); time.sleep(0.1)
+
+        sample_writer.set_status('status_text', 'Running...'); test_start_time = time.time(); test_start_mono = time.monotonic()
+        sample_writer.open_csv()
+        if acq_mode == ACQ_MODE_BUFFERED:
+            error_msg = run_meter_log_loop(meter, sample_writer, stop_event, duration, sample_interval, metrics, rig_id, meter_log_commands)
+            if error_msg: final_status = "Error"
+        else:
+            # Meter fetch and (optional) PSU readback run concurrently, each on its own device thread with its own timeout
+            fetch_meter_values = fetch_meter_values_fast if acq_mode == ACQ_MODE_HIGH_RATE else fetch_meter_values_standard
+            reads = {'meter': (functools.partial(fetch_meter_values, meter, metrics=metrics), METER_SAMPLE_TIMEOUT_SEC)}
+            if psu_readback: reads['psu'] = (functools.partial(read_psu_values, psu, metrics), PSU_READBACK_TIMEOUT_SEC)
+            sampler = ConcurrentSampler(reads, stop_event, metrics)
+            # Samples are due at absolute monotonic deadlines test_start + n * interval, so loop overhead never accumulates
+            sample_index = 0; overruns = 0; skipped_samples = 0; baseline_index = 0
+
+            while not stop_event.is_set():
+                loop_start_mono = time.monotonic()
+                elapsed_seconds = loop_start_mono - test_start_mono
+                if elapsed_seconds >= duration: print(f"THREAD[{rig_id}]: Duration reached."); break
+                metrics.record('sample start lateness', loop_start_mono - (test_start_mono + sample_index * loop_interval))
+
+                timestamp = test_start_time + elapsed_seconds # Wall-clock anchor + monotonic offset; formatted by the writer thread
+
+                try:
+                    with metrics.time('sample total'): results = sampler.sample()
+                    if results is None: break # Stop event set mid-sample; the partial sample is dropped
+                    values = results['meter']
+                    if isinstance(values, (asyncio.TimeoutError, DeviceBusy)): values = [None] * len(METER_FETCH_COMMANDS)
+                    elif isinstance(values, Exception): raise values
+                    if psu_readback:
+                        psu_values = results['psu']
+                        if isinstance(psu_values, Exception):
+                            print(f"THREAD[{rig_id}]: PSU readback failed ({type(psu_values).__name__}): {psu_values}"); psu_values = [None, None]
+                        values = values + psu_values
+                    missing = sum(val is None for val in values)
+                    if missing:
+                        missed_responses += missing; sample_writer.set_status('missed_responses', missed_responses)
+                        print(f"THREAD[{rig_id}]: Missed {missing} response(s) at {elapsed_seconds:.3f} s")
+                    if burst is None or elapsed_seconds >= baseline_index * sample_interval: # Baseline log keeps the slow rate
+                        sample_writer.put_sample(timestamp, elapsed_seconds, values); baseline_index = int(elapsed_seconds // sample_interval) + 1
+                    trigger = burst.add(timestamp, elapsed_seconds, values) if burst else None
+                    if trigger:
+                        print(f"THREAD[{rig_id}]: Burst event {burst.event_count} ({trigger}) at {elapsed_seconds:.3f} s")
+                        sample_writer.set_status('burst_events', burst.event_count)
+
+                except (ValueError, serial.SerialException, pyvisa.errors.VisaIOError, Exception) as meas_err:
+                    error_type = type(meas_err).__name__; print(f"THREAD[{rig_id}]: ERROR ({error_type}): {meas_err}")
+                    if burst is None or elapsed_seconds >= baseline_index * sample_interval: # Error rows keep the baseline rate too
+                        sample_writer.put_sample(timestamp, elapsed_seconds, None, is_error=True); baseline_index = int(elapsed_seconds // sample_interval) + 1
+                    if burst: burst.add(timestamp, elapsed_seconds, None)
+                    if isinstance(meas_err, (serial.SerialException, pyvisa.errors.VisaIOError)):
+                        error_msg = f"{error_type}: {meas_err}"; final_status = "Error"; break
+
+                remaining = max(0, duration - elapsed_seconds)
+                sample_writer.set_status('remaining_time', remaining)
+
+                # --- Wait for the next absolute deadline; on overrun, skip the slots that have fully passed ---
+                sample_index += 1; now = time.monotonic()
+                if now > test_start_mono + sample_index * loop_interval:
+                    overruns += 1; metrics.increment('overruns')
+                    current_slot = int((now - test_start_mono) // loop_interval)
+                    if current_slot > sample_index:
+                        skipped_samples += current_slot - sample_index; metrics.increment('skipped_samples', current_slot - sample_index)
+                        sample_index = current_slot
+                    sample_writer.set_status('overruns', overruns); sample_writer.set_status('skipped_samples', skipped_samples)
+                stop_event.wait(max(0, test_start_mono + sample_index * loop_interval - time.monotonic()))
+        # --- End of loop ---
+        if stop_event.is_set(): print(f"THREAD[{rig_id}]: Stop event."); final_status = "Stopped"
+        elif final_status != "Error": final_status = "Finished"
+
+    except (serial.SerialException, pyvisa.errors.VisaIOError, Exception) as conn_err:
+        error_type = type(conn_err).__name__; error_msg = f"Conn/Setup Error ({error_type}): {conn_err}"
+        print(f"THREAD[{rig_id}]: FATAL ERROR: {error_msg}"); final_status = "Error"
+    finally:
+        # --- Cleanup (Corrected Syntax) ---
+        print(f"THREAD[{rig_id}]: Cleanup sequence started...")
+        if sampler: sampler.close() # Waits for in-flight device reads before the cleanup commands
+        if burst:
+            burst.close() # An event still collecting post-trigger samples is queued as truncated, before the writer stops
+
+        # Cleanup Meter
+        if meter:
+            try:
+                print(f"THREAD[{rig_id}]: Stopping meter energy...")
+                meter.write(b":FUNCtion:ENERgy stop\n") # Each command on its own line
+                time.sleep(0.1)
+                print(f"THREAD[{rig_id}]: Resetting meter energy...")
+                meter.write(b":FUNCtion:ENERgy reset\n")
+                time.sleep(0.1)
+                print(f"THREAD[{rig_id}]: Closing meter port...")
+                meter.close()
+                print(f"THREAD[{rig_id}]: Meter closed.")
+            except Exception as e_meter_close:
+                print(f"THREAD[{rig_id}]: Meter cleanup error: {e_meter_close}")
+
+        # Cleanup PSU
+        if psu:
+            try:
+                print(f"THREAD[{rig_id}]: Turning PSU OFF...")
+                psu.write('OUTPut OFF') # Each command on its own line
+                time.sleep(0.2)
+                print(f"THREAD[{rig_id}]: Closing PSU port...")
+                psu.close()
+                print(f"THREAD[{rig_id}]: PSU closed.")
+            except Exception as e_psu_close:
+                print(f"THREAD[{rig_id}]: PSU cleanup/OFF error: {e_psu_close}")
+
+        # Cleanup Resource Manager
+        if rm:
+            try:
+                print(f"THREAD[{rig_id}]: Closing VISA RM...")
+                rm.close() # Command on its own line
+                print(f"THREAD[{rig_id}]: VISA RM closed.")
+            except Exception as e_rm_close:
+                print(f"THREAD[{rig_id}]: RM close error: {e_rm_close}")
+
+        # --- Update final status in DB (after the writer has drained the queue) ---
+        print(f"THREAD[{rig_id}]: Updating final status: {final_status}")
+        final_values = {'status_text': final_status, 'is_running': '0', 'remaining_time': '0',
+                        'plot_ready': '1' if final_status == "Finished" else '0'}
+        if error_msg: final_values['last_error'] = error_msg
+        sample_writer.close(final_values)
+
+        # --- Record the run in the catalog (settings + the writer's streaming statistics; no file rescan) ---
+        catalog_file = run_filename if run_filename and os.path.exists(run_filename) else final_filename
+        if os.path.exists(catalog_file):
+            try:
+                stat = os.stat(catalog_file); entry = summary_from_online_stats(sample_writer.stats.snapshot())
+                entry.update({'run_name': os.path.splitext(os.path.basename(catalog_file))[0], 'file_name': os.path.basename(catalog_file),
+                              'file_mtime_ns': stat.st_mtime_ns, 'file_size': stat.st_size})
+                entry.update({'set_voltage': voltage, 'set_current_limit': current_limit, 'set_duration_s': duration,
+                              'psu_idn': psu_idn, 'final_status': final_status})
+                record_run(entry, CATALOG_DB_FILE); print(f"THREAD[{rig_id}]: Run recorded in catalog: {entry['run_name']}")
+            except Exception as e_catalog: print(f"THREAD[{rig_id}]: Catalog error: {e_catalog}")
+        print(f"THREAD[{rig_id}]: Finished. Samples written: {sample_writer.written_samples}, dropped: {sample_writer.dropped_samples}, delayed: {sample_writer.delayed_samples}")
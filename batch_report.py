@@ -0,0 +1,70 @@
+"""Headless batch analysis of the run archive, e.g. for nightly reports (no browser needed).
+
+Brings the run catalog up to date first: only run files that are new or changed since the last
+invocation are parsed, in parallel worker processes, with the same parsing and statistics as
+the archive page (run_catalog.summarize_run_file). Then writes one summary row per run in the
+archive, with battery-life estimates, to a CSV or JSON file.
+
+Usage:
+    python batch_report.py --capacity-mah 300
+    python batch_report.py --csv-dir csv --db Database/VoltRunner.db --out reports/summary.json --workers 8 --force
+"""
+import argparse
+import concurrent.futures
+import os
+import time
+
+import pandas as pd
+
+from online_stats import battery_life_hours
+from run_catalog import DEFAULT_CSV_DIR, DEFAULT_DB_FILE, backfill_catalog, find_run_files, list_runs
+
+DEFAULT_REPORT_FILE = "reports/run_summary.csv"
+HOURS_PER_DAY = 24
+
+
+def build_report(csv_dir=DEFAULT_CSV_DIR, db_file=DEFAULT_DB_FILE, capacity_mah=None):
+    """Catalog rows of the runs currently in csv_dir. With capacity_mah, the battery columns are
+    re-estimated at that capacity instead of the one each run was recorded with."""
+    runs = list_runs(db_file)
+    runs = runs[runs['run_name'].isin(find_run_files(csv_dir).keys())].copy() # Runs whose files were deleted are left out
+    if capacity_mah:
+        runs['battery_capacity_mah'] = capacity_mah
+        runs['battery_life_h'] = [battery_life_hours(capacity_mah, charge, duration) if pd.notna(charge) and pd.notna(duration) else None
+                                  for charge, duration in zip(runs['charge_mah'], runs['duration_s'])]
+    runs['battery_life_days'] = pd.to_numeric(runs['battery_life_h'], errors='coerce') / HOURS_PER_DAY
+    return runs
+
+
+def write_report(report, path):
+    """Writes the report as JSON (records) if path ends in .json, otherwise CSV; atomically."""
+    if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + '.tmp'
+    if path.endswith('.json'): report.to_json(temp_path, orient='records', indent=1)
+    else: report.to_csv(temp_path, index=False)
+    os.replace(temp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize every run in the VOLT/RUNNER archive into one report file.")
+    parser.add_argument('--csv-dir', default=DEFAULT_CSV_DIR); parser.add_argument('--db', default=DEFAULT_DB_FILE)
+    parser.add_argument('--out', default=DEFAULT_REPORT_FILE, help="Report file (.csv or .json).")
+    parser.add_argument('--capacity-mah', type=float, help="Battery capacity for the battery-life estimates.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Parallel worker processes (1: parse in-process).")
+    parser.add_argument('--force', action='store_true', help="Re-parse every run file, not only new or changed ones.")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(args.workers) as executor:
+            updated, skipped, failed = backfill_catalog(args.csv_dir, args.db, executor, args.force)
+    else: updated, skipped, failed = backfill_catalog(args.csv_dir, args.db, force=args.force)
+    print(f"Catalog: {updated} updated, {skipped} unchanged, {failed} failed ({time.perf_counter() - started:.1f} s).")
+    report = build_report(args.csv_dir, args.db, args.capacity_mah)
+    write_report(report, args.out)
+    print(f"Report: {len(report)} runs written to {args.out}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,145 @@
+"""Acquisition benchmarks against the simulated instruments (no hardware needed).
+
+Runs run_measurement_test_db() on sim:// ports for every combination of sample interval,
+acquisition mode and duration, inside a scratch directory (its own Database/ and csv/), and
+reports:
+- achieved sample rate and timing jitter, from the Elapsed Time column of the written CSV,
+  plus the loop's overrun count (per-stage timings are in each run's .metrics.json, see --keep);
+- UI read latency: get_all_status() + get_live_data_since(), polled like the Measurement page
+  while the run is writing;
+- writer throughput: rows/s that one SampleWriter drains to CSV + DB (optionally + .vrun).
+
+Usage:
+    python benchmarks/bench_acquisition.py
+    python benchmarks/bench_acquisition.py --intervals 1 0.1 0.05 --durations 10 60 --latency-ms 8 --json bench.json
+    python benchmarks/bench_acquisition.py --modes "Buffered (meter log)" --intervals 0.01 0.002 --baud 115200
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Repo root
+
+from acquisition import ACQ_MODE_BUFFERED, ACQ_MODE_HIGH_RATE, ACQ_MODE_STANDARD, SampleWriter, run_measurement_test_db
+from live_db import DB_FILE, ensure_rig_status, get_all_status, get_live_data_since, init_db
+from run_catalog import init_catalog
+
+DEFAULT_INTERVALS = [1.0, 0.2, 0.05]
+DEFAULT_DURATIONS = [10]
+DEFAULT_MODES = [ACQ_MODE_STANDARD, ACQ_MODE_HIGH_RATE, ACQ_MODE_BUFFERED]
+UI_POLL_INTERVAL_SEC = 0.25
+WRITER_BENCH_SAMPLES = 50000
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if len(values) else float('nan')
+
+
+def run_case(interval, mode, duration, sim_options, case_number):
+    """One full acquisition run; returns a dict of rate/jitter/UI latency results."""
+    rig_id = f"bench-{case_number}"
+    port = f"sim://{rig_id}?{urllib.parse.urlencode(sim_options)}"
+    ensure_rig_status(rig_id)
+    stop_event = threading.Event()
+    worker = threading.Thread(target=run_measurement_test_db, args=(port, port, 3.7, 1.0, duration, stop_event),
+                              kwargs={'sample_interval': interval, 'acq_mode': mode, 'rig_id': rig_id}, daemon=True)
+    worker.start()
+    ui_latencies = []; last_id = 0
+    while worker.is_alive():
+        started = time.perf_counter()
+        live_run_id = get_all_status().get(rig_id, {}).get('live_run_id'); _, last_id = get_live_data_since(live_run_id, last_id)
+        ui_latencies.append(time.perf_counter() - started)
+        time.sleep(UI_POLL_INTERVAL_SEC)
+    worker.join()
+
+    status = get_all_status().get(rig_id, {})
+    csv_file = status.get('current_csv_filename', '')
+    df = pd.read_csv(csv_file) if csv_file and os.path.exists(csv_file) else pd.DataFrame({'Elapsed Time (s)': []})
+    elapsed = df['Elapsed Time (s)'].to_numpy(dtype='float64')
+    intervals = np.diff(elapsed); deviations = np.abs(intervals - interval)
+    span = elapsed[-1] - elapsed[0] if len(elapsed) > 1 else float('nan')
+    return {'interval_s': interval, 'mode': mode, 'duration_s': duration, 'status': status.get('status_text'),
+            'samples': int(len(elapsed)), 'target_rate_hz': 1 / interval,
+            'achieved_rate_hz': (len(elapsed) - 1) / span if len(elapsed) > 1 else float('nan'),
+            'mean_interval_ms': float(intervals.mean() * 1000) if len(intervals) else float('nan'),
+            'jitter_std_ms': float(intervals.std() * 1000) if len(intervals) else float('nan'),
+            'jitter_p99_ms': percentile(deviations, 99) * 1000, 'jitter_max_ms': float(deviations.max() * 1000) if len(deviations) else float('nan'),
+            'missed_responses': int(status.get('missed_responses', 0)), 'overruns': int(status.get('overruns', 0)), 'dropped_samples': int(status.get('dropped_samples', 0)),
+            'ui_read_p50_ms': percentile(ui_latencies, 50) * 1000, 'ui_read_p95_ms': percentile(ui_latencies, 95) * 1000,
+            'ui_read_max_ms': max(ui_latencies, default=float('nan')) * 1000}
+
+
+def bench_writer(n_samples, write_binary):
+    """Pushes n_samples synthetic samples through one SampleWriter; returns rows/s to CSV + DB."""
+    rig_id = f"writer-{'vrun' if write_binary else 'csv'}"
+    csv_file = os.path.join('csv', f"{rig_id}.csv"); run_file = os.path.join('csv', f"{rig_id}.vrun") if write_binary else None
+    writer = SampleWriter(rig_id, csv_file, run_file, queue_size=n_samples + 1); writer.start(); writer.open_csv()
+    started = time.perf_counter(); now = time.time()
+    for i in range(n_samples): writer.put_sample(now + i * 0.01, i * 0.01, [3.7, 0.1, 0.37, i * 1e-6])
+    writer.close({'status_text': 'Finished'})
+    seconds = time.perf_counter() - started
+    return {'writer': 'CSV + DB + .vrun' if write_binary else 'CSV + DB', 'samples': writer.written_samples,
+            'seconds': seconds, 'rows_per_s': writer.written_samples / seconds}
+
+
+def print_table(rows, columns):
+    widths = [max(len(col), *(len(format_cell(row[col])) for row in rows)) for col in columns]
+    print("  ".join(col.rjust(width) for col, width in zip(columns, widths)))
+    for row in rows: print("  ".join(format_cell(row[col]).rjust(width) for col, width in zip(columns, widths)))
+
+
+def format_cell(value):
+    return f"{value:.2f}" if isinstance(value, float) else str(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark acquisition against the simulated PSU/meter.")
+    parser.add_argument('--intervals', type=float, nargs='+', default=DEFAULT_INTERVALS, help="Sample intervals (s).")
+    parser.add_argument('--durations', type=float, nargs='+', default=DEFAULT_DURATIONS, help="Run durations (s).")
+    parser.add_argument('--modes', nargs='+', default=DEFAULT_MODES, choices=DEFAULT_MODES)
+    parser.add_argument('--latency-ms', type=float, default=5.0, help="Simulated meter response latency.")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="Probability that a meter query gets no response.")
+    parser.add_argument('--baud', type=float, default=0, help="Simulated meter link speed (0 = instant transfer); limits buffered block downloads.")
+    parser.add_argument('--writer-samples', type=int, default=WRITER_BENCH_SAMPLES)
+    parser.add_argument('--json', help="Also write the results to this JSON file.")
+    parser.add_argument('--keep', action='store_true', help="Keep the scratch directory.")
+    args = parser.parse_args(argv)
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    original_cwd = os.getcwd(); scratch = tempfile.mkdtemp(prefix='voltrunner-bench-')
+    os.chdir(scratch); os.makedirs('Database'); os.makedirs('csv')
+    try:
+        init_db(); init_catalog(DB_FILE)
+        sim_options = {'latency_ms': args.latency_ms, 'drop_rate': args.drop_rate, 'baud': args.baud}
+        cases = [(interval, mode, duration) for duration in args.durations for mode in args.modes for interval in args.intervals]
+        acquisition_results = []
+        for case_number, (interval, mode, duration) in enumerate(cases, 1):
+            print(f"[{case_number}/{len(cases)}] {mode}, {interval} s interval, {duration} s ...", flush=True)
+            acquisition_results.append(run_case(interval, mode, duration, sim_options, case_number))
+        writer_results = [bench_writer(args.writer_samples, write_binary) for write_binary in (False, True)]
+    finally:
+        os.chdir(original_cwd)
+        if args.keep: print(f"Scratch directory kept: {scratch}")
+        else: shutil.rmtree(scratch, ignore_errors=True)
+
+    print("\nAcquisition:")
+    print_table(acquisition_results, ['mode', 'interval_s', 'duration_s', 'samples', 'target_rate_hz', 'achieved_rate_hz',
+                                      'jitter_std_ms', 'jitter_p99_ms', 'missed_responses', 'overruns', 'ui_read_p50_ms', 'ui_read_p95_ms'])
+    print("\nSample writer:")
+    print_table(writer_results, ['writer', 'samples', 'seconds', 'rows_per_s'])
+    if json_path:
+        with open(json_path, 'w') as json_file: json.dump({'acquisition': acquisition_results, 'writer': writer_results}, json_file, indent=2)
+        print(f"\nResults written to {json_path}")
+
+
+if __name__ == '__main__':
+    main()
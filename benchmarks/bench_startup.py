@@ -0,0 +1,99 @@
+"""Page startup and rerun timing (no browser needed).
+
+For each page, a fresh Python process runs the page once with Streamlit's AppTest (cold start:
+imports, one-time initialization, first render), then reruns it --reruns times (the per-rerun
+floor every widget interaction and live refresh pays). Runs inside a scratch directory laid out
+like a deployment (csv/ and Database/ both in and next to the working directory, as the pages
+expect), with one small recorded run to display. Also lists which heavy modules got imported.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --pages Measurement --reruns 50 --json startup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = {'Home': 'Home.py', 'Measurement': os.path.join('pages', 'Measurement.py'), 'Recorded_Data': os.path.join('pages', 'Recorded_Data.py')}
+HEAVY_MODULES = ['matplotlib', 'pyvisa', 'scipy']
+DEFAULT_RERUNS = 20
+SAMPLE_RUN_ROWS = 3000
+
+
+def measure_page(page, reruns):
+    """Runs in the child process: cold run, then reruns of one page. Returns a result dict."""
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    streamlit_import_ms = (time.perf_counter() - started) * 1000
+    app = AppTest.from_file(os.path.join(REPO_ROOT, PAGES[page]), default_timeout=120)
+    started = time.perf_counter(); app.run(); cold_run_ms = (time.perf_counter() - started) * 1000
+    rerun_ms = []
+    for _ in range(reruns):
+        started = time.perf_counter(); app.run(); rerun_ms.append((time.perf_counter() - started) * 1000)
+    return {'page': page, 'streamlit_import_ms': streamlit_import_ms, 'cold_run_ms': cold_run_ms,
+            'rerun_p50_ms': float(np.percentile(rerun_ms, 50)) if rerun_ms else float('nan'),
+            'rerun_p95_ms': float(np.percentile(rerun_ms, 95)) if rerun_ms else float('nan'),
+            'rerun_max_ms': max(rerun_ms, default=float('nan')), 'exceptions': len(app.exception),
+            'heavy_imports': ','.join(module for module in HEAVY_MODULES if module in sys.modules) or '-'}
+
+
+def write_sample_run(csv_dir):
+    """One small recorded run in the CSV format the acquisition writes."""
+    t = np.arange(SAMPLE_RUN_ROWS) * 1.0
+    timestamps = np.datetime64('2025-01-01T10:00:00.000') + (t * 1000).astype('timedelta64[ms]')
+    current = 0.1 + 0.01 * np.sin(t / 50)
+    with open(os.path.join(csv_dir, 'PSU_Meter_Test_20250101_100000_bench.csv'), 'w') as csv_file:
+        csv_file.write("Timestamp,Elapsed Time (s),Voltage (V),Current (A),Power (W),Energy (Wh)\n")
+        for stamp, elapsed, amps in zip(timestamps, t, current):
+            csv_file.write(f"{str(stamp).replace('T', ' ')},{elapsed:.3f},3.7,{amps:.5f},{3.7 * amps:.5f},{3.7 * amps * elapsed / 3600:.6f}\n")
+
+
+def print_table(rows, columns):
+    cells = [[f"{row[col]:.1f}" if isinstance(row[col], float) else str(row[col]) for col in columns] for row in rows]
+    widths = [max(len(col), *(len(line[i]) for line in cells)) for i, col in enumerate(columns)]
+    print("  ".join(col.rjust(width) for col, width in zip(columns, widths)))
+    for line in cells: print("  ".join(cell.rjust(width) for cell, width in zip(line, widths)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold start and rerun time of the VOLT/RUNNER pages.")
+    parser.add_argument('--pages', nargs='+', default=list(PAGES), choices=list(PAGES))
+    parser.add_argument('--reruns', type=int, default=DEFAULT_RERUNS)
+    parser.add_argument('--json', help="Also write the results to this JSON file.")
+    parser.add_argument('--child', help=argparse.SUPPRESS) # Internal: measure this page in this process
+    args = parser.parse_args(argv)
+    if args.child:
+        sys.path.insert(0, REPO_ROOT); print(json.dumps(measure_page(args.child, args.reruns))); return
+
+    scratch = tempfile.mkdtemp(prefix='voltrunner-startup-'); app_dir = os.path.join(scratch, 'app')
+    for directory in (os.path.join(scratch, 'csv'), os.path.join(scratch, 'Database'), os.path.join(app_dir, 'csv'), os.path.join(app_dir, 'Database')):
+        os.makedirs(directory)
+    write_sample_run(os.path.join(scratch, 'csv'))
+    results = []
+    try:
+        for page in args.pages:
+            print(f"{page} ...", flush=True)
+            child = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', page, '--reruns', str(args.reruns)],
+                                   cwd=app_dir, capture_output=True, text=True, env=dict(os.environ, PYTHONPATH=REPO_ROOT))
+            lines = [line for line in child.stdout.splitlines() if line.startswith('{')]
+            if child.returncode or not lines: print(child.stderr[-2000:]); raise SystemExit(f"Measuring {page} failed")
+            results.append(json.loads(lines[-1]))
+    finally: shutil.rmtree(scratch, ignore_errors=True)
+
+    print()
+    print_table(results, ['page', 'streamlit_import_ms', 'cold_run_ms', 'rerun_p50_ms', 'rerun_p95_ms', 'rerun_max_ms', 'exceptions', 'heavy_imports'])
+    if args.json:
+        with open(args.json, 'w') as json_file: json.dump(results, json_file, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
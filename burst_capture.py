@@ -0,0 +1,138 @@
+"""Triggered burst capture for transient events (inrush, brown-out sags, current spikes).
+
+With burst capture on, the acquisition loop samples at the fast burst interval all the time,
+but only one sample per sample interval goes to the normal (baseline) log. Every fast sample
+goes through a pre-trigger ring buffer and is checked against the triggers; when one fires,
+the ring's contents, the trigger sample and the following post-trigger samples become one
+event. Completed events are handed to the sample writer thread, which encodes them with
+EventFileWriter into '<run>.events.jsonl' next to the run's CSV, so a long event never
+stalls sampling right after a transient.
+
+Trigger specs (comma-separated, units V / A / W, rates per second):
+    current>0.5        threshold
+    voltage<3.3        threshold
+    d(current)>2       rate of change (A/s)
+Triggers are edge-sensitive: a condition has to clear before it can fire again.
+"""
+import collections
+import json
+import os
+import re
+
+EVENTS_FILE_SUFFIX = ".events.jsonl"
+DEFAULT_BURST_INTERVAL_SEC = 0.05
+DEFAULT_PRE_TRIGGER_SEC = 1.0
+DEFAULT_POST_TRIGGER_SEC = 2.0
+MAX_EVENTS_PER_RUN = 1000 # Later triggers are only counted, so a noisy trigger can't fill the disk
+TRIGGER_CHANNELS = {'voltage': 0, 'current': 1, 'power': 2} # Positions in the meter values [V, I, P, E]
+TRIGGER_PATTERN = re.compile(r"^(?:d\((?P<rate_channel>\w+)\)|(?P<channel>\w+))\s*(?P<op>[<>])\s*(?P<threshold>[-+0-9.eE]+)$")
+
+
+def events_filename_for(csv_filename):
+    return os.path.splitext(csv_filename)[0] + EVENTS_FILE_SUFFIX
+
+
+class Trigger:
+    """One threshold or rate-of-change condition on a channel."""
+    def __init__(self, channel, op, threshold, rate=False):
+        if channel not in TRIGGER_CHANNELS: raise ValueError(f"Unknown trigger channel '{channel}' (use {', '.join(TRIGGER_CHANNELS)})")
+        self.channel = channel; self.op = op; self.threshold = threshold; self.rate = rate
+        self.active = False # Condition held at the previous sample (edge detection)
+
+    def __str__(self):
+        return f"{'d(' + self.channel + ')' if self.rate else self.channel}{self.op}{self.threshold:g}"
+
+    def value(self, previous, sample):
+        """The monitored quantity at sample (rate against the previous sample), or None if unknown."""
+        value = channel_value(sample[2], self.channel)
+        if not self.rate or value is None: return value
+        if previous is None: return None
+        previous_value = channel_value(previous[2], self.channel); dt = sample[1] - previous[1]
+        return (value - previous_value) / dt if previous_value is not None and dt > 0 else None
+
+    def check(self, previous, sample):
+        """Returns the monitored value if the condition just became true, else None.
+        An unknown value (error sample) leaves the edge state as it was, so a dropout can't re-arm the trigger."""
+        value = self.value(previous, sample)
+        if value is None: return None
+        held = value > self.threshold if self.op == '>' else value < self.threshold
+        fired = held and not self.active; self.active = held
+        return value if fired else None
+
+
+def channel_value(values, channel):
+    if values is None: return None
+    if channel == 'power' and values[2] is None and values[0] is not None and values[1] is not None: return values[0] * values[1]
+    return values[TRIGGER_CHANNELS[channel]]
+
+
+def parse_triggers(text):
+    """Parses comma-separated trigger specs (see module docstring) into Triggers. Raises ValueError."""
+    triggers = []
+    for spec in filter(None, (part.strip().lower().replace(' ', '') for part in (text or '').split(','))):
+        match = TRIGGER_PATTERN.match(spec)
+        if not match: raise ValueError(f"Invalid trigger '{spec}' (e.g. current>0.5, voltage<3.3, d(current)>2)")
+        try: threshold = float(match['threshold'])
+        except ValueError: raise ValueError(f"Invalid trigger threshold in '{spec}'") from None
+        triggers.append(Trigger(match['rate_channel'] or match['channel'], match['op'], threshold, rate=bool(match['rate_channel'])))
+    return triggers
+
+
+class BurstCapture:
+    """Pre/post-trigger ring buffer over the fast sample stream. Each completed event is passed to emit(event)
+    on the acquisition thread, so emit should only queue it (SampleWriter.put_event)."""
+    def __init__(self, triggers, emit, pre_samples, post_samples, max_events=MAX_EVENTS_PER_RUN):
+        self.triggers = triggers; self.emit = emit
+        self.post_samples = post_samples; self.max_events = max_events
+        self.ring = collections.deque(maxlen=pre_samples) # (epoch, elapsed, values) before the trigger
+        self.previous = None; self.event = None; self.post_remaining = 0
+        self.event_count = 0; self.suppressed = 0
+
+    def add(self, epoch, elapsed_seconds, values):
+        """Adds one fast sample (values None for an error). Returns the new event's trigger text if one fired."""
+        sample = (epoch, elapsed_seconds, values); fired = None; started = None
+        for trigger in self.triggers: # Every trigger is evaluated so edge states stay current
+            value = trigger.check(self.previous, sample)
+            if value is not None and fired is None: fired = (trigger, value)
+        if self.event is not None:
+            self.event['rows'].append(sample); self.post_remaining -= 1
+            if fired: self.event['retriggers'] += 1
+            if self.post_remaining <= 0: self.finish_event()
+        elif fired:
+            if self.event_count >= self.max_events: self.suppressed += 1
+            else: self.start_event(*fired, sample); started = str(fired[0])
+        self.ring.append(sample)
+        if values is not None: self.previous = sample
+        return started
+
+    def start_event(self, trigger, value, sample):
+        self.event_count += 1; self.post_remaining = self.post_samples
+        self.event = {'event': self.event_count, 'trigger': str(trigger), 'value': value, 'trigger_epoch': sample[0],
+                      'trigger_elapsed_s': sample[1], 'pre_samples': len(self.ring), 'retriggers': 0,
+                      'rows': list(self.ring) + [sample]}
+        if self.post_remaining <= 0: self.finish_event()
+
+    def finish_event(self, truncated=False):
+        event = self.event; self.event = None
+        event['post_samples'] = len(event['rows']) - event['pre_samples'] - 1; event['truncated'] = truncated
+        self.emit(event)
+
+    def close(self):
+        """Emits an event still collecting post-trigger samples, marked truncated."""
+        if self.event is not None: self.finish_event(truncated=True)
+
+
+class EventFileWriter:
+    """Appends emitted events as JSON lines to events_filename (opened on the first event). Runs on the writer thread."""
+    def __init__(self, events_filename, value_columns):
+        self.events_filename = events_filename; self.value_columns = value_columns; self.events_file = None
+
+    def write(self, event):
+        event = dict(event, columns=['Epoch Time (s)', 'Elapsed Time (s)'] + self.value_columns)
+        event['rows'] = [[epoch, elapsed] + (list(values) if values is not None else [None] * len(self.value_columns))
+                         for epoch, elapsed, values in event['rows']]
+        if self.events_file is None: self.events_file = open(self.events_filename, 'a')
+        self.events_file.write(json.dumps(event) + '\n'); self.events_file.flush()
+
+    def close(self):
+        if self.events_file is not None: self.events_file.close(); self.events_file = None
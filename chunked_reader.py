@@ -0,0 +1,120 @@
+"""Out-of-core, single-pass analysis of run files too large to load whole.
+
+A run is read in fixed-size chunks: CSVs with only the needed columns as float32 (pandas'
+chunked reader), .vrun files as slices of their memory-mapped columns. Each chunk updates
+the window statistics and a streaming min/max downsampler, then is dropped, so peak memory
+depends on the chunk size and plot width, not on the length of the run. The results have
+the same shape as rollups.window_stats and the plot series the archive page draws.
+"""
+import numpy as np
+import pandas as pd
+
+from downsample import bucket_argminmax
+from run_format import RUN_FILE_EXTENSION, TIME_COLUMN, open_run
+
+CHUNK_ROWS = 1_000_000
+CSV_TIME_COLUMN = 'Timestamp'
+SCAN_CHANNELS = {'Voltage (V)': ('Voltage (V)', 1), 'Current (mA)': ('Current (A)', 1000), 'Power (mW)': ('Power (W)', 1000)}
+CSV_NA_VALUES = ['N/A', 'ERROR']
+
+
+def iter_run_chunks(filepath, chunk_rows=CHUNK_ROWS, columns=None):
+    """Yields (local timestamps as int64 ns, {column: float32 array}) for consecutive chunks of a CSV or .vrun."""
+    columns = columns or sorted({source for source, _ in SCAN_CHANNELS.values()})
+    if filepath.endswith(RUN_FILE_EXTENSION):
+        header, arrays = open_run(filepath); epoch = arrays[TIME_COLUMN]
+        for lo in range(0, len(epoch), chunk_rows):
+            t_ns = pd.to_datetime(epoch[lo:lo + chunk_rows] + header['utc_offset_sec'], unit='s').to_numpy().astype('datetime64[ns]').view('int64')
+            yield t_ns, {column: np.asarray(arrays[column][lo:lo + chunk_rows], dtype='float32') for column in columns}
+        return
+    reader = pd.read_csv(filepath, usecols=[CSV_TIME_COLUMN] + columns, dtype={column: 'float32' for column in columns},
+                         na_values=CSV_NA_VALUES, chunksize=chunk_rows)
+    with reader:
+        for chunk in reader:
+            t_ns = pd.to_datetime(chunk[CSV_TIME_COLUMN], format='ISO8601').to_numpy().astype('datetime64[ns]').view('int64')
+            yield t_ns, {column: chunk[column].to_numpy() for column in columns}
+
+
+class MinMaxDecimator:
+    """Streaming min/max downsampling of one channel to at most ~2*n_buckets points, in O(n_buckets) memory.
+
+    Buckets hold bucket_size consecutive samples (min and max, with their times). When adding a
+    chunk would exceed n_buckets buckets, neighbouring buckets are merged and bucket_size doubles,
+    so every peak and dip of the whole run survives, like downsample.minmax_indices."""
+    def __init__(self, n_buckets):
+        self.n_buckets = n_buckets; self.bucket_size = 1
+        self.min_t = np.zeros(0, 'int64'); self.min_v = np.zeros(0, 'float32')
+        self.max_t = np.zeros(0, 'int64'); self.max_v = np.zeros(0, 'float32')
+        self.pending_t = np.zeros(0, 'int64'); self.pending_v = np.zeros(0, 'float32') # Samples of the unfinished bucket
+
+    def update(self, t_ns, values):
+        t_ns = np.concatenate([self.pending_t, t_ns]); values = np.concatenate([self.pending_v, values])
+        while len(self.min_v) + len(values) // self.bucket_size > self.n_buckets: self.merge_pairs()
+        full = len(values) // self.bucket_size * self.bucket_size
+        if full: self.append_buckets(*bucket_minmax(t_ns[:full], values[:full], self.bucket_size))
+        self.pending_t = t_ns[full:]; self.pending_v = values[full:]
+
+    def append_buckets(self, min_t, min_v, max_t, max_v):
+        self.min_t = np.concatenate([self.min_t, min_t]); self.min_v = np.concatenate([self.min_v, min_v])
+        self.max_t = np.concatenate([self.max_t, max_t]); self.max_v = np.concatenate([self.max_v, max_v])
+
+    def merge_pairs(self):
+        n = len(self.min_v) // 2 * 2; a = slice(0, n, 2); b = slice(1, n, 2) # An odd last bucket stays as is
+        take_b = (self.min_v[b] < self.min_v[a]) | np.isnan(self.min_v[a])
+        self.min_t = np.concatenate([np.where(take_b, self.min_t[b], self.min_t[a]), self.min_t[n:]])
+        self.min_v = np.concatenate([np.where(take_b, self.min_v[b], self.min_v[a]), self.min_v[n:]])
+        take_b = (self.max_v[b] > self.max_v[a]) | np.isnan(self.max_v[a])
+        self.max_t = np.concatenate([np.where(take_b, self.max_t[b], self.max_t[a]), self.max_t[n:]])
+        self.max_v = np.concatenate([np.where(take_b, self.max_v[b], self.max_v[a]), self.max_v[n:]])
+        self.bucket_size *= 2
+
+    def series(self):
+        """The downsampled points (time order) as a float64 Series with a Timestamp index."""
+        min_t, min_v, max_t, max_v = self.min_t, self.min_v, self.max_t, self.max_v
+        if len(self.pending_v):
+            last = bucket_minmax(self.pending_t, self.pending_v, len(self.pending_v))
+            min_t, min_v, max_t, max_v = (np.concatenate([kept, new]) for kept, new in zip((min_t, min_v, max_t, max_v), last))
+        times = np.concatenate([min_t, max_t]); values = np.concatenate([min_v, max_v]).astype('float64')
+        order = np.argsort(times, kind='stable'); times = times[order]; values = values[order]
+        keep = np.ones(len(times), dtype=bool); keep[1:] = times[1:] != times[:-1] # One-sample buckets: min == max
+        return pd.Series(values[keep], index=pd.to_datetime(times[keep]))
+
+
+def bucket_minmax(t_ns, values, bucket_size):
+    """(min_t, min_v, max_t, max_v) of consecutive bucket_size-sample buckets; NaN only for all-NaN buckets."""
+    argmin, argmax = bucket_argminmax(values, bucket_size)
+    return t_ns[argmin], values[argmin], t_ns[argmax], values[argmax]
+
+
+def scan_run_file(filepath, start_offset=None, end_offset=None, n_buckets=1200, chunk_rows=CHUNK_ROWS):
+    """One chunked pass over a run: min/max/mean/sum/count and min/max plot series of each channel
+    (V, mA, mW) within [first sample + start_offset, first sample + end_offset] (pd.Timedelta; None = run start/end).
+    Returns {'stats': {channel: {...}}, 'plot': {channel: Series}, 'rows': rows in the window, 'start', 'end'}."""
+    totals = {channel: {'min': np.inf, 'max': -np.inf, 'sum': 0.0, 'count': 0} for channel in SCAN_CHANNELS}
+    decimators = {channel: MinMaxDecimator(n_buckets) for channel in SCAN_CHANNELS}
+    start_ns = end_ns = None; rows = 0; first_ns = last_ns = None
+    for t_ns, columns in iter_run_chunks(filepath, chunk_rows):
+        if not len(t_ns): continue
+        if start_ns is None: # Window bounds are relative to the run's first sample
+            start_ns = t_ns[0] + (pd.Timedelta(start_offset).value if start_offset is not None else 0)
+            end_ns = t_ns[0] + pd.Timedelta(end_offset).value if end_offset is not None else np.iinfo('int64').max
+        if t_ns[0] > end_ns: break # Past the window; runs are recorded in time order
+        in_window = (t_ns >= start_ns) & (t_ns <= end_ns)
+        if not in_window.any(): continue
+        t_ns = t_ns[in_window]; rows += len(t_ns)
+        if first_ns is None: first_ns = t_ns.min()
+        last_ns = t_ns.max() if last_ns is None else max(last_ns, t_ns.max())
+        for channel, (source, scale) in SCAN_CHANNELS.items():
+            values = columns[source][in_window]
+            if scale != 1: values = values * np.float32(scale)
+            decimators[channel].update(t_ns, values)
+            valid = values[~np.isnan(values)]
+            if len(valid):
+                stats = totals[channel]
+                stats['min'] = min(stats['min'], float(valid.min())); stats['max'] = max(stats['max'], float(valid.max()))
+                stats['sum'] += float(valid.sum(dtype='float64')); stats['count'] += len(valid)
+    for stats in totals.values():
+        if stats['count'] == 0: stats['min'] = stats['max'] = stats['mean'] = np.nan
+        else: stats['mean'] = stats['sum'] / stats['count']
+    return {'stats': totals, 'plot': {channel: decimator.series() for channel, decimator in decimators.items()}, 'rows': rows,
+            'start': pd.Timestamp(first_ns) if first_ns is not None else None, 'end': pd.Timestamp(last_ns) if last_ns is not None else None}
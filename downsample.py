@@ -0,0 +1,48 @@
+"""Min/max downsampling for plots.
+
+Each series is split into equal-count buckets and only the minimum and maximum sample of
+every bucket is kept (in time order), so a plot gets about 2 points per pixel column while
+every peak and dip survives. Apply it after selecting the time window so zooming in
+recomputes the buckets at full detail for the visible range.
+"""
+import numpy as np
+
+DEFAULT_DPI = 100 # matplotlib's default figure.dpi
+
+
+def buckets_for_width(width_inches, dpi=DEFAULT_DPI):
+    """Number of buckets (one per horizontal pixel) for a figure of the given width."""
+    return max(1, int(width_inches * dpi))
+
+
+def bucket_argminmax(values, bucket_size):
+    """Positions of the min and max of each consecutive bucket_size-sample bucket (len(values) must be a multiple
+    of bucket_size). NaNs never win a bucket unless the whole bucket is NaN."""
+    rows = values.reshape(-1, bucket_size); nan_mask = np.isnan(rows)
+    offsets = np.arange(rows.shape[0]) * bucket_size
+    argmin = np.where(nan_mask, np.inf, rows).argmin(axis=1) + offsets
+    argmax = np.where(nan_mask, -np.inf, rows).argmax(axis=1) + offsets
+    return argmin, argmax
+
+
+def minmax_indices(values, n_buckets):
+    """Returns sorted positions of the min and max of each bucket (all positions if already small).
+    NaNs never win a bucket unless the whole bucket is NaN, so gaps stay visible."""
+    values = np.asarray(values, dtype='float64'); n = len(values)
+    if n <= 2 * n_buckets: return np.arange(n)
+    bucket_size = -(-n // n_buckets) # ceil
+    padded = np.full(bucket_size * -(-n // bucket_size), np.nan); padded[:n] = values
+    positions = np.union1d(*bucket_argminmax(padded, bucket_size))
+    return positions[positions < n]
+
+
+def downsample_series(series, n_buckets):
+    """Min/max-downsamples a pandas Series (keeps its index)."""
+    return series.iloc[minmax_indices(series.to_numpy(), n_buckets)]
+
+
+def downsample_frame(df, columns, n_buckets):
+    """Downsamples several columns at once, keeping the union of each column's min/max rows."""
+    if len(df) <= 2 * n_buckets: return df
+    positions = np.unique(np.concatenate([minmax_indices(df[col].to_numpy(), n_buckets) for col in columns]))
+    return df.iloc[positions]
@@ -0,0 +1,93 @@
+"""Concurrent instrument reads on an asyncio loop.
+
+pyvisa and pyserial calls block, so each device gets its own single worker thread: calls to
+one device stay in order, while reads from different devices (PSU readback, meter fetch)
+overlap. Every read has a per-device timeout, and a sample is abandoned as soon as the run's
+stop event is set. A blocking call cannot be interrupted, so a device whose previous read
+is still running is reported as busy instead of being queued behind it.
+"""
+import asyncio
+import concurrent.futures
+import time
+
+STOP_POLL_INTERVAL_SEC = 0.02 # How quickly a pending sample notices the stop event
+PSU_READBACK_TIMEOUT_SEC = 1.0
+PSU_READBACK_COMMANDS = ['MEAS:VOLT?', 'MEAS:CURR?']
+
+
+def read_line(port, deadline):
+    """Reads one response line from a serial port as text, waiting at most until the monotonic deadline.
+    Returns None on timeout (nothing received, or cut off mid-line)."""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0: return None
+    port.timeout = remaining # readline() returns early as soon as the newline arrives
+    line = port.readline()
+    if not line.endswith(b"\n"): return None
+    return line.decode('utf-8', errors='replace')
+
+
+class DeviceBusy(Exception):
+    """The device's previous (timed-out) call has not returned yet."""
+
+
+def read_psu_values(psu, metrics=None):
+    """Reads back the PSU output. Returns [voltage, current]."""
+    values = []
+    for command in PSU_READBACK_COMMANDS:
+        started = time.monotonic()
+        values.append(float(psu.query(command).strip()))
+        if metrics: metrics.record(f"psu {command}", time.monotonic() - started)
+    return values
+
+
+class AsyncDevice:
+    """One device's blocking read, run on the device's own worker thread."""
+    def __init__(self, name, read, timeout, metrics=None):
+        self.name = name; self.read_function = read; self.timeout = timeout; self.metrics = metrics
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"io-{name}")
+        self.in_flight = None
+
+    async def read(self):
+        if self.in_flight is not None and not self.in_flight.done(): raise DeviceBusy(f"{self.name} is still busy with its previous read")
+        started = time.monotonic()
+        self.in_flight = asyncio.get_running_loop().run_in_executor(self.executor, self.read_function)
+        try: return await asyncio.wait_for(asyncio.shield(self.in_flight), self.timeout) # Shield: the thread can't be cancelled anyway
+        finally:
+            if self.metrics: self.metrics.record(f"{self.name} read", time.monotonic() - started)
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True) # Waits for an in-flight call (bounded by the device timeouts)
+
+
+class ConcurrentSampler:
+    """Reads all devices concurrently once per sample.
+
+    reads maps a device name to (blocking read function, timeout in seconds). sample() returns
+    {name: value or exception} (asyncio.TimeoutError, DeviceBusy or the device's own error),
+    or None if the stop event was set before every device answered.
+    """
+    def __init__(self, reads, stop_event, metrics=None):
+        self.stop_event = stop_event; self.loop = asyncio.new_event_loop()
+        self.devices = {name: AsyncDevice(name, read, timeout, metrics) for name, (read, timeout) in reads.items()}
+
+    def sample(self):
+        return self.loop.run_until_complete(self.sample_or_stop())
+
+    async def sample_or_stop(self):
+        reads = asyncio.gather(*(device.read() for device in self.devices.values()), return_exceptions=True)
+        stop = asyncio.ensure_future(self.wait_for_stop())
+        done, _ = await asyncio.wait({reads, stop}, return_when=asyncio.FIRST_COMPLETED)
+        stop.cancel(); await asyncio.gather(stop, return_exceptions=True)
+        if reads not in done:
+            reads.cancel()
+            try: await reads
+            except asyncio.CancelledError: pass
+            return None
+        return dict(zip(self.devices, reads.result()))
+
+    async def wait_for_stop(self):
+        while not self.stop_event.is_set(): await asyncio.sleep(STOP_POLL_INTERVAL_SEC)
+
+    def close(self):
+        for device in self.devices.values(): device.close()
+        self.loop.close()
@@ -0,0 +1,220 @@
+"""Live-state database shared by the Measurement page and the acquisition workers.
+
+Status values are keyed by rig id, so several PSU/meter pairs can run at the same time.
+The worker side writes through one long-lived DbWriter per run; the UI reads a snapshot of
+every rig's status with a single query.
+
+Live samples are partitioned by run: each run gets its own live_run_<run_id> table, listed
+in live_runs, and the rig's 'live_run_id' status key points at it. Each table is a ring
+buffer holding the newest LIVE_RING_MAX_ROWS samples (the CSV keeps the full run). Old runs
+are removed by dropping their table (apply_live_retention), never by row-wise DELETE.
+
+Every write transaction also bumps a single change counter (change_seq), so viewers can
+poll get_change_seq() - one tiny read - and skip their refresh when nothing has changed.
+"""
+import contextlib
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+DB_FILE = "Database/VoltRunner.db"
+DEFAULT_RIG_ID = "Rig 1"
+DEFAULT_STATUS = {'is_running': '0', 'status_text': 'Idle', 'remaining_time': '0', 'last_error': '',
+                  'current_csv_filename': '', 'psu_idn': 'N/A', 'meter_port_name': 'N/A', 'plot_ready': '0',
+                  'missed_responses': '0', 'dropped_samples': '0', 'delayed_samples': '0',
+                  'overruns': '0', 'skipped_samples': '0', 'timing_metrics': '', 'live_run_id': '',
+                  'live_stats': '', 'burst_events': '0',
+                  'duration': '0', 'psu_port': '', 'meter_port': ''}
+LIVE_COLUMNS = ['Elapsed Time (s)', 'Voltage (V)', 'Current (A)']
+BUMP_CHANGE_SEQ_SQL = "UPDATE change_seq SET seq = seq + 1 WHERE id = 1"
+LIVE_RING_MAX_ROWS = 20000 # Newest samples kept per run table (hot live view)
+LIVE_RETENTION_RUNS_PER_RIG = 5 # Live tables kept per rig, newest first
+LIVE_RETENTION_MAX_AGE_SEC = 7 * 24 * 3600 # Older live tables are dropped (a rig's newest run is always kept)
+
+
+# --- Database Setup ---
+def init_db(db_file=DB_FILE):
+    """Initializes the SQLite database and tables if they don't exist."""
+    with contextlib.closing(sqlite3.connect(db_file)) as db:
+        db.execute("PRAGMA journal_mode=WAL") # Persistent: readers no longer block the worker's writes
+        with db: # Auto-commit/rollback context
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS rig_status (
+                    rig_id TEXT,
+                    key TEXT,
+                    value TEXT,
+                    PRIMARY KEY (rig_id, key)
+                )
+            ''')
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS live_runs (
+                    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    rig_id TEXT,
+                    run_name TEXT,
+                    started_at REAL,
+                    ended_at REAL,
+                    sample_count INTEGER DEFAULT 0
+                )
+            ''')
+            db.execute("DROP TABLE IF EXISTS live_measurements") # Shared live table of older versions; the CSVs hold the data
+            db.execute("DROP TABLE IF EXISTS status") # Single-rig status of older versions, replaced by rig_status
+            db.execute("CREATE TABLE IF NOT EXISTS change_seq (id INTEGER PRIMARY KEY CHECK (id = 1), seq INTEGER NOT NULL)")
+            db.execute("INSERT OR IGNORE INTO change_seq (id, seq) VALUES (1, 0)")
+
+
+def ensure_rig_status(rig_id, db_file=DB_FILE):
+    """Adds the default status keys for a rig that has none yet."""
+    with contextlib.closing(sqlite3.connect(db_file, timeout=10)) as db:
+        with db:
+            db.executemany("INSERT OR IGNORE INTO rig_status (rig_id, key, value) VALUES (?, ?, ?)",
+                           [(rig_id, key, value) for key, value in DEFAULT_STATUS.items()])
+            db.execute(BUMP_CHANGE_SEQ_SQL)
+
+
+def update_status(rig_id, key, value, db_file=DB_FILE):
+    """Updates a key-value pair in a rig's status."""
+    update_status_many(rig_id, {key: value}, db_file)
+
+
+def update_status_many(rig_id, values, db_file=DB_FILE):
+    """Updates several status keys of a rig in a single transaction."""
+    try:
+        with contextlib.closing(sqlite3.connect(db_file, timeout=10)) as db:
+            with db:
+                db.executemany("INSERT OR REPLACE INTO rig_status (rig_id, key, value) VALUES (?, ?, ?)",
+                               [(rig_id, key, str(value)) for key, value in values.items()])
+                db.execute(BUMP_CHANGE_SEQ_SQL)
+    except sqlite3.Error as e:
+        print(f"DB ERROR updating status {rig_id} {list(values)}: {e}")
+
+
+def get_all_status(db_file=DB_FILE):
+    """Gets a snapshot of every rig's status as {rig_id: {key: value}} with one query."""
+    snapshot = {}
+    try:
+        with contextlib.closing(sqlite3.connect(db_file, timeout=10)) as db:
+            for rig_id, key, value in db.execute("SELECT rig_id, key, value FROM rig_status"):
+                snapshot.setdefault(rig_id, dict(DEFAULT_STATUS))[key] = value
+    except sqlite3.Error as e: print(f"DB ERROR getting status snapshot: {e}")
+    return snapshot
+
+
+def get_change_seq(db_file=DB_FILE):
+    """Current value of the change counter; it increases with every status or live-data write."""
+    try:
+        with contextlib.closing(sqlite3.connect(db_file, timeout=10)) as db:
+            row = db.execute("SELECT seq FROM change_seq WHERE id = 1").fetchone()
+        return row[0] if row else -1
+    except sqlite3.Error as e: print(f"DB ERROR reading change counter: {e}"); return -1
+
+
+def live_table(run_id):
+    return f"live_run_{int(run_id)}"
+
+
+def start_live_run(db, rig_id, run_name):
+    """Registers a run and creates its live table on an open connection (inside a transaction). Returns the run id."""
+    cursor = db.execute("INSERT INTO live_runs (rig_id, run_name, started_at) VALUES (?, ?, ?)", (rig_id, run_name, time.time()))
+    run_id = cursor.lastrowid
+    db.execute(f"CREATE TABLE {live_table(run_id)} (id INTEGER PRIMARY KEY, elapsed_seconds REAL, voltage REAL, current REAL)")
+    return run_id
+
+
+def apply_live_retention(db_file=DB_FILE, runs_per_rig=LIVE_RETENTION_RUNS_PER_RIG, max_age_sec=LIVE_RETENTION_MAX_AGE_SEC):
+    """Drops the live tables of runs beyond the newest runs_per_rig per rig, or older than max_age_sec.
+    A rig's newest run is always kept. Returns the number of runs dropped."""
+    cutoff = time.time() - max_age_sec; dropped = 0
+    try:
+        with contextlib.closing(sqlite3.connect(db_file, timeout=10)) as db:
+            runs = db.execute("SELECT run_id, rig_id, COALESCE(ended_at, started_at) FROM live_runs ORDER BY run_id DESC").fetchall()
+            kept_per_rig = {}; expired = []
+            for run_id, rig_id, last_active in runs:
+                rank = kept_per_rig[rig_id] = kept_per_rig.get(rig_id, 0) + 1
+                if rank > 1 and (rank > runs_per_rig or last_active < cutoff): expired.append(run_id)
+            with db:
+                for run_id in expired:
+                    db.execute(f"DROP TABLE IF EXISTS {live_table(run_id)}") # Constant time, unlike DELETE of every row
+                    db.execute("DELETE FROM live_runs WHERE run_id = ?", (run_id,)); dropped += 1
+    except sqlite3.Error as e: print(f"DB ERROR applying live retention: {e}")
+    return dropped
+
+
+def empty_live_df():
+    """Returns an empty DataFrame with the live data columns."""
+    return pd.DataFrame({col: [] for col in LIVE_COLUMNS})
+
+
+def get_live_data_since(run_id, last_id, db_file=DB_FILE):
+    """Retrieves a run's live rows with id > last_id. Returns (DataFrame, new high-water-mark id)."""
+    df = empty_live_df(); new_last_id = last_id
+    if not run_id: return df, new_last_id
+    try:
+        with contextlib.closing(sqlite3.connect(db_file, timeout=10)) as db:
+             rows_df = pd.read_sql_query("SELECT id, elapsed_seconds as 'Elapsed Time (s)', voltage as 'Voltage (V)', current as 'Current (A)' "
+                                         f"FROM {live_table(run_id)} WHERE id > ? ORDER BY id ASC", db, params=(last_id,))
+        if not rows_df.empty:
+            new_last_id = int(rows_df['id'].iloc[-1])
+            df = rows_df.drop(columns=['id'])
+    except sqlite3.Error as e: print(f"DB ERROR reading live data: {e}")
+    except Exception as ex: print(f"Error converting live data to DataFrame: {ex}")
+    return df, new_last_id
+
+
+class DbWriter:
+    """Single long-lived WAL connection for one rig's run, owned by its sample writer thread.
+
+    Status updates and live samples are buffered in memory and committed together
+    in one transaction on flush(). With a run_name, the writer starts a new live run
+    (own table, 'live_run_id' status) and trims it to ring_max_rows after every flush.
+    """
+    def __init__(self, rig_id, db_file=DB_FILE, run_name=None, ring_max_rows=LIVE_RING_MAX_ROWS):
+        self.rig_id = rig_id; self.ring_max_rows = ring_max_rows
+        self.db = sqlite3.connect(db_file, timeout=10)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL") # Safe with WAL, avoids an fsync per commit
+        self.pending_status = {}; self.pending_samples = []
+        self.run_id = None; self.samples_written = 0 # Row ids of the run table are 1..samples_written
+        if run_name is not None:
+            with self.db: self.run_id = start_live_run(self.db, rig_id, run_name)
+            self.update_status('live_run_id', self.run_id)
+            apply_live_retention(db_file) # Each new run drops the live tables that fell out of the policy
+
+    def update_status(self, key, value):
+        self.pending_status[key] = str(value) # Only the latest value per key is written
+
+    def add_live_data(self, elapsed_seconds, voltage, current):
+        if self.run_id is not None: self.pending_samples.append((elapsed_seconds, voltage, current))
+
+    def add_live_block(self, elapsed_seconds, voltage, current):
+        """add_live_data() for arrays; rows with NaN voltage or current are skipped."""
+        if self.run_id is None: return
+        valid = ~(np.isnan(voltage) | np.isnan(current))
+        self.pending_samples.extend(zip(elapsed_seconds[valid].tolist(), voltage[valid].tolist(), current[valid].tolist()))
+
+    def flush(self):
+        """Commits all pending samples and status updates in one transaction."""
+        if not self.pending_status and not self.pending_samples: return
+        try:
+            with self.db:
+                if self.pending_samples:
+                    table = live_table(self.run_id)
+                    self.db.executemany(f"INSERT INTO {table} (elapsed_seconds, voltage, current) VALUES (?, ?, ?)", self.pending_samples)
+                    trim_through = self.samples_written + len(self.pending_samples) - self.ring_max_rows
+                    if trim_through > 0: self.db.execute(f"DELETE FROM {table} WHERE id <= ?", (trim_through,)) # Ring buffer: PK range, batch-sized
+                if self.pending_status:
+                    self.db.executemany("INSERT OR REPLACE INTO rig_status (rig_id, key, value) VALUES (?, ?, ?)",
+                                        [(self.rig_id, key, value) for key, value in self.pending_status.items()])
+                self.db.execute(BUMP_CHANGE_SEQ_SQL)
+            self.samples_written += len(self.pending_samples); self.pending_samples = []; self.pending_status = {}
+        except sqlite3.Error as e: print(f"DB ERROR flushing batch ({len(self.pending_samples)} samples): {e}") # Kept for retry
+
+    def close(self):
+        self.flush()
+        try:
+            if self.run_id is not None:
+                with self.db: self.db.execute("UPDATE live_runs SET ended_at = ?, sample_count = ? WHERE run_id = ?",
+                                              (time.time(), self.samples_written, self.run_id))
+            self.db.close()
+        except sqlite3.Error as e: print(f"DB ERROR closing writer: {e}")
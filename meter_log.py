@@ -0,0 +1,119 @@
+"""Meter-side buffered logging: the meter samples into its own memory, the host downloads blocks.
+
+In the polled modes every sample costs four :FETCh round trips, so the serial link and the
+host's scheduling set the sample rate, and a late host wakeup is a lost sample. In buffered
+mode the meter is told to log at a fixed interval on its own clock; the host only asks how
+many records are waiting and downloads them in blocks of up to LOG_BLOCK_RECORDS. A slow
+host just makes the next block longer, and each record keeps the meter's timestamp.
+
+The logging command set differs between meter firmwares and is not part of the subset the
+polled modes use, so the commands are templates in METER_LOG_COMMANDS. Override them per
+run (meter_log_commands=) or with a JSON file named METER_LOG_COMMANDS_FILE in the working
+directory, e.g. {"fetch": ":DATA:LOG? {start},{count}"}. Expected responses:
+    count  one integer, records logged since start
+    fetch  one line of comma-separated records t,V,I,P,E (t = meter seconds since start)
+A block that is missing, cut short or garbled is requested again on the next poll, so a
+transfer error delays records but never loses them.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+from instrument_io import read_line
+
+METER_LOG_COMMANDS = {'interval': ':LOG:INTerval {interval}', 'clear': ':LOG:CLEar', 'start': ':LOG:STARt',
+                      'stop': ':LOG:STOP', 'count': ':LOG:COUNt?', 'fetch': ':LOG:DATA? {start},{count}'}
+METER_LOG_COMMANDS_FILE = "meter_log_commands.json"
+LOG_RECORD_FIELDS = 5 # Meter time, V, I, P, E
+DEFAULT_LOG_INTERVAL_SEC = 0.01
+MIN_LOG_INTERVAL_SEC = 0.001
+LOG_BLOCK_RECORDS = 256 # ~10 kB per block: under a second at 115200 baud
+LOG_POLL_INTERVAL_SEC = 0.25 # Host asks for new records this often
+LOG_RESPONSE_TIMEOUT_SEC = 3.0 # Whole response of one count or fetch query
+
+
+def load_meter_log_commands(overrides=None, commands_file=METER_LOG_COMMANDS_FILE):
+    """METER_LOG_COMMANDS updated from commands_file (if it exists), then from overrides."""
+    commands = dict(METER_LOG_COMMANDS)
+    if commands_file and os.path.exists(commands_file):
+        with open(commands_file) as json_file: commands.update(json.load(json_file))
+    commands.update(overrides or {})
+    unknown = set(commands) - set(METER_LOG_COMMANDS)
+    if unknown: raise ValueError(f"Unknown meter log command(s): {', '.join(sorted(unknown))}")
+    return commands
+
+
+def parse_log_block(text, expected=None):
+    """Parses one fetch response into an (n, 5) float64 array [t, V, I, P, E]. Raises ValueError if it is
+    garbled, not a whole number of records, or (with expected) shorter or longer than requested."""
+    text = text.strip()
+    if not text: records = np.zeros((0, LOG_RECORD_FIELDS))
+    else:
+        flat = np.fromstring(text, dtype='float64', sep=',') # Raises ValueError on non-numeric data
+        if len(flat) % LOG_RECORD_FIELDS: raise ValueError(f"Log block has {len(flat)} values, not a multiple of {LOG_RECORD_FIELDS}")
+        records = flat.reshape(-1, LOG_RECORD_FIELDS)
+    if expected is not None and len(records) != expected: raise ValueError(f"Log block has {len(records)} records, expected {expected}")
+    return records
+
+
+class MeterLogReader:
+    """Starts/stops the meter's internal log and downloads its records in blocks, in order."""
+    def __init__(self, meter, commands=None, block_records=LOG_BLOCK_RECORDS, response_timeout=LOG_RESPONSE_TIMEOUT_SEC, metrics=None):
+        self.meter = meter; self.commands = load_meter_log_commands(commands); self.block_records = block_records
+        self.response_timeout = response_timeout; self.metrics = metrics
+        self.next_index = 0 # Records downloaded so far; the next block starts here
+        self.logged = 0 # Records the meter reported at the last count query
+        self.failed_blocks = 0
+
+    def send(self, name, **fields):
+        self.meter.write((self.commands[name].format(**fields) + "\n").encode('utf-8'))
+
+    def query(self, name, **fields):
+        """Sends a query command and returns its response line, or None on timeout."""
+        self.meter.reset_input_buffer(); sent_at = time.monotonic(); self.send(name, **fields)
+        response = read_line(self.meter, sent_at + self.response_timeout)
+        if self.metrics and response is not None: self.metrics.record(f"meter log {name}", time.monotonic() - sent_at)
+        return response
+
+    def start(self, interval):
+        """Clears the meter's log and starts logging every interval seconds. Call right before taking the host time anchor."""
+        self.send('stop'); self.send('clear'); self.send('interval', interval=interval); self.send('start')
+        self.next_index = 0; self.logged = 0
+
+    def stop(self):
+        self.send('stop')
+
+    def pending(self):
+        """Records logged but not downloaded yet, or None if the count query got no usable answer."""
+        response = self.query('count')
+        try: self.logged = int(float(response))
+        except (TypeError, ValueError): return None
+        return max(0, self.logged - self.next_index)
+
+    def fetch_block(self, count):
+        """Downloads the next count records (at most block_records). Returns the (n, 5) array,
+        or None if the block has to be requested again."""
+        count = min(count, self.block_records)
+        response = self.query('fetch', start=self.next_index, count=count)
+        try:
+            if response is None: raise ValueError("no response")
+            records = parse_log_block(response, expected=count)
+        except ValueError as e:
+            self.failed_blocks += 1
+            if self.metrics: self.metrics.increment('log block retries')
+            print(f"METER LOG: Block at record {self.next_index} failed ({e}), retrying")
+            return None
+        self.next_index += len(records)
+        return records
+
+    def download(self):
+        """Downloads the records waiting now, block by block. Returns one (n, 5) array (possibly empty);
+        stops early at a failed block, which the next call requests again."""
+        blocks = []; remaining = self.pending()
+        while remaining:
+            records = self.fetch_block(remaining)
+            if records is None: break
+            blocks.append(records); remaining -= len(records)
+        return np.concatenate(blocks) if blocks else np.zeros((0, LOG_RECORD_FIELDS))
@@ -0,0 +1,133 @@
+"""Streaming statistics for a run, updated once per sample in O(1).
+
+RunningStats keeps count/min/max/mean/variance with Welford's algorithm. LiveRunStats
+combines one per channel with trapezoidal integration of current (charge) and power
+(energy) over the elapsed time, and projects battery life from the time-weighted mean
+current. The sample writer feeds it while the run is recorded, so the live page and the
+catalog get the run's statistics without rescanning the data.
+"""
+import math
+
+import numpy as np
+
+SECONDS_PER_HOUR = 3600.0
+
+
+class RunningStats:
+    """Welford running min/max/mean/variance of one channel; None/NaN values are skipped."""
+    def __init__(self):
+        self.count = 0; self.mean = 0.0; self.m2 = 0.0; self.min = math.inf; self.max = -math.inf
+
+    def update(self, value):
+        if value is None or math.isnan(value): return
+        self.count += 1
+        delta = value - self.mean; self.mean += delta / self.count; self.m2 += delta * (value - self.mean)
+        if value < self.min: self.min = value
+        if value > self.max: self.max = value
+
+    def update_many(self, values):
+        """Adds an array of values at once (NaN skipped), merged with Chan's parallel update."""
+        values = np.asarray(values, dtype='float64'); values = values[~np.isnan(values)]
+        if not len(values): return
+        count = len(values); mean = float(values.mean()); m2 = float(((values - mean) ** 2).sum())
+        total = self.count + count; delta = mean - self.mean
+        self.m2 += m2 + delta * delta * self.count * count / total; self.mean += delta * count / total; self.count = total
+        self.min = min(self.min, float(values.min())); self.max = max(self.max, float(values.max()))
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else None # Sample variance, like pandas .var()
+
+    def as_dict(self):
+        if not self.count: return {'count': 0, 'min': None, 'max': None, 'mean': None, 'std': None}
+        variance = self.variance
+        return {'count': self.count, 'min': self.min, 'max': self.max, 'mean': self.mean,
+                'std': math.sqrt(variance) if variance is not None else None}
+
+
+class TrapezoidIntegrator:
+    """Integral of y over t (seconds), trapezoid between consecutive valid samples."""
+    def __init__(self):
+        self.total = 0.0; self.last_t = None; self.last_y = None
+
+    def update(self, t, y):
+        if y is None or math.isnan(y): return
+        if self.last_t is not None and t > self.last_t: self.total += (y + self.last_y) / 2 * (t - self.last_t)
+        self.last_t = t; self.last_y = y
+
+    def update_many(self, t, y):
+        """Adds arrays of samples at once; continues from the last sample of the previous call."""
+        t = np.asarray(t, dtype='float64'); y = np.asarray(y, dtype='float64')
+        valid = ~np.isnan(y); t = t[valid]; y = y[valid]
+        if not len(t): return
+        if self.last_t is not None: t = np.concatenate([[self.last_t], t]); y = np.concatenate([[self.last_y], y])
+        steps = np.diff(t); self.total += float(np.sum(((y[1:] + y[:-1]) / 2 * steps)[steps > 0]))
+        self.last_t = float(t[-1]); self.last_y = float(y[-1])
+
+
+def integrate_trapezoid(t, y):
+    """Vectorized equivalent of TrapezoidIntegrator for arrays; NaN samples are skipped."""
+    t = np.asarray(t, dtype='float64'); y = np.asarray(y, dtype='float64')
+    valid = ~(np.isnan(t) | np.isnan(y)); t = t[valid]; y = y[valid]
+    if len(t) < 2: return 0.0
+    return float(np.sum((y[1:] + y[:-1]) / 2 * np.diff(t)))
+
+
+def battery_life_hours(capacity_mah, charge_mah, elapsed_s):
+    """Projected battery life at the run's time-weighted mean current, or None if it can't be estimated."""
+    if not capacity_mah or elapsed_s <= 0 or charge_mah <= 0: return None
+    mean_current_ma = charge_mah / (elapsed_s / SECONDS_PER_HOUR)
+    return capacity_mah / mean_current_ma
+
+
+class LiveRunStats:
+    """Per-run channel statistics, charge/energy integrals and battery projection."""
+    CHANNELS = ('voltage', 'current', 'power')
+
+    def __init__(self, battery_capacity_mah=None):
+        self.battery_capacity_mah = battery_capacity_mah
+        self.channels = {channel: RunningStats() for channel in self.CHANNELS}
+        self.charge = TrapezoidIntegrator(); self.energy = TrapezoidIntegrator() # A*s and W*s
+        self.samples = 0; self.valid_samples = 0; self.meter_energy_wh = None
+        self.first_epoch = None; self.last_epoch = None; self.first_elapsed = None; self.last_elapsed = None
+
+    def update(self, epoch, elapsed_seconds, values):
+        """Adds one sample: values is [V, I, P, E] (entries may be None) or None for an error row. A missing power
+        stays missing (not V*I), as in the CSV and compute_run_summary."""
+        self.samples += 1
+        if self.first_epoch is None: self.first_epoch = epoch; self.first_elapsed = elapsed_seconds
+        self.last_epoch = epoch; self.last_elapsed = elapsed_seconds
+        if values is None: return
+        voltage, current, power, energy = values
+        self.channels['voltage'].update(voltage); self.channels['current'].update(current); self.channels['power'].update(power)
+        if voltage is not None and current is not None: self.valid_samples += 1
+        self.charge.update(elapsed_seconds, current); self.energy.update(elapsed_seconds, power)
+        if energy is not None: self.meter_energy_wh = energy # Meter counter is cumulative
+
+    def update_block(self, epochs, elapsed_seconds, values):
+        """Vectorized update() for a block of samples: epoch/elapsed arrays and an (n, 4) [V, I, P, E] array, NaN for missing."""
+        if not len(epochs): return
+        self.samples += len(epochs)
+        if self.first_epoch is None: self.first_epoch = float(epochs[0]); self.first_elapsed = float(elapsed_seconds[0])
+        self.last_epoch = float(epochs[-1]); self.last_elapsed = float(elapsed_seconds[-1])
+        voltage, current, power, energy = (values[:, column] for column in range(4))
+        self.channels['voltage'].update_many(voltage); self.channels['current'].update_many(current); self.channels['power'].update_many(power)
+        self.valid_samples += int(np.count_nonzero(~np.isnan(voltage) & ~np.isnan(current)))
+        self.charge.update_many(elapsed_seconds, current); self.energy.update_many(elapsed_seconds, power)
+        energy = energy[~np.isnan(energy)]
+        if len(energy): self.meter_energy_wh = float(energy[-1])
+
+    def snapshot(self):
+        """JSON-serializable summary of the run so far."""
+        elapsed_s = (self.last_elapsed - self.first_elapsed) if self.samples else 0.0
+        charge_mah = self.charge.total / SECONDS_PER_HOUR * 1000
+        summary = {'samples': self.samples, 'valid_samples': self.valid_samples, 'first_epoch': self.first_epoch,
+                   'last_epoch': self.last_epoch, 'elapsed_s': elapsed_s,
+                   'charge_c': self.charge.total, 'charge_mah': charge_mah,
+                   'energy_integrated_wh': self.energy.total / SECONDS_PER_HOUR, 'meter_energy_wh': self.meter_energy_wh,
+                   'mean_current_ma': charge_mah / (elapsed_s / SECONDS_PER_HOUR) if elapsed_s > 0 else None,
+                   'battery_capacity_mah': self.battery_capacity_mah,
+                   'battery_life_h': battery_life_hours(self.battery_capacity_mah, charge_mah, elapsed_s),
+                   'battery_used_pct': charge_mah / self.battery_capacity_mah * 100 if self.battery_capacity_mah else None}
+        summary.update({channel: stats.as_dict() for channel, stats in self.channels.items()})
+        return summary
@@ -1,249 +1,54 @@
 import streamlit as st
-import pyvisa
-import serial
 import time
-import datetime
-import csv
 import pandas as pd
-import matplotlib.pyplot as plt
 import os
-import threading
-import sqlite3 # Import SQLite
-import contextlib # For managing DB connection/cursor
+import json
+import io
+from downsample import buckets_for_width, downsample_frame, downsample_series
+from live_db import DEFAULT_RIG_ID, init_db, get_all_status, get_change_seq, get_live_data_since, empty_live_df
+from acquisition import (DATA_RECORD_INTERVAL_SEC, MIN_SAMPLE_INTERVAL_SEC, MIN_STANDARD_SAMPLE_INTERVAL_SEC, ACQ_MODE_STANDARD,
+                         ACQ_MODE_HIGH_RATE, ACQ_MODE_BUFFERED)
+from meter_log import MIN_LOG_INTERVAL_SEC
+from run_catalog import DEFAULT_DB_FILE as CATALOG_DB_FILE, init_catalog
+from scheduler import get_scheduler
+from stage_timing import metrics_filename_for
+from burst_capture import DEFAULT_BURST_INTERVAL_SEC, DEFAULT_PRE_TRIGGER_SEC, DEFAULT_POST_TRIGGER_SEC, parse_triggers
 
 # --- Configuration ---
-DB_FILE = "Database/VoltRunner.db"
 DEFAULT_PSU_PORT = '/dev/ttyUSB0'; DEFAULT_METER_PORT = '/dev/ttyACM0'
 DEFAULT_VOLTAGE = 3.7; DEFAULT_CURRENT_LIMIT = 1.0
-DEFAULT_DURATION = 10; DATA_RECORD_INTERVAL_SEC = 1.0
-UI_REFRESH_INTERVAL_SEC = 0.75
-
-# --- Database Setup ---
-def init_db():
-    """Initializes the SQLite database and tables if they don't exist."""
-    with contextlib.closing(sqlite3.connect(DB_FILE)) as db:
-        with db: # Auto-commit/rollback context
-            db.execute('''
-                CREATE TABLE IF NOT EXISTS status (
-                    key TEXT PRIMARY KEY,
-                    value TEXT
-                )
-            ''')
-            db.execute('''
-                CREATE TABLE IF NOT EXISTS live_measurements (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    elapsed_seconds REAL,
-                    voltage REAL,
-                    current REAL
-                )
-            ''')
-            db.execute("INSERT OR IGNORE INTO status (key, value) VALUES ('is_running', '0')")
-            db.execute("INSERT OR IGNORE INTO status (key, value) VALUES ('status_text', 'Idle')")
-            db.execute("INSERT OR IGNORE INTO status (key, value) VALUES ('remaining_time', '0')")
-            db.execute("INSERT OR IGNORE INTO status (key, value) VALUES ('last_error', '')")
-            db.execute("INSERT OR IGNORE INTO status (key, value) VALUES ('current_csv_filename', '')")
-            db.execute("INSERT OR IGNORE INTO status (key, value) VALUES ('psu_idn', 'N/A')")
-            db.execute("INSERT OR IGNORE INTO status (key, value) VALUES ('meter_port_name', 'N/A')")
-            db.execute("INSERT OR IGNORE INTO status (key, value) VALUES ('plot_ready', '0')")
-
-def update_status(key, value):
-    """Updates a key-value pair in the status table."""
-    try:
-        with contextlib.closing(sqlite3.connect(DB_FILE, timeout=10)) as db:
-            with db:
-                db.execute("INSERT OR REPLACE INTO status (key, value) VALUES (?, ?)", (key, str(value)))
-    except sqlite3.Error as e:
-        print(f"DB ERROR updating status {key}={value}: {e}")
-
-def get_status(key):
-    """Gets a value from the status table."""
-    val = None
-    try:
-        with contextlib.closing(sqlite3.connect(DB_FILE, timeout=10)) as db:
-            cursor = db.execute("SELECT value FROM status WHERE key = ?", (key,))
-            result = cursor.fetchone()
-            if result: val = result[0]
-    except sqlite3.Error as e: print(f"DB ERROR getting status {key}: {e}")
-    return val
-
-def add_live_data(elapsed_seconds, voltage, current):
-     """Adds a row to the live_measurements table."""
-     try:
-         with contextlib.closing(sqlite3.connect(DB_FILE, timeout=10)) as db:
-             with db:
-                 db.execute("INSERT INTO live_measurements (elapsed_seconds, voltage, current) VALUES (?, ?, ?)",
-                            (elapsed_seconds, voltage, current))
-     except sqlite3.Error as e: print(f"DB ERROR adding live data: {e}")
-
-def clear_live_data():
-    """Deletes all data from the live_measurements table."""
-    try:
-        with contextlib.closing(sqlite3.connect(DB_FILE, timeout=10)) as db:
-            with db:
-                db.execute("DELETE FROM live_measurements")
-                # Reset autoincrement (optional, good practice after DELETE)
-                db.execute("DELETE FROM sqlite_sequence WHERE name='live_measurements'")
-    except sqlite3.Error as e: print(f"DB ERROR clearing live data: {e}")
-
-def get_live_data_df():
-    """Retrieves all live data as a Pandas DataFrame."""
-    df = pd.DataFrame({'Elapsed Time (s)':[], 'Voltage (V)':[], 'Current (A)':[]}) # Default empty
-    try:
-        with contextlib.closing(sqlite3.connect(DB_FILE, timeout=10)) as db:
-             df = pd.read_sql_query("SELECT elapsed_seconds as 'Elapsed Time (s)', voltage as 'Voltage (V)', current as 'Current (A)' FROM live_measurements ORDER BY id ASC", db)
-    except sqlite3.Error as e: print(f"DB ERROR reading live data: {e}")
-    except Exception as ex: print(f"Error converting live data to DataFrame: {ex}")
-    return df
-
-# --- Run DB Init Once ---
-init_db()
-
-# --- Device Communication Functions (remain the same) ---
-def connect_psu(resource_string, baud_rate):
-    rm = pyvisa.ResourceManager('@py'); psu = rm.open_resource(resource_string, baud_rate=baud_rate, data_bits=8, parity=pyvisa.constants.Parity.none, stop_bits=pyvisa.constants.StopBits.one)
-    psu.read_termination='\n'; psu.write_termination='\n'; psu.timeout=5000; return rm, psu
-def connect_meter(port, baud_rate, timeout):
-    meter = serial.Serial(port, baud_rate, serial.EIGHTBITS, serial.PARITY_NONE, serial.STOPBITS_ONE, timeout=timeout); return meter
-def setup_psu(psu, voltage, current_limit):
-    psu.write(f'VOLTage {voltage}'); time.sleep(0.2); psu.write(f'CURRent {current_limit}'); time.sleep(0.2)
-def setup_meter(meter):
-    meter.write(b":FUNCtion:mode DC\n"); time.sleep(0.1); meter.write(b":FUNCtion:ENERgy reset\n"); time.sleep(0.1); meter.write(b":FUNCtion:ecmode MAN\n"); time.sleep(0.1)
-    now=datetime.datetime.now(); year=now.strftime("%y"); month=now.strftime("%m"); day=now.strftime("%d"); hour=now.strftime("%H"); minute=now.strftime("%M"); second=now.strftime("%S")
-    meter.write(f":SYSTem:year {year}\n".encode('utf-8')); time.sleep(0.05); meter.write(f":SYSTem:MONth {month}\n".encode('utf-8')); time.sleep(0.05)
-    meter.write(f":SYSTem:date {day}\n".encode('utf-8')); time.sleep(0.05); meter.write(f":SYSTem:hour {hour}\n".encode('utf-8')); time.sleep(0.05)
-    meter.write(f":SYSTem:MINute {minute}\n".encode('utf-8')); time.sleep(0.05); meter.write(f":SYSTem:SECond {second}\n".encode('utf-8')); time.sleep(0.2)
-
-
-# --- Background Test Function (Corrected Finally Block) ---
-def run_measurement_test_db(psu_port, meter_port, voltage, current_limit, duration, stop_event):
-    """Writes status/data to DB, writes final CSV."""
-    psu = None; meter = None; rm = None; csv_writer = None; csv_file = None
-    test_start_time = 0; final_status = "Unknown"; error_msg = ""
-    final_filename = f"csv/PSU_Meter_Test_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-
-    update_status('status_text', 'Connecting...'); update_status('current_csv_filename', final_filename)
-    update_status('last_error', '')
-
-    try:
-        print("THREAD: Connecting..."); rm, psu = connect_psu(f'ASRL{psu_port}::INSTR', 115200); meter = connect_meter(meter_port, 115200, 2)
-        print("THREAD: Devices Connected.")
-        try: psu_idn = psu.query('*IDN?'); update_status('psu_idn', psu_idn.strip())
-        except Exception: update_status('psu_idn', 'IDN Failed')
-        update_status('meter_port_name', meter.name); print(f"THREAD: Meter Connected: {meter.name}")
-        update_status('status_text', 'Configuring...')
-
-        print("THREAD: Configuring..."); setup_psu(psu, voltage, current_limit); setup_meter(meter); print("THREAD: Configured.")
-        print("THREAD: Turning PSU ON..."); psu.write('OUTPut ON'); time.sleep(1); print("THREAD: PSU ON.")
-        print("THREAD: Starting Meter..."); meter.write(b":FUNCtion:ENERgy run\n"); time.sleep(0.1)
-
-        update_status('status_text', 'Running...'); test_start_time = time.time()
-
-        print(f"THREAD: Opening Final CSV: {final_filename}")
-        with open(final_filename, 'w', newline='') as csv_file:
-            csv_writer = csv.writer(csv_file)
-            csv_writer.writerow(['Timestamp', 'Elapsed Time (s)', 'Voltage (V)', 'Current (A)', 'Power (W)', 'Energy (Wh)'])
-            print("THREAD: Final CSV Header Written.")
-
-            while not stop_event.is_set():
-                loop_start_time = time.time() # Defined here
-                elapsed_seconds = loop_start_time - test_start_time
-                if elapsed_seconds >= duration: print("THREAD: Duration reached."); break
-
-                timestamp_dt = datetime.datetime.now()
-                timestamp_str = timestamp_dt.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-
-                try:
-                    v_val, i_val, p_val, e_val = None, None, None, None
-                    meter.reset_input_buffer()
-                    meter.write(b":FETCh VOLTage\n"); time.sleep(0.1)
-                    if meter.in_waiting > 0: v_val = float(meter.readline().decode('utf-8').strip())
-                    meter.reset_input_buffer()
-                    meter.write(b":FETCh CURRent\n"); time.sleep(0.1)
-                    if meter.in_waiting > 0: i_val = float(meter.readline().decode('utf-8').strip())
-                    meter.reset_input_buffer()
-                    meter.write(b":FETCh power\n"); time.sleep(0.1)
-                    if meter.in_waiting > 0: p_val = float(meter.readline().decode('utf-8').strip())
-                    meter.reset_input_buffer()
-                    meter.write(b":FETCh energy\n"); time.sleep(0.1)
-                    if meter.in_waiting > 0: e_val = float(meter.readline().decode('utf-8').strip())
-
-                    # Write to final CSV directly
-                    csv_writer.writerow([timestamp_str, f"{elapsed_seconds:.3f}",
-                                         v_val if v_val is not None else 'N/A', i_val if i_val is not None else 'N/A',
-                                         p_val if p_val is not None else 'N/A', e_val if e_val is not None else 'N/A'])
-
-                    # Add V/I/Elapsed to live DB table
-                    if v_val is not None and i_val is not None:
-                         add_live_data(elapsed_seconds, v_val, i_val)
-
-                except (ValueError, serial.SerialException, pyvisa.errors.VisaIOError, Exception) as meas_err:
-                    error_type = type(meas_err).__name__; print(f"THREAD: ERROR ({error_type}): {meas_err}")
-                    csv_writer.writerow([timestamp_str, f"{elapsed_seconds:.3f}", 'ERROR', 'ERROR', 'ERROR', 'ERROR'])
-                    if isinstance(meas_err, (serial.SerialException, pyvisa.errors.VisaIOError)):
-                        error_msg = f"{error_type}: {meas_err}"; final_status = "Error"; break
-
-                remaining = max(0, duration - elapsed_seconds)
-                update_status('remaining_time', remaining) # Update DB
-
-                loop_end_time = time.time(); elapsed_time_this_loop = loop_end_time - loop_start_time
-                wait_time = max(0, DATA_RECORD_INTERVAL_SEC - elapsed_time_this_loop)
-                stop_event.wait(wait_time) # Use stop event for waiting
-        # --- End of loop ---
-        if stop_event.is_set(): print("THREAD: Stop event."); final_status = "Stopped"
-        elif final_status != "Error": final_status = "Finished"
-
-    except (serial.SerialException, pyvisa.errors.VisaIOError, Exception) as conn_err:
-        error_type = type(conn_err).__name__; error_msg = f"Conn/Setup Error ({error_type}): {conn_err}"
-        print(f"THREAD: FATAL ERROR: {error_msg}"); final_status = "Error"
-    finally:
-        # --- Cleanup (Corrected Syntax) ---
-        print("THREAD: Cleanup sequence started...")
-
-        # Cleanup Meter
-        if meter:
-            try:
-                print("THREAD: Stopping meter energy...")
-                meter.write(b":FUNCtion:ENERgy stop\n") # Each command on its own line
-                time.sleep(0.1)
-                print("THREAD: Resetting meter energy...")
-                meter.write(b":FUNCtion:ENERgy reset\n")
-                time.sleep(0.1)
-                print("THREAD: Closing meter port...")
-                meter.close()
-                print("THREAD: Meter closed.")
-            except Exception as e_meter_close:
-                print(f"THREAD: Meter cleanup error: {e_meter_close}")
-
-        # Cleanup PSU
-        if psu:
-            try:
-                print("THREAD: Turning PSU OFF...")
-                psu.write('OUTPut OFF') # Each command on its own line
-                time.sleep(0.2)
-                print("THREAD: Closing PSU port...")
-                psu.close()
-                print("THREAD: PSU closed.")
-            except Exception as e_psu_close:
-                print(f"THREAD: PSU cleanup/OFF error: {e_psu_close}")
-
-        # Cleanup Resource Manager
-        if rm:
-            try:
-                print("THREAD: Closing VISA RM...")
-                rm.close() # Command on its own line
-                print("THREAD: VISA RM closed.")
-            except Exception as e_rm_close:
-                print(f"THREAD: RM close error: {e_rm_close}")
-
-        # --- Update final status in DB ---
-        print(f"THREAD: Updating final status: {final_status}")
-        update_status('status_text', final_status)
-        update_status('is_running', '0') # Set running to false
-        update_status('remaining_time', '0')
-        if error_msg: update_status('last_error', error_msg)
-        if final_status == "Finished": update_status('plot_ready', '1')
-        else: update_status('plot_ready', '0')
-        print("THREAD: Finished.")
+DEFAULT_DURATION = 10
+DEFAULT_BATTERY_CAPACITY_MAH = 300
+LIVE_POLL_INTERVAL_SEC = 0.25 # Change-counter poll while tests run or are queued (no polling otherwise); new data shows within one poll
+LIVE_BUFFER_MAX_POINTS = 5000 # Max rows kept per session and rig for the live charts
+LIVE_CHART_BUCKETS = 600 # Live charts are min/max-downsampled to ~2 points per bucket
+FINAL_PLOT_WIDTH_IN = 12
+FINAL_PLOT_CACHE_ENTRIES = 16
+SIM_PORT_HELP = "Serial port, or sim://<bench>?latency_ms=5&noise=0.002 for the simulated instruments (see sim_instruments.py)."
+
+def append_live_buffer(buffer_df, new_rows_df):
+    """Appends new rows to the session buffer, keeping only the last LIVE_BUFFER_MAX_POINTS rows."""
+    if new_rows_df.empty: return buffer_df
+    if buffer_df.empty: combined = new_rows_df
+    else: combined = pd.concat([buffer_df, new_rows_df], ignore_index=True)
+    return combined.tail(LIVE_BUFFER_MAX_POINTS).reset_index(drop=True)
+
+def get_live_buffer(rig_id, live_run_id):
+    """Session buffer of a rig's live rows; reset when the rig starts a different run."""
+    buffers = st.session_state.live_buffers
+    if rig_id not in buffers or buffers[rig_id]['live_run_id'] != live_run_id:
+        buffers[rig_id] = {'df': empty_live_df(), 'last_id': 0, 'live_run_id': live_run_id, # last_id: high-water-mark of the run table's id
+                           'was_running': False, 'charts': None}
+    return buffers[rig_id]
+
+# --- Run DB Init Once (per server process, not per rerun) ---
+@st.cache_resource
+def init_databases():
+    init_db(); init_catalog(CATALOG_DB_FILE)
+    return True
+
+init_databases()
+scheduler = get_scheduler() # Process-wide: shared by every session, survives reruns
 
 
 # --- Streamlit App UI ---
@@ -251,135 +56,257 @@ st.set_page_config(layout="wide")
 st.title("⚡ VOLT/RUNNER Live Feed")
 
 # --- Initialize Session State (Local display state) ---
-if 'live_data_df' not in st.session_state:
-    st.session_state.live_data_df = pd.DataFrame({'Elapsed Time (s)':[], 'Voltage (V)':[], 'Current (A)':[]})
-if 'current_status' not in st.session_state:
-     st.session_state.current_status = "Idle" # Track status locally to manage reruns
-if 'stop_event' not in st.session_state: st.session_state.stop_event = None # Init stop event ref
-
-
-# --- Get Global State from DB ---
-is_globally_running = get_status('is_running') == '1'
-current_status_db = get_status('status_text') or "Idle"
-remaining_time_db = float(get_status('remaining_time') or 0)
-psu_idn_db = get_status('psu_idn') or "N/A"
-meter_port_db = get_status('meter_port_name') or "N/A"
-last_error_db = get_status('last_error') or ""
-current_csv_db = get_status('current_csv_filename') or ""
-plot_ready_db = get_status('plot_ready') == '1'
-
-# Update local session state if DB status changed
-if st.session_state.current_status != current_status_db:
-     st.session_state.current_status = current_status_db
-     if current_status_db not in ["Running..."]: # Clear local live data if test not running
-          st.session_state.live_data_df = pd.DataFrame({'Elapsed Time (s)':[], 'Voltage (V)':[], 'Current (A)':[]})
+if 'live_buffers' not in st.session_state: st.session_state.live_buffers = {} # rig_id -> bounded live buffer
+if 'live_view' not in st.session_state: st.session_state.live_view = {'seq': None, 'status_by_rig': {}} # Last rendered status snapshot
+
+
+# --- Get Global State from the Scheduler ---
+running_rigs = scheduler.running_rigs()
+queued_jobs = scheduler.snapshot()
 
 
 # --- Input Controls (Sidebar) ---
 with st.sidebar:
     st.header("Configuration")
-    psu_port_input = st.text_input("PSU Serial Port", value=DEFAULT_PSU_PORT, disabled=is_globally_running)
-    meter_port_input = st.text_input("Meter Serial Port", value=DEFAULT_METER_PORT, disabled=is_globally_running)
-    voltage_input = st.number_input("Target Voltage (V)", 0.0, 60.0, DEFAULT_VOLTAGE, 0.1, "%.1f", disabled=is_globally_running)
-    current_limit_input = st.number_input("Current Limit (A)", 0.0, 10.0, DEFAULT_CURRENT_LIMIT, 0.1, "%.1f", disabled=is_globally_running)
-    duration_input = st.number_input("Test Duration (s)", 1, 3600*24, DEFAULT_DURATION, 1, disabled=is_globally_running)
+    rig_id_input = st.text_input("Rig Name", value=DEFAULT_RIG_ID).strip() or DEFAULT_RIG_ID
+    psu_port_input = st.text_input("PSU Serial Port", value=DEFAULT_PSU_PORT, help=SIM_PORT_HELP)
+    meter_port_input = st.text_input("Meter Serial Port", value=DEFAULT_METER_PORT, help=SIM_PORT_HELP)
+    voltage_input = st.number_input("Target Voltage (V)", 0.0, 60.0, DEFAULT_VOLTAGE, 0.1, "%.1f")
+    current_limit_input = st.number_input("Current Limit (A)", 0.0, 10.0, DEFAULT_CURRENT_LIMIT, 0.1, "%.1f")
+    duration_input = st.number_input("Test Duration (s)", 1, 3600*24, DEFAULT_DURATION, 1)
+    acq_mode_input = st.selectbox("Acquisition Mode", [ACQ_MODE_STANDARD, ACQ_MODE_HIGH_RATE, ACQ_MODE_BUFFERED],
+                                  help="High-rate pipelines the meter queries and reads with a deadline instead of fixed sleeps. "
+                                       "Buffered has the meter log on its own clock and downloads the records in blocks (meter_log.py).")
+    buffered_mode = acq_mode_input == ACQ_MODE_BUFFERED; burst_available = acq_mode_input == ACQ_MODE_HIGH_RATE
+    min_sample_interval = {ACQ_MODE_STANDARD: MIN_STANDARD_SAMPLE_INTERVAL_SEC, ACQ_MODE_BUFFERED: MIN_LOG_INTERVAL_SEC}.get(acq_mode_input, MIN_SAMPLE_INTERVAL_SEC)
+    sample_interval_input = st.number_input("Sample Interval (s)", min_sample_interval, 60.0,
+                                            DATA_RECORD_INTERVAL_SEC, 0.001 if buffered_mode else 0.05, "%.3f" if buffered_mode else "%.2f")
+    write_binary_input = st.checkbox("Also save binary run file (.vrun)", value=False)
+    psu_readback_input = st.checkbox("Read back PSU V/I each sample", value=False, disabled=buffered_mode,
+                                     help="Queries the PSU's measured output concurrently with the meter and adds it as two extra columns.")
+    battery_capacity_input = st.number_input("Battery Capacity (mAh)", 0, 1000000, DEFAULT_BATTERY_CAPACITY_MAH, 10,
+                                             help="Used for the live battery-life projection; 0 disables it.")
+    with st.expander("Burst Capture"):
+        if not burst_available: st.caption("Burst capture needs the High-rate acquisition mode.")
+        burst_triggers_input = st.text_input("Triggers", placeholder="current>0.5, voltage<3.3, d(current)>2", disabled=not burst_available,
+                                             help="Comma-separated thresholds or rates of change (V, A, W; per second). Empty disables burst capture. "
+                                                  "Events are saved next to the CSV as <run>.events.jsonl; the CSV keeps the sample interval.")
+        burst_interval_input = st.number_input("Burst Sample Interval (s)", MIN_SAMPLE_INTERVAL_SEC, 60.0, DEFAULT_BURST_INTERVAL_SEC, 0.01, "%.2f")
+        burst_pre_input = st.number_input("Pre-trigger (s)", 0.0, 600.0, DEFAULT_PRE_TRIGGER_SEC, 0.5)
+        burst_post_input = st.number_input("Post-trigger (s)", 0.0, 600.0, DEFAULT_POST_TRIGGER_SEC, 0.5)
+    rig_is_running = rig_id_input in running_rigs
     col1, col2 = st.columns(2);
-    with col1: start_button = st.button("Start Test", disabled=is_globally_running, type="primary", use_container_width=True)
-    with col2: stop_button = st.button("Stop Test", disabled=not is_globally_running, use_container_width=True)
-
-# --- Status Display (Reads from DB values fetched above) ---
-st.header("Status of the Device")
-status_cols = st.columns(3); status_placeholder = status_cols[0].empty()
-timer_placeholder = status_cols[1].empty(); info_placeholder = status_cols[2].empty()
-error_placeholder = st.empty(); success_placeholder = st.empty()
-status_placeholder.metric("Test Status", current_status_db)
-timer_placeholder.metric("Time Remaining", f"{remaining_time_db:.0f} s")
-info_placeholder.info(f"PSU: {psu_idn_db}\nMeter: {meter_port_db}")
-if last_error_db: error_placeholder.error(f"Error Encountered: {last_error_db}")
-else: error_placeholder.empty()
-if current_status_db == "Finished" and current_csv_db: success_placeholder.success(f"Test finished. Data saved to: {current_csv_db}")
-else: success_placeholder.empty()
-
-# --- Live Plot Placeholders ---
-st.header("Live Measurements")
-col1, col2 = st.columns(2)
-with col1: st.subheader("Voltage (V) vs Time (s)"); voltage_plot_placeholder = st.empty()
-with col2: st.subheader("Current (A) vs Time (s)"); current_plot_placeholder = st.empty()
-
-# --- Update Live Plots (if running) ---
-if is_globally_running:
-     live_df_from_db = get_live_data_df() # Read latest live data from DB
-     st.session_state.live_data_df = live_df_from_db # Update local copy for display
-
-# Update plots from local session state (which was just updated from DB if running)
-voltage_plot_placeholder.line_chart(st.session_state.live_data_df, x='Elapsed Time (s)', y='Voltage (V)')
-current_plot_placeholder.line_chart(st.session_state.live_data_df, x='Elapsed Time (s)', y='Current (A)')
-
-# --- Button Actions (Interact with DB) ---
-if start_button:
-    # Double check DB status before starting
-    if get_status('is_running') == '0':
-        update_status('is_running', '1'); update_status('status_text', 'Starting...')
-        update_status('last_error', ''); update_status('plot_ready', '0')
-        update_status('current_csv_filename', '') # Clear old filename
-        clear_live_data() # Clear previous live data from DB table
-        st.session_state.stop_event = threading.Event() # Create local stop event
-
-        # Reset local display state immediately
-        st.session_state.current_status = "Starting..."
-        st.session_state.live_data_df = pd.DataFrame({'Elapsed Time (s)':[], 'Voltage (V)':[], 'Current (A)':[]})
-
-        # Start thread
-        thread = threading.Thread(target=run_measurement_test_db,
-            args=(psu_port_input, meter_port_input, voltage_input, current_limit_input, duration_input,
-                  st.session_state.stop_event), daemon=True) # Pass local event
-        thread.start(); print("MAIN: Start button pressed, thread started.")
-        time.sleep(0.1) # Brief pause to allow thread to start and update status
-        st.rerun()
-    else: st.warning("A test is already running (DB status).")
+    with col1: start_button = st.button("Queue Test" if rig_is_running else "Start Test", type="primary", width="stretch",
+                                        help="Starts now if the rig and ports are free, otherwise waits in the queue.")
+    with col2: stop_button = st.button("Stop Test", disabled=not rig_is_running, width="stretch")
+
+# --- Button Actions (Interact with the scheduler) ---
+try: parse_triggers(burst_triggers_input if burst_available else None); burst_trigger_error = None
+except ValueError as e_trigger: burst_trigger_error = str(e_trigger); st.sidebar.error(burst_trigger_error)
+
+if start_button and not burst_trigger_error:
+    job_id = scheduler.add_job(rig_id_input, psu_port_input, meter_port_input, voltage_input, current_limit_input, duration_input,
+                               sample_interval=sample_interval_input, acq_mode=acq_mode_input, write_binary=write_binary_input,
+                               battery_capacity_mah=battery_capacity_input or None, psu_readback=psu_readback_input and not buffered_mode,
+                               burst_triggers=(burst_triggers_input.strip() or None) if burst_available else None, burst_interval=burst_interval_input,
+                               burst_pre_sec=burst_pre_input, burst_post_sec=burst_post_input)
+    print(f"MAIN: Start button pressed, job {job_id} queued on {rig_id_input}.")
+    time.sleep(0.1) # Brief pause to allow the dispatcher to start it and update status
+    st.rerun()
 
 if stop_button:
-    # Signal stop event if it exists in session state
-    if st.session_state.stop_event:
-         update_status('status_text', 'Stopping...') # Update DB status
-         st.session_state.current_status = "Stopping..." # Update local status immediately
-         st.session_state.stop_event.set()
-         print("MAIN: Stop button pressed.")
-         st.session_state.stop_event = None # Clear local event ref
-         st.rerun()
-    else:
-        # If stop event doesn't exist locally, maybe test was started by another session.
-        # We can still try to update the global status, but can't signal the event.
-        # This highlights a limitation of managing the event locally.
-        # A truly robust solution might store a 'stop_requested' flag in the DB.
-        print("MAIN: Stop pressed, but no local stop event found (test likely started elsewhere).")
-        update_status('status_text', 'Stopping...') # Attempt global status update
-        st.session_state.current_status = "Stopping..."
-        st.rerun()
-
-
-# --- Schedule Rerun if Test is Globally Running ---
-if is_globally_running:
-    time.sleep(UI_REFRESH_INTERVAL_SEC)
-    # print("MAIN: Rerunning for live update check...") # Debug
+    scheduler.stop_rig(rig_id_input) # Stop event lives in the scheduler, so any session can stop any rig
+    print(f"MAIN: Stop button pressed for {rig_id_input}.")
     st.rerun()
 
-# --- Post-Run Plotting (Checks DB flag) ---
-if plot_ready_db and current_csv_db and os.path.exists(current_csv_db):
+# --- Test Queue ---
+if queued_jobs:
+    st.header("Test Queue")
+    st.dataframe(pd.DataFrame(queued_jobs), hide_index=True, width="stretch")
+    cancel_cols = st.columns([3, 1])
+    cancel_job_id = cancel_cols[0].selectbox("Job", [job['Job'] for job in queued_jobs], label_visibility="collapsed")
+    if cancel_cols[1].button("Cancel Job", width="stretch"):
+        scheduler.cancel_job(cancel_job_id); st.rerun()
+
+
+# --- Post-Run Plotting ---
+@st.cache_data(max_entries=FINAL_PLOT_CACHE_ENTRIES, show_spinner=False)
+def final_plot_png(current_csv_db, mtime_ns):
+    """PNG of a finished run's V & I plot, rendered once per file version (live refreshes reuse it).
+    Returns None when the CSV has no valid numeric data."""
+    df = pd.read_csv(current_csv_db, header=0)
+    if 'Timestamp' not in df.columns or 'Voltage (V)' not in df.columns or 'Current (A)' not in df.columns: raise ValueError("CSV missing cols")
+    df['Timestamp'] = pd.to_datetime(df['Timestamp'], errors='coerce'); df['Voltage (V)'] = pd.to_numeric(df['Voltage (V)'], errors='coerce'); df['Current (A)'] = pd.to_numeric(df['Current (A)'], errors='coerce')
+    df.dropna(subset=['Timestamp', 'Voltage (V)', 'Current (A)'], inplace=True)
+    if df.empty: return None
+    import matplotlib.pyplot as plt # Deferred: ~0.7 s to import, and only finished runs are plotted
+    plot_buckets = buckets_for_width(FINAL_PLOT_WIDTH_IN); df = df.set_index('Timestamp')
+    voltage_plot = downsample_series(df['Voltage (V)'], plot_buckets); current_plot = downsample_series(df['Current (A)'], plot_buckets)
+    fig, ax1 = plt.subplots(figsize=(FINAL_PLOT_WIDTH_IN, 5))
+    color='tab:red'; ax1.set_xlabel('Time'); ax1.set_ylabel('Voltage (V)', color=color); ax1.plot(voltage_plot.index, voltage_plot, color=color); ax1.tick_params(axis='y', labelcolor=color); ax1.grid(True, axis='y', linestyle='--', alpha=0.6); ax1.tick_params(axis='x', rotation=45)
+    ax2 = ax1.twinx(); color='tab:blue'; ax2.set_ylabel('Current (A)', color=color); ax2.plot(current_plot.index, current_plot, color=color); ax2.tick_params(axis='y', labelcolor=color)
+    plt.title(f'Test Results (V & I) - {os.path.basename(current_csv_db)}'); fig.tight_layout()
+    png = io.BytesIO(); fig.savefig(png, format='png', dpi=200, bbox_inches='tight'); plt.close(fig)
+    return png.getvalue()
+
+def render_final_plot(current_csv_db):
+    """Plots V & I of a finished run's CSV."""
     st.header("Final Test Results Plot")
     if os.path.getsize(current_csv_db) > 50:
         try:
-            df = pd.read_csv(current_csv_db, header=0)
-            if 'Timestamp' not in df.columns or 'Voltage (V)' not in df.columns or 'Current (A)' not in df.columns: raise ValueError("CSV missing cols")
-            df['Timestamp'] = pd.to_datetime(df['Timestamp'], errors='coerce'); df['Voltage (V)'] = pd.to_numeric(df['Voltage (V)'], errors='coerce'); df['Current (A)'] = pd.to_numeric(df['Current (A)'], errors='coerce')
-            df.dropna(subset=['Timestamp', 'Voltage (V)', 'Current (A)'], inplace=True)
-            if not df.empty:
-                fig, ax1 = plt.subplots(figsize=(12, 5))
-                color='tab:red'; ax1.set_xlabel('Time'); ax1.set_ylabel('Voltage (V)', color=color); ax1.plot(df['Timestamp'], df['Voltage (V)'], color=color); ax1.tick_params(axis='y', labelcolor=color); ax1.grid(True, axis='y', linestyle='--', alpha=0.6); ax1.tick_params(axis='x', rotation=45)
-                ax2 = ax1.twinx(); color='tab:blue'; ax2.set_ylabel('Current (A)', color=color); ax2.plot(df['Timestamp'], df['Current (A)'], color=color); ax2.tick_params(axis='y', labelcolor=color)
-                plt.title(f'Test Results (V & I) - {os.path.basename(current_csv_db)}'); fig.tight_layout(); st.pyplot(fig)
+            png = final_plot_png(current_csv_db, os.stat(current_csv_db).st_mtime_ns)
+            if png: st.image(png, width="stretch")
             else: st.warning("Plotting skipped: No valid numeric data in CSV.")
         except pd.errors.EmptyDataError: st.error(f"Plotting Error: CSV file '{current_csv_db}' seems empty.")
         except FileNotFoundError: st.error(f"Plotting Error: File '{current_csv_db}' not found.")
         except Exception as e_plot: st.error(f"Plotting Error: {e_plot}")
-    else: st.warning(f"Plotting skipped: CSV file '{current_csv_db}' is empty/small.")
\ No newline at end of file
+    else: st.warning(f"Plotting skipped: CSV file '{current_csv_db}' is empty/small.")
+
+
+def format_stat(value, fmt):
+    return "N/A" if value is None else format(value, fmt)
+
+def render_live_stats(live_stats_db):
+    """Running statistics, charge/energy and battery projection published by the rig's writer (no data scan)."""
+    try: stats = json.loads(live_stats_db)
+    except ValueError: return
+    stat_cols = st.columns(4)
+    stat_cols[0].metric("Charge", f"{format_stat(stats['charge_mah'], '.3f')} mAh")
+    stat_cols[1].metric("Energy", f"{format_stat(stats['energy_integrated_wh'], '.4f')} Wh")
+    stat_cols[2].metric("Mean Current", f"{format_stat(stats['mean_current_ma'], '.2f')} mA")
+    battery_life_h = stats.get('battery_life_h')
+    stat_cols[3].metric("Projected Battery Life", f"{battery_life_h / 24:.2f} days" if battery_life_h else "N/A",
+                        help=f"{stats['battery_capacity_mah']:g} mAh at the run's mean current" if stats.get('battery_capacity_mah') else None)
+    with st.expander("Running statistics"):
+        rows = [{'Channel': name, 'Min': stats[channel]['min'], 'Max': stats[channel]['max'], 'Mean': stats[channel]['mean'],
+                 'Std Dev': stats[channel]['std'], 'Samples': stats[channel]['count']}
+                for channel, name in (('voltage', 'Voltage (V)'), ('current', 'Current (A)'), ('power', 'Power (W)'))]
+        st.dataframe(pd.DataFrame(rows), hide_index=True, width="stretch")
+
+
+def render_timing_metrics(timing_metrics_db, current_csv_db):
+    """Per-stage timing table (SCPI commands, sample loop, CSV/DB writes) published by the rig's writer."""
+    try: metrics = json.loads(timing_metrics_db)
+    except ValueError: st.caption("Timing metrics unavailable."); return
+    rows = [{'Stage': stage, 'Count': summary['count'], 'Mean (ms)': summary['mean_ms'], 'p50 (ms)': summary['p50_ms'],
+             'p95 (ms)': summary['p95_ms'], 'p99 (ms)': summary['p99_ms'], 'Max (ms)': summary['max_ms']}
+            for stage, summary in metrics.get('stages', {}).items()]
+    if rows: st.dataframe(pd.DataFrame(rows).round(2), hide_index=True, width="stretch")
+    counters = metrics.get('counters', {})
+    st.caption(f"Overruns: {counters.get('overruns', 0)}, skipped samples: {counters.get('skipped_samples', 0)}. "
+               f"Percentiles are interpolated from histograms. Full histograms: {metrics_filename_for(current_csv_db) if current_csv_db else 'N/A'}")
+
+
+# --- Per-Rig Status, Progress and Live Plots ---
+def refresh_live_view(view, change_seq):
+    """Reads the status snapshot and the new live rows of running rigs into the session's view."""
+    view['status_by_rig'] = get_all_status(); view['seq'] = change_seq
+    for rig_id, status_db in view['status_by_rig'].items():
+        live_buffer = get_live_buffer(rig_id, status_db.get('live_run_id') or "")
+        is_rig_running = status_db.get('is_running') == '1'
+        if is_rig_running or live_buffer['was_running']: # One more read after the stop picks up the final rows
+            new_rows_df, live_buffer['last_id'] = get_live_data_since(live_buffer['live_run_id'], live_buffer['last_id'])
+            if not new_rows_df.empty: live_buffer['df'] = append_live_buffer(live_buffer['df'], new_rows_df); live_buffer['charts'] = None
+        live_buffer['was_running'] = is_rig_running
+
+def live_chart_frames(live_buffer):
+    """Downsampled V and I chart frames, recomputed only after new rows arrived."""
+    if live_buffer['charts'] is None:
+        live_buffer['charts'] = (downsample_frame(live_buffer['df'], ['Voltage (V)'], LIVE_CHART_BUCKETS),
+                                 downsample_frame(live_buffer['df'], ['Current (A)'], LIVE_CHART_BUCKETS))
+    return live_buffer['charts']
+
+def create_rig_slots(rig_ids):
+    """One tab per rig with placeholders for its status, live charts and final plot. Built in the page body,
+    outside the live fragment, so a fragment run that skips a placeholder leaves its content on screen."""
+    if not rig_ids: st.info("No rigs have run yet. Configure a rig in the sidebar and start a test."); return {}
+    rig_slots = {}
+    for rig_tab, rig_id in zip(st.tabs(rig_ids), rig_ids):
+        with rig_tab: rig_slots[rig_id] = {'status': st.empty(), 'charts': st.empty(), 'final': st.empty()}
+    return rig_slots
+
+def render_rig_status(rig_id, status_db):
+    is_rig_running = status_db.get('is_running') == '1'
+    current_status_db = status_db.get('status_text') or "Idle"
+    remaining_time_db = float(status_db.get('remaining_time') or 0); duration_db = float(status_db.get('duration') or 0)
+    psu_idn_db = status_db.get('psu_idn') or "N/A"
+    meter_port_db = status_db.get('meter_port_name') or "N/A"
+    last_error_db = status_db.get('last_error') or ""
+    current_csv_db = status_db.get('current_csv_filename') or ""
+    missed_responses_db = int(status_db.get('missed_responses') or 0)
+    dropped_samples_db = int(status_db.get('dropped_samples') or 0); delayed_samples_db = int(status_db.get('delayed_samples') or 0)
+    overruns_db = int(status_db.get('overruns') or 0); skipped_samples_db = int(status_db.get('skipped_samples') or 0)
+    burst_events_db = int(status_db.get('burst_events') or 0)
+    timing_metrics_db = status_db.get('timing_metrics') or ""
+    live_stats_db = status_db.get('live_stats') or ""
+
+    status_cols = st.columns(3)
+    status_cols[0].metric("Test Status", current_status_db)
+    status_cols[1].metric("Time Remaining", f"{remaining_time_db:.0f} s")
+    status_cols[2].info(f"PSU: {psu_idn_db}\nMeter: {meter_port_db}\nMissed responses: {missed_responses_db}\nDropped/delayed samples: {dropped_samples_db}/{delayed_samples_db}\nOverruns/skipped samples: {overruns_db}/{skipped_samples_db}\nBurst events: {burst_events_db}")
+    if is_rig_running and duration_db > 0:
+        st.progress(min(1.0, max(0.0, 1 - remaining_time_db / duration_db)), text=f"{rig_id}: {current_status_db}")
+    if last_error_db: st.error(f"Error Encountered: {last_error_db}")
+    if current_status_db == "Finished" and current_csv_db: st.success(f"Test finished. Data saved to: {current_csv_db}")
+    if live_stats_db: render_live_stats(live_stats_db)
+    if timing_metrics_db:
+        with st.expander("Timing per stage"): render_timing_metrics(timing_metrics_db, current_csv_db)
+
+def render_live_charts(live_buffer):
+    """Live plots from the session's bounded buffer, filled by refresh_live_view."""
+    voltage_chart_df, current_chart_df = live_chart_frames(live_buffer)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Voltage (V) vs Time (s)")
+        st.line_chart(voltage_chart_df, x='Elapsed Time (s)', y='Voltage (V)')
+    with col2:
+        st.subheader("Current (A) vs Time (s)")
+        st.line_chart(current_chart_df, x='Elapsed Time (s)', y='Current (A)')
+
+def render_rig_tabs(view, rig_slots):
+    """Redraws only the placeholders whose inputs changed since they were last drawn (view['drawn'])."""
+    drawn = view['drawn']
+    for rig_id, slots in rig_slots.items():
+        status_db = view['status_by_rig'].get(rig_id, {})
+        status_key = tuple(sorted(status_db.items()))
+        if drawn.get((rig_id, 'status')) != status_key:
+            with slots['status'].container(): render_rig_status(rig_id, status_db)
+            drawn[(rig_id, 'status')] = status_key
+        live_buffer = get_live_buffer(rig_id, status_db.get('live_run_id') or "")
+        charts_key = (live_buffer['live_run_id'], live_buffer['last_id'])
+        if drawn.get((rig_id, 'charts')) != charts_key:
+            with slots['charts'].container(): render_live_charts(live_buffer)
+            drawn[(rig_id, 'charts')] = charts_key
+        current_csv_db = status_db.get('current_csv_filename') or ""
+        final_key = (status_db.get('is_running') != '1' and status_db.get('plot_ready') == '1' and bool(current_csv_db), current_csv_db)
+        if drawn.get((rig_id, 'final')) != final_key:
+            if final_key[0] and os.path.exists(current_csv_db):
+                with slots['final'].container(): render_final_plot(current_csv_db)
+            else: slots['final'].empty()
+            drawn[(rig_id, 'final')] = final_key
+
+
+# Only this section refreshes while tests run or are queued: each tick costs one change-counter read, and
+# when a writer has committed something new, only the rig placeholders whose data changed are redrawn.
+# With nothing running the timer is off; queue or rig start/stop changes (scheduler.version) redraw the
+# whole page so the sidebar, queue and tabs stay current.
+page_scheduler_version = scheduler.version
+live_poll_interval = LIVE_POLL_INTERVAL_SEC if running_rigs or queued_jobs else None
+
+st.header("Status of the Devices")
+live_view = st.session_state.live_view
+refresh_live_view(live_view, get_change_seq())
+live_rig_slots = create_rig_slots(sorted(live_view['status_by_rig']))
+live_view['drawn'] = {} # Fresh placeholders: everything is drawn on this run
+
+@st.fragment(run_every=live_poll_interval)
+def live_status_section():
+    if scheduler.version != page_scheduler_version: st.rerun()
+    view = st.session_state.live_view
+    change_seq = get_change_seq()
+    if view['drawn'] and change_seq == view['seq'] and change_seq >= 0: return # Nothing committed since the last draw
+    if change_seq != view['seq'] or change_seq < 0: refresh_live_view(view, change_seq)
+    if sorted(view['status_by_rig']) != list(live_rig_slots): st.rerun() # A new rig needs its tab
+    render_rig_tabs(view, live_rig_slots)
+
+live_status_section()
@@ -1,19 +1,167 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
 import os
+import io
 import datetime
+import concurrent.futures
+import multiprocessing
+from run_format import RUN_FILE_EXTENSION
+from run_cache import RunCache, file_cache_key
+from run_catalog import DEFAULT_DB_FILE as CATALOG_DB_FILE, init_catalog, backfill_catalog, list_runs
+from downsample import buckets_for_width, downsample_series
+from rollups import build_rollups, window_stats, rollup_plot_series
+from chunked_reader import scan_run_file
+from run_compare import (COMPARE_CHANNELS, SPAN_UNION, SPAN_OVERLAP, load_compare_run, common_grid, align_runs,
+                         difference_from_reference, summary_table)
 
 # Set the directory where the CSV files are located
 csv_directory = '../csv'
+RUN_CACHE_MAX_BYTES = 1024 * 1024 * 1024 # In-memory budget for parsed runs, shared by all sessions
+PLOT_WIDTH_IN = 12 # Figure width; plots are downsampled to ~2 points per pixel of this width
+PLOT_SIZE_IN = (PLOT_WIDTH_IN, 6)
+MAX_IMAGE_WIDTH_PX = 1400 # st.image decodes, resizes and re-encodes wider images (over 1460 px) on every run
+FIGURE_DPI = MAX_IMAGE_WIDTH_PX // PLOT_WIDTH_IN
+FIGURE_CACHE_ENTRIES = 64 # Rendered PNGs kept per chart kind (least recently used evicted), ~100-300 kB each
+RUN_CACHE_DIR = os.path.join(os.path.dirname(csv_directory), 'Database', 'run_cache') # Set to None to disable the disk cache
+RUN_CACHE_DISK_MAX_BYTES = 2 * 1024 * 1024 * 1024 # Least recently used pickles are deleted beyond this
+ROLLUP_CACHE_MAX_BYTES = 256 * 1024 * 1024
+ROLLUP_CACHE_DIR = os.path.join(os.path.dirname(csv_directory), 'Database', 'run_rollups')
+ROLLUP_CACHE_DISK_MAX_BYTES = 512 * 1024 * 1024
+CATALOG_SORT_COLUMNS = {'Start Time': 'started_at', 'Duration': 'duration_s', 'Rows': 'row_count', 'Avg Voltage': 'voltage_mean',
+                        'Avg Current': 'current_mean', 'Avg Power': 'power_mean', 'Energy': 'energy_wh', 'Charge': 'charge_mah',
+                        'Battery Life': 'battery_life_h'}
+OUT_OF_CORE_MIN_BYTES = 256 * 1024 * 1024 # Larger run files are scanned in chunks instead of parsed whole
+SCAN_CACHE_ENTRIES = 32
+COMPARE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+COMPARE_MAX_WORKERS = min(8, os.cpu_count() or 1)
 
-# Get a list of all CSV files in the directory
-csv_files = [f for f in os.listdir(csv_directory) if f.endswith('.csv')]
+@st.cache_resource
+def init_catalog_once(db_file):
+    """Creates/migrates the catalog table once per server process instead of on every rerun."""
+    init_catalog(db_file)
+    return True
+
+@st.cache_resource
+def get_run_cache():
+    """One parsed-run cache per server process; survives reruns and is shared across sessions."""
+    return RunCache(RUN_CACHE_MAX_BYTES, RUN_CACHE_DIR, disk_max_bytes=RUN_CACHE_DISK_MAX_BYTES)
+
+@st.cache_resource
+def get_rollup_cache():
+    """Per-run rollup pyramids (1 s .. 10 min buckets), built once per file version from the parsed run."""
+    return RunCache(ROLLUP_CACHE_MAX_BYTES, ROLLUP_CACHE_DIR, parser=lambda path: build_rollups(get_run_cache().get(path)),
+                    disk_max_bytes=ROLLUP_CACHE_DISK_MAX_BYTES)
+
+@st.cache_resource
+def get_compare_cache():
+    """Elapsed-time channels + summary of runs selected for comparison (see run_compare.load_compare_run)."""
+    return RunCache(COMPARE_CACHE_MAX_BYTES, parser=load_compare_run)
+
+@st.cache_resource
+def get_compare_pool():
+    """Worker processes that parse runs for comparison in parallel (None on a single core: parse in-process).
+    Spawned, not forked: the server is multi-threaded."""
+    if COMPARE_MAX_WORKERS < 2: return None
+    return concurrent.futures.ProcessPoolExecutor(COMPARE_MAX_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+
+def figure_png(fig):
+    """Renders a figure to PNG bytes and closes it, so figures never pile up in the server process."""
+    import matplotlib.pyplot as plt
+    try:
+        png = io.BytesIO(); fig.savefig(png, format='png', dpi=FIGURE_DPI, bbox_inches='tight')
+        return png.getvalue()
+    finally: plt.close(fig)
+
+# Rendered plots are cached by (run file version, window, series, size). Arguments with a leading
+# underscore are not hashed: they are the plot data, only drawn on a cache miss.
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def channel_plot_png(run_key, window_key, channel, plot_size, _series):
+    import matplotlib.pyplot as plt # Deferred: ~0.7 s to import, only needed once something is drawn
+    fig, ax = plt.subplots(figsize=plot_size)
+    ax.plot(_series.index, _series)
+    ax.set_xlabel('Time')
+    ax.set_ylabel(channel)
+    ax.grid(True)
+    return figure_png(fig)
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def voltage_current_plot_png(run_key, window_key, plot_size, _voltage, _current):
+    import matplotlib.pyplot as plt
+    fig, ax1 = plt.subplots(figsize=plot_size)
+
+    color = 'tab:red'
+    ax1.set_xlabel('Time')
+    ax1.set_ylabel('Voltage (V)', color=color)
+    ax1.plot(_voltage.index, _voltage, color=color)
+    ax1.tick_params(axis='y', labelcolor=color)
+
+    ax2 = ax1.twinx()  # instantiate a second axes that shares the same x-axis
+
+    color = 'tab:blue'
+    ax2.set_ylabel('Current (mA)', color=color)  # we already handled the x-label with ax1
+    ax2.plot(_current.index, _current, color=color, alpha=0.8) # Added alpha for opacity
+    ax2.tick_params(axis='y', labelcolor=color)
+
+    fig.tight_layout()  # otherwise the right y-label might be slightly clipped
+    return figure_png(fig)
+
+@st.cache_data(max_entries=FIGURE_CACHE_ENTRIES, show_spinner=False)
+def compare_plot_png(run_keys, mode, channel, plot_size, _aligned):
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=plot_size)
+    plot_buckets = buckets_for_width(plot_size[0])
+    for label in _aligned.columns:
+        series = downsample_series(_aligned[label], plot_buckets)
+        ax.plot(series.index, series, label=label)
+    ax.set_xlabel('Elapsed Time (s)')
+    ax.set_ylabel(f"Δ {channel}" if mode == 'Difference from reference' else channel)
+    ax.grid(True); ax.legend()
+    return figure_png(fig)
+
+@st.cache_data(max_entries=SCAN_CACHE_ENTRIES)
+def scan_large_run(filepath, mtime_ns, size, start_offset, end_offset, plot_buckets):
+    """Window stats + plot series of a large run in one chunked pass (file version and window are the cache key)."""
+    return scan_run_file(filepath, start_offset, end_offset, plot_buckets)
+
+@st.cache_data
+def list_run_files(directory, directory_mtime_ns):
+    """Lists run files; re-scans only when the directory changes (mtime is part of the cache key)."""
+    # A binary .vrun replaces the CSV it was converted from
+    all_files = os.listdir(directory)
+    run_files = [f for f in all_files if f.endswith(RUN_FILE_EXTENSION)]
+    run_stems = {os.path.splitext(f)[0] for f in run_files}
+    return sorted(run_files + [f for f in all_files if f.endswith('.csv') and os.path.splitext(f)[0] not in run_stems])
+
+# Get a list of all run files in the directory
+csv_files = list_run_files(csv_directory, os.stat(csv_directory).st_mtime_ns)
 
 st.title('⚡ VOLT/RUNNER Data Archives')
 
+# --- Run Catalog (precomputed per-run settings and aggregates, no file access) ---
+try:
+    init_catalog_once(CATALOG_DB_FILE)
+    st.sidebar.header('Run Catalog')
+    if st.sidebar.button('Scan Archive for New Runs'):
+        updated, skipped, failed = backfill_catalog(csv_directory, CATALOG_DB_FILE)
+        st.sidebar.success(f"Catalog updated: {updated} new/changed, {skipped} unchanged, {failed} failed.")
+    with st.expander('Run Catalog', expanded=False):
+        catalog_df = list_runs(CATALOG_DB_FILE)
+        filter_cols = st.columns(4)
+        name_filter = filter_cols[0].text_input('Run name / PSU contains')
+        min_duration_min = filter_cols[1].number_input('Min duration (minutes)', min_value=0.0, step=1.0)
+        sort_label = filter_cols[2].selectbox('Sort by', list(CATALOG_SORT_COLUMNS))
+        sort_ascending = filter_cols[3].checkbox('Ascending', value=False)
+        if name_filter:
+            catalog_df = catalog_df[catalog_df['run_name'].str.contains(name_filter, case=False, regex=False) |
+                                    catalog_df['psu_idn'].fillna('').str.contains(name_filter, case=False, regex=False)]
+        catalog_df = catalog_df[catalog_df['duration_s'].fillna(0) >= min_duration_min * 60]
+        catalog_df = catalog_df.sort_values(CATALOG_SORT_COLUMNS[sort_label], ascending=sort_ascending, na_position='last')
+        st.dataframe(catalog_df, hide_index=True, width="stretch")
+except Exception as e_catalog:
+    st.sidebar.warning(f"Run catalog unavailable: {e_catalog}")
+
 st.sidebar.header('Plotting Options')
-selected_filename = st.sidebar.selectbox('Select a CSV file', csv_files)
+selected_filename = st.sidebar.selectbox('Select a run file (CSV or .vrun)', csv_files)
 plot_custom_duration = st.sidebar.checkbox('Plot Custom Duration')
 
 start_minute = None
@@ -27,86 +175,100 @@ st.sidebar.header('Battery Estimation')
 battery_nominal_voltage = st.sidebar.number_input('Nominal Battery Voltage (V)', value=3.7)
 battery_capacity_mah = st.sidebar.number_input('Battery Capacity (mAh)', value=300)
 
+st.sidebar.header('Compare Runs')
+compare_filenames = st.sidebar.multiselect('Runs to compare (first is the reference)', csv_files)
+compare_mode = st.sidebar.radio('Comparison', ['Overlay', 'Difference from reference'], disabled=len(compare_filenames) < 2)
+
+# --- Run Comparison (runs aligned on elapsed time since their first sample) ---
+if len(compare_filenames) >= 2:
+    st.header('Run Comparison')
+    try:
+        labels = [os.path.splitext(name)[0] for name in compare_filenames]
+        compare_paths = [os.path.join(csv_directory, name) for name in compare_filenames]
+        compare_runs = get_compare_cache().get_many(compare_paths, get_compare_pool())
+        compare_keys = tuple(file_cache_key(path) for path in compare_paths)
+        show_difference = compare_mode == 'Difference from reference'
+        grid = common_grid(compare_runs, SPAN_OVERLAP if show_difference else SPAN_UNION)
+        for channel in COMPARE_CHANNELS:
+            aligned = align_runs(compare_runs, labels, channel, grid)
+            if show_difference: aligned = difference_from_reference(aligned)
+            st.subheader(f"{channel} - {labels[0]}" if show_difference else channel)
+            st.image(compare_plot_png(compare_keys, compare_mode, channel, PLOT_SIZE_IN, aligned), width="stretch")
+        st.subheader('Summary')
+        st.dataframe(summary_table(compare_runs, labels, battery_capacity_mah), width="stretch")
+    except Exception as e_compare:
+        st.error(f"Could not compare the selected runs: {e_compare}")
+
 if not csv_files:
     st.warning(f"No CSV files found in the directory: {csv_directory}")
 else:
     filepath = os.path.join(csv_directory, selected_filename)
 
     try:
-        df = pd.read_csv(filepath)
-        if 'Timestamp' in df.columns:
-            df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-            df = df.set_index('Timestamp')
-
-        df['Current (mA)'] = df['Current (A)'] * 1000
-        df['Power (mW)'] = df['Power (W)'] * 1000
-        # df['Energy (mWh)'] = df['Energy (Wh)'] * 1000 # Energy section commented out
-
+        plot_buckets = buckets_for_width(PLOT_WIDTH_IN)
         if plot_custom_duration and start_minute is not None and end_minute is not None:
-            start_time = df.index.min() + pd.Timedelta(minutes=start_minute)
-            end_time = df.index.min() + pd.Timedelta(minutes=end_minute)
-            df_filtered = df[(df.index >= start_time) & (df.index <= end_time)]
+            start_offset = pd.Timedelta(minutes=start_minute); end_offset = pd.Timedelta(minutes=end_minute)
+        else: start_offset = end_offset = None
+
+        if os.path.getsize(filepath) > OUT_OF_CORE_MIN_BYTES:
+            # Too large to parse whole: one chunked pass gives the window's statistics and plot series
+            file_stat = os.stat(filepath)
+            scan = scan_large_run(filepath, file_stat.st_mtime_ns, file_stat.st_size, start_offset, end_offset, plot_buckets)
+            has_data = scan['rows'] > 0; window = scan['stats']; plot_series = scan['plot']
         else:
-            df_filtered = df
+            df = get_run_cache().get(filepath) # Parsed once per file version; shared, do not modify in place
+
+            rollups = get_rollup_cache().get(filepath)
+
+            start_time = df.index.min() + start_offset if start_offset is not None else df.index.min()
+            end_time = df.index.min() + end_offset if end_offset is not None else df.index.max()
+            if df.index.is_monotonic_increasing: df_filtered = df.loc[start_time:end_time] # Binary search, no full-length mask
+            else: df_filtered = df[(df.index >= start_time) & (df.index <= end_time)]
+
+            has_data = not df_filtered.empty
+            if has_data:
+                # Window statistics from the rollup pyramid (raw samples only at the window edges)
+                window = window_stats(df, rollups, start_time, end_time)
+
+                # Plot series from the coarsest rollup level with enough buckets for the figure width,
+                # or min/max downsampling of the raw window when it is short
+                def window_plot_series(channel):
+                    series = rollup_plot_series(rollups, start_time, end_time, channel, plot_buckets)
+                    return series if series is not None else downsample_series(df_filtered[channel], plot_buckets)
+                plot_series = {channel: window_plot_series(channel) for channel in ('Voltage (V)', 'Current (mA)', 'Power (mW)')}
+
+        if has_data:
+            run_key = file_cache_key(filepath); window_key = (start_offset, end_offset)
+            voltage_stats, current_stats, power_stats = (
+                {agg: round(window[channel][agg], 3) for agg in ('max', 'min', 'mean')}
+                for channel in ('Voltage (V)', 'Current (mA)', 'Power (mW)'))
+            voltage_plot = plot_series['Voltage (V)']
+            current_plot = plot_series['Current (mA)']
+            power_plot = plot_series['Power (mW)']
 
-        if not df_filtered.empty:
             # --- Voltage Plot and Stats ---
             st.subheader('Voltage (V)')
-            fig_voltage, ax_voltage = plt.subplots(figsize=(12, 6)) # Increased figure size
-            ax_voltage.plot(df_filtered.index, df_filtered['Voltage (V)'])
-            ax_voltage.set_xlabel('Time')
-            ax_voltage.set_ylabel('Voltage (V)')
-            ax_voltage.grid(True)
-            st.pyplot(fig_voltage)
-            voltage_stats = df_filtered['Voltage (V)'].agg(['max', 'min', 'mean']).round(3)
+            st.image(channel_plot_png(run_key, window_key, 'Voltage (V)', PLOT_SIZE_IN, voltage_plot), width="stretch")
             st.write(f"Max Voltage: {voltage_stats['max']} V, Min Voltage: {voltage_stats['min']} V, Average Voltage: {voltage_stats['mean']} V")
 
             # --- Current Plot and Stats ---
             st.subheader('Current (mA)')
-            fig_current, ax_current = plt.subplots(figsize=(12, 6)) # Increased figure size
-            ax_current.plot(df_filtered.index, df_filtered['Current (mA)'])
-            ax_current.set_xlabel('Time')
-            ax_current.set_ylabel('Current (mA)')
-            ax_current.grid(True)
-            st.pyplot(fig_current)
-            current_stats = df_filtered['Current (mA)'].agg(['max', 'min', 'mean']).round(3)
+            st.image(channel_plot_png(run_key, window_key, 'Current (mA)', PLOT_SIZE_IN, current_plot), width="stretch")
             st.write(f"Max Current: {current_stats['max']} mA, Min Current: {current_stats['min']} mA, Average Current: {current_stats['mean']} mA")
 
             # --- Power Plot and Stats ---
             st.subheader('Power (mW)')
-            fig_power, ax_power = plt.subplots(figsize=(12, 6)) # Increased figure size
-            ax_power.plot(df_filtered.index, df_filtered['Power (mW)'])
-            ax_power.set_xlabel('Time')
-            ax_power.set_ylabel('Power (mW)')
-            ax_power.grid(True)
-            st.pyplot(fig_power)
-            power_stats = df_filtered['Power (mW)'].agg(['max', 'min', 'mean']).round(3)
+            st.image(channel_plot_png(run_key, window_key, 'Power (mW)', PLOT_SIZE_IN, power_plot), width="stretch")
             st.write(f"Max Power: {power_stats['max']} mW, Min Power: {power_stats['min']} mW, Average Power: {power_stats['mean']} mW")
 
             # --- YY Plot of Voltage and Current ---
             st.subheader('Voltage (V) and Current (mA) Over Time')
-            fig_yy, ax1 = plt.subplots(figsize=(12, 6))
-
-            color = 'tab:red'
-            ax1.set_xlabel('Time')
-            ax1.set_ylabel('Voltage (V)', color=color)
-            ax1.plot(df_filtered.index, df_filtered['Voltage (V)'], color=color)
-            ax1.tick_params(axis='y', labelcolor=color)
-
-            ax2 = ax1.twinx()  # instantiate a second axes that shares the same x-axis
-
-            color = 'tab:blue'
-            ax2.set_ylabel('Current (mA)', color=color)  # we already handled the x-label with ax1
-            ax2.plot(df_filtered.index, df_filtered['Current (mA)'], color=color, alpha=0.8) # Added alpha for opacity
-            ax2.tick_params(axis='y', labelcolor=color)
-
-            fig_yy.tight_layout()  # otherwise the right y-label might be slightly clipped
-            st.pyplot(fig_yy)
+            st.image(voltage_current_plot_png(run_key, window_key, PLOT_SIZE_IN, voltage_plot, current_plot), width="stretch")
 
             # --- Battery Life Estimation using Average Current ---
             st.sidebar.header('Battery Life Estimation (using Avg Current)')
             if st.sidebar.button('Estimate Battery Life'):
-                avg_current_ma = df_filtered['Current (mA)'].mean()
+                avg_current_ma = window['Current (mA)']['mean']
                 if avg_current_ma > 0:
                     battery_capacity_ah = battery_capacity_mah / 1000
                     avg_current_a = avg_current_ma / 1000
@@ -0,0 +1,116 @@
+"""Multi-resolution rollups ("pyramid") for fast time-window queries on long runs.
+
+For every run, each channel is aggregated into time buckets at several resolutions
+(ROLLUP_RESOLUTIONS_SEC). Every bucket stores min/max/sum/count. A window query is answered
+from the coarsest buckets that fit entirely inside the window, then recursively from finer
+levels toward the edges, and only the last partial second at each edge comes from the
+raw samples. The cost depends on the number of levels, not on the run length.
+
+Bucket starts are multiples of the resolution in int64 nanoseconds on the run's (local)
+Timestamp index.
+"""
+import numpy as np
+import pandas as pd
+
+from downsample import minmax_indices
+
+ROLLUP_RESOLUTIONS_SEC = [1, 10, 60, 600]
+ROLLUP_CHANNELS = ['Voltage (V)', 'Current (mA)', 'Power (mW)']
+ROLLUP_AGGS = ['min', 'max', 'sum', 'count']
+NS_PER_SEC = 1_000_000_000
+
+
+def index_ns(df):
+    """Timestamp index as int64 nanoseconds."""
+    return df.index.to_numpy(dtype='datetime64[ns]').astype('int64')
+
+
+def reduce_buckets(keys, columns):
+    """Groups consecutive equal keys and combines {(channel, agg): array} per group."""
+    starts = np.r_[0, np.flatnonzero(np.diff(keys)) + 1]
+    reducers = {'min': np.fmin, 'max': np.fmax, 'sum': np.add, 'count': np.add} # fmin/fmax skip NaN
+    combined = {(channel, agg): reducers[agg].reduceat(values, starts) for (channel, agg), values in columns.items()}
+    return keys[starts], combined
+
+
+def build_rollups(df, channels=ROLLUP_CHANNELS, resolutions=ROLLUP_RESOLUTIONS_SEC):
+    """Builds {resolution_sec: DataFrame indexed by bucket start ns, columns (channel, agg)}.
+    The finest level is built from the raw samples, each coarser level from the one below it."""
+    if not df.index.is_monotonic_increasing: df = df.sort_index()
+    t_ns = index_ns(df); columns = {}
+    for channel in channels:
+        values = df[channel].to_numpy(dtype='float64'); valid = ~np.isnan(values)
+        columns.update({(channel, 'min'): values, (channel, 'max'): values,
+                        (channel, 'sum'): np.where(valid, values, 0.0), (channel, 'count'): valid.astype('int64')})
+    rollups = {}; keys = t_ns
+    for res in sorted(resolutions):
+        if len(keys) == 0: rollups[res] = pd.DataFrame(columns=pd.MultiIndex.from_tuples(list(columns))); continue
+        res_ns = res * NS_PER_SEC
+        keys, columns = reduce_buckets(keys // res_ns * res_ns, columns)
+        rollups[res] = pd.DataFrame(columns, index=keys)
+    return rollups
+
+
+def cover_window(start_ns, end_ns, resolutions):
+    """Splits [start_ns, end_ns) into (resolution or None for raw, start, end) pieces,
+    using the coarsest aligned buckets in the middle and finer ones toward the edges."""
+    pieces = []
+    def cover(s, e, level):
+        if s >= e: return
+        if level == len(resolutions): pieces.append((None, s, e)); return
+        res_ns = resolutions[level] * NS_PER_SEC
+        first = -(-s // res_ns) * res_ns; last = e // res_ns * res_ns
+        if first >= last: cover(s, e, level + 1); return
+        pieces.append((resolutions[level], first, last))
+        cover(s, first, level + 1); cover(last, e, level + 1)
+    cover(start_ns, end_ns, 0)
+    return pieces
+
+
+def window_stats(df, rollups, start, end, channels=ROLLUP_CHANNELS):
+    """min/max/mean/sum/count per channel for start <= Timestamp <= end (None = run start/end)."""
+    t_ns = index_ns(df)
+    if len(t_ns) == 0: return {channel: {'min': np.nan, 'max': np.nan, 'mean': np.nan, 'sum': 0.0, 'count': 0} for channel in channels}
+    start_ns = t_ns[0] if start is None else pd.Timestamp(start).value
+    end_ns = (t_ns[-1] if end is None else pd.Timestamp(end).value) + 1 # Inclusive end
+    totals = {channel: {'min': np.inf, 'max': -np.inf, 'sum': 0.0, 'count': 0} for channel in channels}
+    for res, s, e in cover_window(start_ns, end_ns, sorted(rollups, reverse=True)):
+        if res is None:
+            lo, hi = np.searchsorted(t_ns, [s, e], side='left')
+            for channel in channels:
+                values = df[channel].to_numpy(dtype='float64')[lo:hi]; values = values[~np.isnan(values)]
+                if len(values): update_totals(totals[channel], values.min(), values.max(), values.sum(), len(values))
+        else:
+            level = rollups[res]; lo, hi = np.searchsorted(level.index.to_numpy(), [s, e], side='left')
+            if lo == hi: continue
+            rows = level.iloc[lo:hi]
+            for channel in channels:
+                update_totals(totals[channel], np.nanmin(rows[(channel, 'min')]), np.nanmax(rows[(channel, 'max')]),
+                              rows[(channel, 'sum')].sum(), int(rows[(channel, 'count')].sum()))
+    for stats in totals.values():
+        if stats['count'] == 0: stats['min'] = stats['max'] = stats['mean'] = np.nan
+        else: stats['mean'] = stats['sum'] / stats['count']
+    return totals
+
+
+def update_totals(totals, v_min, v_max, v_sum, v_count):
+    if v_count == 0: return
+    totals['min'] = min(totals['min'], v_min); totals['max'] = max(totals['max'], v_max)
+    totals['sum'] += v_sum; totals['count'] += v_count
+
+
+def rollup_plot_series(rollups, start, end, channel, n_buckets):
+    """Plot series (min/max per bucket, interleaved) from the coarsest level that still gives at
+    least n_buckets buckets in the window, min/max-downsampled to ~2*n_buckets points.
+    Returns None when even the finest level is too coarse; plot the raw samples then."""
+    start_ns = pd.Timestamp(start).value; end_ns = pd.Timestamp(end).value + 1
+    usable = [res for res in rollups if (end_ns - start_ns) / (res * NS_PER_SEC) >= n_buckets]
+    if not usable: return None
+    level = rollups[max(usable)]; bucket_starts = level.index.to_numpy()
+    lo = np.searchsorted(bucket_starts, start_ns // (max(usable) * NS_PER_SEC) * (max(usable) * NS_PER_SEC), side='left')
+    hi = np.searchsorted(bucket_starts, end_ns, side='left')
+    rows = level.iloc[lo:hi]
+    times = np.repeat(rows.index.to_numpy(), 2)
+    values = np.column_stack([rows[(channel, 'min')].to_numpy(), rows[(channel, 'max')].to_numpy()]).ravel()
+    series = pd.Series(values, index=pd.to_datetime(times))
+    return series.iloc[minmax_indices(values, n_buckets)]
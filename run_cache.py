@@ -0,0 +1,149 @@
+"""Parsed-run cache for the archive pages.
+
+A run file is parsed once into a typed, Timestamp-indexed DataFrame (with the derived
+mA/mW columns) and kept in an in-memory LRU under a byte budget. Entries are keyed by
+(path, mtime, size), so a rewritten file is parsed again. Optionally, parsed frames are
+also pickled to a local directory so a server restart does not re-parse every file; that
+directory is pruned least recently used first to stay under disk_max_bytes.
+"""
+import collections
+import hashlib
+import os
+import pickle
+import threading
+
+import pandas as pd
+
+from run_format import RUN_FILE_EXTENSION, MEASUREMENT_COLUMNS, PSU_READBACK_COLUMNS, load_run_frame
+
+DISK_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024 # Default budget of the on-disk layer
+
+
+def parse_run_file(filepath):
+    """Parses a CSV or .vrun run file into a Timestamp-indexed DataFrame with mA/mW columns."""
+    if filepath.endswith(RUN_FILE_EXTENSION):
+        df = load_run_frame(filepath) # Memory-mapped binary columns, no text parsing
+    else:
+        df = pd.read_csv(filepath)
+        if 'Timestamp' in df.columns:
+            df['Timestamp'] = pd.to_datetime(df['Timestamp'])
+            df = df.set_index('Timestamp')
+        for column in MEASUREMENT_COLUMNS + PSU_READBACK_COLUMNS: # 'N/A' / 'ERROR' rows become NaN
+            if column in df.columns: df[column] = pd.to_numeric(df[column], errors='coerce')
+    df['Current (mA)'] = df['Current (A)'] * 1000
+    df['Power (mW)'] = df['Power (W)'] * 1000
+    # df['Energy (mWh)'] = df['Energy (Wh)'] * 1000 # Energy section commented out
+    return df
+
+
+def value_nbytes(value):
+    """Approximate memory of a cached value: a DataFrame or a dict of DataFrames (e.g. rollups)."""
+    if isinstance(value, dict): return sum(value_nbytes(item) for item in value.values())
+    return int(value.memory_usage(deep=True, index=True).sum())
+
+
+def file_cache_key(filepath):
+    """Returns (absolute path, mtime_ns, size); changes whenever the file is rewritten."""
+    stat = os.stat(filepath)
+    return (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size)
+
+
+class RunCache:
+    """Thread-safe LRU of parsed runs, bounded by total DataFrame memory (max_bytes).
+
+    parser(filepath) may return a DataFrame or a dict of DataFrames derived from the file.
+    Values returned by get() are shared between sessions and must be treated as read-only.
+    """
+    def __init__(self, max_bytes, disk_dir=None, parser=parse_run_file, disk_max_bytes=DISK_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes; self.disk_dir = disk_dir; self.parser = parser; self.disk_max_bytes = disk_max_bytes
+        self.entries = collections.OrderedDict() # path -> (key, df, nbytes), most recent last
+        self.total_bytes = 0; self.lock = threading.Lock(); self.disk_lock = threading.Lock()
+        self.hits = 0; self.misses = 0; self.disk_hits = 0
+        if disk_dir: os.makedirs(disk_dir, exist_ok=True); self.prune_disk()
+
+    def get(self, filepath):
+        """Returns the parsed DataFrame for filepath, parsing it only if it is new or changed."""
+        key = file_cache_key(filepath); path = key[0]
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry and entry[0] == key:
+                self.entries.move_to_end(path); self.hits += 1
+                return entry[1]
+        df = self.load_from_disk(key)
+        if df is None:
+            df = self.parser(filepath); self.misses += 1
+            self.save_to_disk(key, df)
+        else: self.disk_hits += 1
+        self.put(key, df)
+        return df
+
+    def get_many(self, filepaths, executor=None):
+        """get() for several files; those neither in memory nor on disk are parsed concurrently on
+        executor (e.g. a ProcessPoolExecutor, in which case the parser must be picklable)."""
+        if executor is None: return [self.get(path) for path in filepaths]
+        pending = {}
+        for path in filepaths:
+            key = file_cache_key(path)
+            with self.lock: entry = self.entries.get(key[0])
+            if (entry and entry[0] == key) or key in pending: continue
+            df = self.load_from_disk(key)
+            if df is not None: self.disk_hits += 1; self.put(key, df); continue
+            pending[key] = executor.submit(self.parser, path)
+        for key, future in pending.items():
+            df = future.result(); self.misses += 1
+            self.save_to_disk(key, df); self.put(key, df)
+        return [self.get(path) for path in filepaths] # Memory hits now, unless the budget evicted them
+
+    def put(self, key, df):
+        nbytes = value_nbytes(df)
+        with self.lock:
+            old = self.entries.pop(key[0], None)
+            if old: self.total_bytes -= old[2]
+            if nbytes > self.max_bytes: return # Too large to keep; caller still gets the frame
+            self.entries[key[0]] = (key, df, nbytes); self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes:
+                _, (_, _, evicted_bytes) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_bytes
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.total_bytes, 'hits': self.hits,
+                    'misses': self.misses, 'disk_hits': self.disk_hits}
+
+    # --- Optional on-disk layer (one pickle per source path, overwritten when stale, file mtime = last use) ---
+    def disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha1(key[0].encode('utf-8')).hexdigest() + '.pkl')
+
+    def load_from_disk(self, key):
+        if not self.disk_dir: return None
+        try:
+            with open(self.disk_path(key), 'rb') as cache_file: cached_key, df = pickle.load(cache_file)
+        except FileNotFoundError: return None
+        except Exception as e: print(f"Run cache read error for {key[0]}: {e}"); return None
+        if tuple(cached_key) != key: return None
+        try: os.utime(self.disk_path(key)) # Mark as recently used for prune_disk()
+        except OSError: pass
+        return df
+
+    def save_to_disk(self, key, df):
+        if not self.disk_dir: return
+        temp_path = self.disk_path(key) + '.tmp'
+        try:
+            with open(temp_path, 'wb') as cache_file: pickle.dump((key, df), cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.disk_path(key))
+        except OSError as e: print(f"Run cache write error for {key[0]}: {e}")
+        self.prune_disk()
+
+    def prune_disk(self):
+        """Deletes the least recently used pickles until the directory is within disk_max_bytes."""
+        if not self.disk_dir or self.disk_max_bytes is None: return
+        with self.disk_lock:
+            try: files = [(entry.stat().st_mtime_ns, entry.stat().st_size, entry.path) for entry in os.scandir(self.disk_dir)
+                          if entry.name.endswith('.pkl')]
+            except OSError as e: print(f"Run cache prune error: {e}"); return
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.disk_max_bytes: break
+                try: os.remove(path); total -= size
+                except FileNotFoundError: total -= size
+                except OSError as e: print(f"Run cache prune error for {path}: {e}")
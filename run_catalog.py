@@ -0,0 +1,149 @@
+"""Run catalog: one row per recorded run with its settings and per-channel aggregates.
+
+Stored in the 'runs' table of the VOLT/RUNNER SQLite database so the archive page can list,
+filter and sort runs without opening their files. Measurement.py records each run when it
+ends; backfill_catalog() (or 'python run_catalog.py') covers files recorded before that.
+"""
+import argparse
+import contextlib
+import datetime
+import os
+import sqlite3
+
+import pandas as pd
+
+from run_format import RUN_FILE_EXTENSION
+from run_cache import parse_run_file
+from online_stats import SECONDS_PER_HOUR, integrate_trapezoid
+from live_db import DB_FILE
+
+# The catalog always lives in the live database (relative to the working directory), whichever run
+# directory it catalogs: Measurement.py records to csv/, the archive page scans ../csv, both use this file.
+DEFAULT_DB_FILE = DB_FILE
+DEFAULT_CSV_DIR = "csv"
+CATALOG_CHANNELS = {'voltage': 'Voltage (V)', 'current': 'Current (A)', 'power': 'Power (W)'}
+CATALOG_AGGS = ('min', 'max', 'mean', 'std')
+CATALOG_COLUMNS = [
+    ('run_name', 'TEXT PRIMARY KEY'), # File name without extension (CSV and .vrun share it)
+    ('file_name', 'TEXT'), ('file_mtime_ns', 'INTEGER'), ('file_size', 'INTEGER'),
+    ('started_at', 'TEXT'), ('ended_at', 'TEXT'), ('duration_s', 'REAL'),
+    ('set_voltage', 'REAL'), ('set_current_limit', 'REAL'), ('set_duration_s', 'REAL'),
+    ('psu_idn', 'TEXT'), ('final_status', 'TEXT'),
+    ('row_count', 'INTEGER'), ('valid_rows', 'INTEGER'),
+] + [(f"{channel}_{agg}", 'REAL') for channel in CATALOG_CHANNELS for agg in CATALOG_AGGS] + [
+    ('energy_wh', 'REAL'), # Meter's cumulative energy counter at the end of the run
+    ('charge_mah', 'REAL'), ('energy_integrated_wh', 'REAL'), # Trapezoidal integrals of current and power
+    ('battery_capacity_mah', 'REAL'), ('battery_life_h', 'REAL'), # Projection at the run's mean current
+]
+CATALOG_COLUMN_NAMES = [name for name, _ in CATALOG_COLUMNS]
+
+
+def init_catalog(db_file=DEFAULT_DB_FILE):
+    """Creates the runs table if it doesn't exist, and adds columns introduced since it was created."""
+    with contextlib.closing(sqlite3.connect(db_file, timeout=10)) as db:
+        with db:
+            db.execute(f"CREATE TABLE IF NOT EXISTS runs ({', '.join(f'{name} {kind}' for name, kind in CATALOG_COLUMNS)})")
+            existing = {row[1] for row in db.execute("PRAGMA table_info(runs)")}
+            for name, kind in CATALOG_COLUMNS:
+                if name not in existing: db.execute(f"ALTER TABLE runs ADD COLUMN {name} {kind}")
+
+
+def compute_run_summary(df):
+    """Row counts, time span, min/max/mean/std per channel and charge/energy integrals for a parsed run (see parse_run_file)."""
+    summary = {'row_count': len(df), 'valid_rows': int(df[['Voltage (V)', 'Current (A)']].notna().all(axis=1).sum())}
+    if len(df):
+        summary['started_at'] = str(df.index.min()); summary['ended_at'] = str(df.index.max())
+        summary['duration_s'] = (df.index.max() - df.index.min()).total_seconds()
+    for channel, column in CATALOG_CHANNELS.items():
+        stats = df[column].agg(list(CATALOG_AGGS))
+        for agg in CATALOG_AGGS:
+            summary[f"{channel}_{agg}"] = None if pd.isna(stats[agg]) else float(stats[agg])
+    energy = df['Energy (Wh)'].dropna()
+    summary['energy_wh'] = float(energy.iloc[-1]) if len(energy) else None # Meter energy counter is cumulative
+    elapsed = df['Elapsed Time (s)']
+    summary['charge_mah'] = integrate_trapezoid(elapsed, df['Current (A)']) / SECONDS_PER_HOUR * 1000
+    summary['energy_integrated_wh'] = integrate_trapezoid(elapsed, df['Power (W)']) / SECONDS_PER_HOUR
+    return summary
+
+
+def local_time_str(epoch):
+    """Epoch seconds as the local, millisecond Timestamp string compute_run_summary gets from the CSV."""
+    return str(pd.Timestamp(datetime.datetime.fromtimestamp(epoch)).floor('ms'))
+
+
+def summary_from_online_stats(stats):
+    """Catalog fields from a LiveRunStats snapshot, so a finished run is recorded without parsing its file."""
+    summary = {'row_count': stats['samples'], 'valid_rows': stats['valid_samples'], 'energy_wh': stats['meter_energy_wh'],
+               'charge_mah': stats['charge_mah'], 'energy_integrated_wh': stats['energy_integrated_wh'],
+               'battery_capacity_mah': stats['battery_capacity_mah'], 'battery_life_h': stats['battery_life_h']}
+    if stats['samples']:
+        summary.update({'started_at': local_time_str(stats['first_epoch']), 'ended_at': local_time_str(stats['last_epoch']),
+                        'duration_s': stats['elapsed_s']})
+    for channel in CATALOG_CHANNELS:
+        for agg in CATALOG_AGGS: summary[f"{channel}_{agg}"] = stats[channel][agg]
+    return summary
+
+
+def summarize_run_file(filepath):
+    """Parses a run file and returns its catalog entry (without run settings)."""
+    stat = os.stat(filepath)
+    entry = compute_run_summary(parse_run_file(filepath))
+    entry.update({'run_name': os.path.splitext(os.path.basename(filepath))[0], 'file_name': os.path.basename(filepath),
+                  'file_mtime_ns': stat.st_mtime_ns, 'file_size': stat.st_size})
+    return entry
+
+
+def record_run(entry, db_file=DEFAULT_DB_FILE):
+    """Inserts or updates a catalog entry. Fields missing/None in entry keep their stored value."""
+    values = [entry.get(name) for name in CATALOG_COLUMN_NAMES]
+    updates = ', '.join(f"{name} = COALESCE(excluded.{name}, runs.{name})" for name in CATALOG_COLUMN_NAMES[1:])
+    with contextlib.closing(sqlite3.connect(db_file, timeout=10)) as db:
+        with db:
+            db.execute(f"INSERT INTO runs ({', '.join(CATALOG_COLUMN_NAMES)}) VALUES ({', '.join('?' * len(values))}) "
+                       f"ON CONFLICT(run_name) DO UPDATE SET {updates}", values)
+
+
+def list_runs(db_file=DEFAULT_DB_FILE):
+    """Returns the whole catalog as a DataFrame, newest run first."""
+    with contextlib.closing(sqlite3.connect(db_file, timeout=10)) as db:
+        return pd.read_sql_query("SELECT * FROM runs ORDER BY started_at DESC", db)
+
+
+def find_run_files(csv_dir):
+    """Maps run name -> file name for a directory; a .vrun wins over the CSV it was converted from."""
+    run_files = {}
+    for name in sorted(os.listdir(csv_dir)):
+        stem, ext = os.path.splitext(name)
+        if ext == RUN_FILE_EXTENSION or (ext == '.csv' and stem not in run_files): run_files[stem] = name
+    return run_files
+
+
+def backfill_catalog(csv_dir=DEFAULT_CSV_DIR, db_file=DEFAULT_DB_FILE, executor=None, force=False):
+    """Adds or refreshes catalog entries for new or changed run files (all files if force). Returns (updated, skipped, failed).
+    With an executor (e.g. a ProcessPoolExecutor) files are summarized concurrently; the catalog is written here."""
+    init_catalog(db_file)
+    with contextlib.closing(sqlite3.connect(db_file, timeout=10)) as db:
+        known = {row[0]: row[1:] for row in db.execute("SELECT run_name, file_name, file_mtime_ns, file_size FROM runs")}
+    stale = []; skipped = 0
+    for run_name, file_name in find_run_files(csv_dir).items():
+        filepath = os.path.join(csv_dir, file_name); stat = os.stat(filepath)
+        if not force and known.get(run_name) == (file_name, stat.st_mtime_ns, stat.st_size): skipped += 1; continue
+        stale.append(filepath)
+    futures = {filepath: executor.submit(summarize_run_file, filepath) for filepath in stale} if executor else {}
+    updated = failed = 0
+    for filepath in stale:
+        try: record_run(futures[filepath].result() if executor else summarize_run_file(filepath), db_file); updated += 1
+        except Exception as e: print(f"Catalog backfill error for {filepath}: {e}"); failed += 1
+    return updated, skipped, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill the VOLT/RUNNER run catalog from recorded run files.")
+    parser.add_argument('--csv-dir', default=DEFAULT_CSV_DIR); parser.add_argument('--db', default=DEFAULT_DB_FILE)
+    args = parser.parse_args()
+    updated, skipped, failed = backfill_catalog(args.csv_dir, args.db)
+    print(f"Catalog backfill: {updated} updated, {skipped} unchanged, {failed} failed.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Cross-run comparison for the archive page.
+
+Each selected run is reduced to its elapsed-time axis (seconds from its first sample) plus the
+plotted channels and its catalog-style summary. Runs are loaded in worker processes (see
+RunCache.get_many), then resampled onto one common elapsed-time grid with np.interp, so they
+can be overlaid or subtracted point by point regardless of their start times and sample rates.
+"""
+import numpy as np
+import pandas as pd
+
+from run_cache import parse_run_file
+from run_catalog import compute_run_summary
+from online_stats import battery_life_hours
+
+COMPARE_CHANNELS = ['Voltage (V)', 'Current (mA)', 'Power (mW)']
+COMPARE_MAX_GRID_POINTS = 200_000 # Caps grid memory: runs x channels x points float64
+SPAN_UNION = 'union' # Grid covers the longest run; shorter runs are NaN past their end (overlay)
+SPAN_OVERLAP = 'overlap' # Grid covers the shortest run, where every run has data (differences)
+SUMMARY_ROWS = {'Duration (s)': 'duration_s', 'Rows': 'row_count', 'Valid rows': 'valid_rows',
+                'Voltage min (V)': 'voltage_min', 'Voltage max (V)': 'voltage_max', 'Voltage mean (V)': 'voltage_mean', 'Voltage std (V)': 'voltage_std',
+                'Current min (A)': 'current_min', 'Current max (A)': 'current_max', 'Current mean (A)': 'current_mean', 'Current std (A)': 'current_std',
+                'Power mean (W)': 'power_mean', 'Power max (W)': 'power_max', 'Meter energy (Wh)': 'energy_wh',
+                'Integrated energy (Wh)': 'energy_integrated_wh', 'Charge (mAh)': 'charge_mah'}
+
+
+def load_compare_run(filepath):
+    """Parses a run file into {'series': elapsed-indexed channels, 'summary': one-row summary}.
+    Module-level (picklable) so it can run in a process pool."""
+    df = parse_run_file(filepath)
+    if 'Elapsed Time (s)' in df.columns: elapsed = df['Elapsed Time (s)'].to_numpy(dtype='float64')
+    else: elapsed = (df.index - df.index.min()).total_seconds().to_numpy()
+    elapsed = elapsed - elapsed[0] if len(elapsed) else elapsed
+    series = pd.DataFrame({channel: df[channel].to_numpy(dtype='float64') for channel in COMPARE_CHANNELS},
+                          index=pd.Index(elapsed, name='Elapsed Time (s)'))
+    if not series.index.is_monotonic_increasing: series = series.sort_index(kind='stable')
+    return {'series': series, 'summary': pd.DataFrame([compute_run_summary(df)])}
+
+
+def common_grid(runs, span=SPAN_UNION, step=None, max_points=COMPARE_MAX_GRID_POINTS):
+    """Elapsed-time grid shared by all runs. The default step is the finest median sample interval
+    of the runs, widened if the grid would exceed max_points."""
+    ends = [run['series'].index[-1] for run in runs if len(run['series'])]
+    if not ends: return np.zeros(0)
+    end = max(ends) if span == SPAN_UNION else min(ends)
+    if step is None:
+        intervals = [np.median(np.diff(run['series'].index)) for run in runs if len(run['series']) > 1]
+        step = min(intervals) if intervals else end
+    step = max(step, end / max_points) if end > 0 else 1.0
+    return np.arange(0.0, end + step / 2, step)
+
+
+def resample(series, grid):
+    """Linear interpolation of one channel onto grid; NaN samples are skipped, NaN outside the run."""
+    values = series.to_numpy(dtype='float64'); elapsed = series.index.to_numpy(dtype='float64')
+    valid = ~np.isnan(values)
+    if valid.sum() < 2: return np.full(len(grid), np.nan)
+    return np.interp(grid, elapsed[valid], values[valid], left=np.nan, right=np.nan)
+
+
+def align_runs(runs, labels, channel, grid):
+    """One channel of every run on the common grid: DataFrame indexed by elapsed seconds, one column per run."""
+    return pd.DataFrame({label: resample(run['series'][channel], grid) for label, run in zip(labels, runs)},
+                        index=pd.Index(grid, name='Elapsed Time (s)'))
+
+
+def difference_from_reference(aligned):
+    """Subtracts the first column (the reference run) from the others."""
+    return aligned.iloc[:, 1:].sub(aligned.iloc[:, 0], axis=0)
+
+
+def summary_table(runs, labels, battery_capacity_mah=None):
+    """Side-by-side summary: one row per statistic, one column per run."""
+    table = {}
+    for label, run in zip(labels, runs):
+        summary = run['summary'].iloc[0]
+        column = {row: summary.get(key) for row, key in SUMMARY_ROWS.items()}
+        column['Battery life (h)'] = battery_life_hours(battery_capacity_mah, summary.get('charge_mah') or 0, summary.get('duration_s') or 0)
+        table[label] = column
+    return pd.DataFrame(table)
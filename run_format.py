@@ -0,0 +1,181 @@
+"""VOLT/RUNNER binary run format (.vrun).
+
+Layout: an 8-byte magic, a little-endian uint32 header length, a UTF-8 JSON header,
+space padding up to a 64-byte boundary, then each column stored contiguously
+(column-major) as fixed-width little-endian values. The header lists every column's
+name, dtype and byte offset, so any column (or a slice of it) can be memory-mapped
+without reading the rest of the file.
+
+Times are stored as true epoch seconds ('Epoch Time (s)'); 'utc_offset_sec' in the
+header converts them back to the local wall-clock time the CSV files use.
+
+Usage: python run_format.py [csv files or directories ...] [--force]
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import struct
+
+import numpy as np
+import pandas as pd
+
+RUN_FILE_EXTENSION = '.vrun'
+RUN_FILE_MAGIC = b'VRUN\x00\x01\x00\x00'
+RUN_FORMAT_VERSION = 1
+HEADER_ALIGNMENT = 64
+TIME_COLUMN = 'Epoch Time (s)'
+FLAG_COLUMN = 'Sample Flag'
+FLAG_OK = 0; FLAG_MISSING = 1; FLAG_ERROR = 2 # CSV value, 'N/A', 'ERROR'
+# Wider dtypes first so every column starts 8-byte aligned
+RUN_COLUMNS = [
+    (TIME_COLUMN, '<f8'),
+    ('Elapsed Time (s)', '<f8'),
+    ('Voltage (V)', '<f4'),
+    ('Current (A)', '<f4'),
+    ('Power (W)', '<f4'),
+    ('Energy (Wh)', '<f4'),
+    (FLAG_COLUMN, 'u1'),
+]
+MEASUREMENT_COLUMNS = ['Voltage (V)', 'Current (A)', 'Power (W)', 'Energy (Wh)']
+PSU_READBACK_COLUMNS = ['PSU Voltage (V)', 'PSU Current (A)'] # Optional per-sample PSU MEAS:VOLT?/CURR? readback
+
+
+def run_file_columns(psu_readback=False):
+    """RUN_COLUMNS, plus the PSU readback columns (before the 1-byte flag, keeping the float columns aligned)."""
+    if not psu_readback: return RUN_COLUMNS
+    return RUN_COLUMNS[:-1] + [(name, '<f4') for name in PSU_READBACK_COLUMNS] + RUN_COLUMNS[-1:]
+
+
+def local_utc_offset_sec(when=None):
+    """Returns the local UTC offset in seconds at the given datetime (default: now)."""
+    when = when or datetime.datetime.now()
+    return when.astimezone().utcoffset().total_seconds()
+
+
+class RunFileWriter:
+    """Appends rows to per-column part files and assembles the .vrun file on close().
+
+    Memory use stays bounded by the batch size, so it can run alongside a capture of any length.
+    """
+    def __init__(self, path, columns=RUN_COLUMNS, utc_offset_sec=None, metadata=None):
+        self.path = path; self.columns = columns; self.row_count = 0
+        self.utc_offset_sec = local_utc_offset_sec() if utc_offset_sec is None else utc_offset_sec
+        self.metadata = metadata or {}
+        self.part_files = [open(f"{path}.{index}.part", 'wb') for index in range(len(columns))]
+
+    def append(self, column_values):
+        """Appends a batch given as {column name: sequence}; all sequences must have the same length."""
+        lengths = {len(column_values[name]) for name, _ in self.columns}
+        if len(lengths) != 1: raise ValueError(f"Column lengths differ: {lengths}")
+        for (name, dtype), part_file in zip(self.columns, self.part_files):
+            np.asarray(column_values[name], dtype=dtype).tofile(part_file)
+        self.row_count += lengths.pop()
+
+    def close(self):
+        """Writes header + columns to a temp file, then atomically replaces self.path."""
+        for part_file in self.part_files: part_file.close()
+        column_entries = []; offset = 0
+        for name, dtype in self.columns:
+            column_entries.append({'name': name, 'dtype': dtype, 'offset': offset})
+            offset += self.row_count * np.dtype(dtype).itemsize
+        header = {'version': RUN_FORMAT_VERSION, 'row_count': self.row_count, 'utc_offset_sec': self.utc_offset_sec,
+                  'columns': column_entries, 'metadata': self.metadata}
+        header_bytes = json.dumps(header).encode('utf-8')
+        prefix_len = len(RUN_FILE_MAGIC) + 4 + len(header_bytes)
+        padding = -prefix_len % HEADER_ALIGNMENT
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'wb') as out_file:
+            out_file.write(RUN_FILE_MAGIC); out_file.write(struct.pack('<I', len(header_bytes) + padding))
+            out_file.write(header_bytes); out_file.write(b' ' * padding) # JSON tolerates trailing spaces
+            for index in range(len(self.columns)):
+                with open(f"{self.path}.{index}.part", 'rb') as part_file: shutil.copyfileobj(part_file, out_file)
+        os.replace(temp_path, self.path)
+        for index in range(len(self.columns)): os.remove(f"{self.path}.{index}.part")
+
+
+def read_run_header(path):
+    """Reads the JSON header. Adds 'data_offset' (absolute byte offset of the first column)."""
+    with open(path, 'rb') as run_file:
+        if run_file.read(len(RUN_FILE_MAGIC)) != RUN_FILE_MAGIC: raise ValueError(f"Not a VOLT/RUNNER run file: {path}")
+        (header_len,) = struct.unpack('<I', run_file.read(4))
+        header = json.loads(run_file.read(header_len).decode('utf-8'))
+    header['data_offset'] = len(RUN_FILE_MAGIC) + 4 + header_len
+    return header
+
+
+def open_run(path):
+    """Memory-maps every column. Returns (header, {column name: read-only array})."""
+    header = read_run_header(path); row_count = header['row_count']; arrays = {}
+    for column in header['columns']:
+        if row_count == 0: arrays[column['name']] = np.empty(0, dtype=column['dtype']); continue
+        arrays[column['name']] = np.memmap(path, dtype=column['dtype'], mode='r',
+                                           offset=header['data_offset'] + column['offset'], shape=(row_count,))
+    return header, arrays
+
+
+def load_run_frame(path, start_epoch=None, end_epoch=None, columns=None):
+    """Loads a run (optionally only [start_epoch, end_epoch] and some columns) as a DataFrame
+    indexed by local 'Timestamp', matching what the CSV readers produce. Only the selected
+    slice of each memory-mapped column is read. Values are widened to float64 like the CSV readers'."""
+    header, arrays = open_run(path)
+    epoch = arrays[TIME_COLUMN]
+    start = 0 if start_epoch is None else int(np.searchsorted(epoch, start_epoch, side='left'))
+    stop = len(epoch) if end_epoch is None else int(np.searchsorted(epoch, end_epoch, side='right'))
+    names = [name for name in arrays if name not in (TIME_COLUMN, FLAG_COLUMN)] if columns is None else columns
+    df = pd.DataFrame({name: np.asarray(arrays[name][start:stop], dtype='float64') for name in names})
+    df.index = pd.to_datetime(epoch[start:stop] + header['utc_offset_sec'], unit='s')
+    df.index.name = 'Timestamp'
+    return df
+
+
+def convert_csv_to_run(csv_path, run_path=None):
+    """Converts a capture CSV to a .vrun file next to it. Returns the output path."""
+    run_path = run_path or os.path.splitext(csv_path)[0] + RUN_FILE_EXTENSION
+    df = pd.read_csv(csv_path, dtype=str)
+    timestamps = pd.to_datetime(df['Timestamp'], errors='coerce')
+    df = df[timestamps.notna()]; timestamps = timestamps[timestamps.notna()]
+    utc_offset_sec = local_utc_offset_sec(timestamps.iloc[0].to_pydatetime()) if len(timestamps) else local_utc_offset_sec()
+    column_values = {TIME_COLUMN: (timestamps - pd.Timestamp(0)).dt.total_seconds().to_numpy() - utc_offset_sec,
+                     'Elapsed Time (s)': pd.to_numeric(df['Elapsed Time (s)'], errors='coerce').to_numpy()}
+    flags = np.full(len(df), FLAG_OK, dtype='u1')
+    psu_readback = all(name in df.columns for name in PSU_READBACK_COLUMNS)
+    for name in MEASUREMENT_COLUMNS + (PSU_READBACK_COLUMNS if psu_readback else []):
+        raw = df[name] if name in df.columns else pd.Series(['N/A'] * len(df), index=df.index)
+        values = pd.to_numeric(raw, errors='coerce')
+        flags[values.isna().to_numpy()] = FLAG_MISSING
+        column_values[name] = values.to_numpy()
+    flags[(df['Voltage (V)'] == 'ERROR').to_numpy()] = FLAG_ERROR # Error rows have every value set to 'ERROR'
+    column_values[FLAG_COLUMN] = flags
+    writer = RunFileWriter(run_path, run_file_columns(psu_readback), utc_offset_sec, metadata={'source': os.path.basename(csv_path)})
+    writer.append(column_values); writer.close()
+    return run_path
+
+
+def find_csv_files(paths):
+    """Expands directories to the CSV files they contain."""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.csv'): yield os.path.join(path, name)
+        else: yield path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert VOLT/RUNNER capture CSVs to the binary .vrun format.")
+    parser.add_argument('paths', nargs='*', default=['csv'], help="CSV files or directories (default: csv)")
+    parser.add_argument('--force', action='store_true', help="Reconvert even if the .vrun file is up to date")
+    args = parser.parse_args()
+    for csv_path in find_csv_files(args.paths):
+        run_path = os.path.splitext(csv_path)[0] + RUN_FILE_EXTENSION
+        if not args.force and os.path.exists(run_path) and os.path.getmtime(run_path) >= os.path.getmtime(csv_path):
+            print(f"Up to date: {run_path}"); continue
+        try:
+            convert_csv_to_run(csv_path, run_path)
+            print(f"Converted: {csv_path} -> {run_path} ({os.path.getsize(csv_path)} -> {os.path.getsize(run_path)} bytes)")
+        except Exception as e: print(f"Error converting {csv_path}: {e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Multi-rig test scheduler.
+
+Test jobs are queued with their own rig id, port pair and settings. A dispatcher thread
+starts every pending job whose rig and ports are free (up to MAX_CONCURRENT_RIGS at once),
+so independent PSU/meter pairs run concurrently while jobs for the same rig run in order.
+One scheduler exists per server process (get_scheduler()), so every browser session sees
+the same queue and can stop any rig.
+"""
+import itertools
+import threading
+import time
+
+from acquisition import run_measurement_test_db
+from live_db import ensure_rig_status, get_all_status, update_status_many
+
+MAX_CONCURRENT_RIGS = 8
+JOB_PENDING = "Pending"; JOB_RUNNING = "Running"; JOB_DONE = "Done"; JOB_CANCELLED = "Cancelled"
+
+
+class TestJob:
+    """One queued test run on a rig."""
+    def __init__(self, job_id, rig_id, psu_port, meter_port, voltage, current_limit, duration, options):
+        self.job_id = job_id; self.rig_id = rig_id; self.psu_port = psu_port; self.meter_port = meter_port
+        self.voltage = voltage; self.current_limit = current_limit; self.duration = duration
+        self.options = options # Extra keyword arguments for run_measurement_test_db
+        self.state = JOB_PENDING; self.stop_event = threading.Event(); self.thread = None
+        self.queued_at = time.time(); self.started_at = None
+
+    def resources(self):
+        return {('rig', self.rig_id), ('port', self.psu_port), ('port', self.meter_port)}
+
+    def as_dict(self):
+        return {'Job': self.job_id, 'Rig': self.rig_id, 'State': self.state, 'PSU Port': self.psu_port,
+                'Meter Port': self.meter_port, 'Voltage (V)': self.voltage, 'Current Limit (A)': self.current_limit,
+                'Duration (s)': self.duration}
+
+
+class RigScheduler:
+    """Queue of TestJobs dispatched to one worker thread per running rig."""
+    def __init__(self, max_concurrent=MAX_CONCURRENT_RIGS, runner=run_measurement_test_db):
+        self.max_concurrent = max_concurrent; self.runner = runner
+        self.jobs = []; self.job_ids = itertools.count(1)
+        self.version = 0 # Bumped on every queue change, so viewers can tell when to redraw the queue
+        self.condition = threading.Condition()
+        self.reset_stale_rigs()
+        self.dispatcher = threading.Thread(target=self.dispatch_loop, daemon=True, name="rig-dispatcher")
+        self.dispatcher.start()
+
+    @staticmethod
+    def reset_stale_rigs():
+        """Rigs still marked running in the DB belong to a previous server process."""
+        for rig_id, status in get_all_status().items():
+            if status.get('is_running') == '1':
+                update_status_many(rig_id, {'is_running': '0', 'status_text': 'Interrupted', 'remaining_time': '0'})
+
+    def add_job(self, rig_id, psu_port, meter_port, voltage, current_limit, duration, **options):
+        """Queues a job and returns its id; it starts as soon as its rig and ports are free."""
+        ensure_rig_status(rig_id)
+        with self.condition:
+            job = TestJob(next(self.job_ids), rig_id, psu_port, meter_port, voltage, current_limit, duration, options)
+            self.jobs.append(job); self.version += 1; self.condition.notify()
+        print(f"SCHEDULER: Queued job {job.job_id} on {rig_id}")
+        return job.job_id
+
+    def cancel_job(self, job_id):
+        """Removes a pending job, or signals a running one to stop."""
+        with self.condition:
+            for job in self.jobs:
+                if job.job_id != job_id: continue
+                if job.state == JOB_PENDING: job.state = JOB_CANCELLED
+                elif job.state == JOB_RUNNING: job.stop_event.set(); update_status_many(job.rig_id, {'status_text': 'Stopping...'})
+                self.version += 1; self.condition.notify()
+
+    def stop_rig(self, rig_id):
+        """Stops the job running on a rig (pending jobs for it stay queued)."""
+        with self.condition:
+            for job in self.jobs:
+                if job.rig_id == rig_id and job.state == JOB_RUNNING: self.cancel_job(job.job_id)
+
+    def snapshot(self):
+        """Pending and running jobs, in queue order, as dicts for display."""
+        with self.condition:
+            return [job.as_dict() for job in self.jobs if job.state in (JOB_PENDING, JOB_RUNNING)]
+
+    def running_rigs(self):
+        with self.condition:
+            return {job.rig_id for job in self.jobs if job.state == JOB_RUNNING}
+
+    # --- Dispatcher ---
+    def dispatch_loop(self):
+        while True:
+            with self.condition:
+                self.jobs = [job for job in self.jobs if job.state in (JOB_PENDING, JOB_RUNNING)]
+                busy = set().union(*(job.resources() for job in self.jobs if job.state == JOB_RUNNING))
+                running = sum(job.state == JOB_RUNNING for job in self.jobs)
+                for job in self.jobs:
+                    if running >= self.max_concurrent: break
+                    if job.state != JOB_PENDING or job.resources() & busy:
+                        busy |= job.resources() # Keep queue order per rig/port
+                        continue
+                    self.start_job(job); busy |= job.resources(); running += 1
+                self.condition.wait(timeout=1.0)
+
+    def start_job(self, job):
+        job.state = JOB_RUNNING; job.started_at = time.time(); self.version += 1
+        update_status_many(job.rig_id, {'is_running': '1', 'status_text': 'Starting...', 'last_error': '', 'plot_ready': '0',
+                                        'current_csv_filename': '', 'timing_metrics': '', 'live_run_id': '', 'live_stats': '', 'duration': job.duration,
+                                        'psu_port': job.psu_port, 'meter_port': job.meter_port})
+        job.thread = threading.Thread(target=self.run_job, args=(job,), daemon=True, name=f"rig-{job.rig_id}")
+        job.thread.start(); print(f"SCHEDULER: Started job {job.job_id} on {job.rig_id}")
+
+    def run_job(self, job):
+        try:
+            self.runner(job.psu_port, job.meter_port, job.voltage, job.current_limit, job.duration, job.stop_event,
+                        rig_id=job.rig_id, **job.options)
+        except Exception as e: # Raised before the runner could publish a final status; don't leave the rig 'Starting...'
+            print(f"SCHEDULER: Job {job.job_id} on {job.rig_id} failed: {type(e).__name__}: {e}")
+            update_status_many(job.rig_id, {'is_running': '0', 'status_text': 'Error', 'remaining_time': '0', 'last_error': f"{type(e).__name__}: {e}"})
+            raise
+        finally:
+            with self.condition: job.state = JOB_DONE; self.version += 1; self.condition.notify()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Returns the process-wide scheduler, creating it on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None: _scheduler = RigScheduler()
+        return _scheduler
@@ -0,0 +1,239 @@
+"""In-process simulated PSU and power meter speaking the SCPI subset VOLT/RUNNER uses.
+
+Use a port of the form 'sim://<bench>?option=value&...' for the PSU and/or meter in the
+Measurement page (or in run_measurement_test_db) to run without hardware. A PSU and a meter
+with the same <bench> name share one simulated load, so the meter reads what the PSU drives.
+
+Options (meter and PSU): latency_ms (per response, default 5), jitter_ms (default 1),
+noise (relative Gaussian noise on readings, default 0.002), load_ohms (default 37),
+drop_rate (probability that a query gets no response), garble_rate (probability of a
+non-numeric response), fail_after (raise a port error after this many commands).
+Meter only: baud (responses also take 10 bits per byte at this rate; 0 = instant transfer).
+
+The meter also keeps an internal log (see meter_log.py for the command set): after
+:LOG:STARt it records a sample every :LOG:INTerval seconds on its own clock, and
+:LOG:DATA? start,count returns those records as one comma-separated line.
+"""
+import random
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+import serial # pyvisa is imported by SimulatedPsu's error paths only (see acquisition.py)
+
+SIM_PORT_PREFIX = "sim://"
+DEFAULT_SIM_OPTIONS = {'latency_ms': 5.0, 'jitter_ms': 1.0, 'noise': 0.002, 'load_ohms': 37.0,
+                       'drop_rate': 0.0, 'garble_rate': 0.0, 'fail_after': 0, 'baud': 0}
+
+
+def is_simulated_port(port):
+    return str(port).startswith(SIM_PORT_PREFIX)
+
+
+def parse_sim_port(port):
+    """'sim://bench1?latency_ms=2' -> ('bench1', {options})."""
+    parsed = urllib.parse.urlparse(port)
+    options = dict(DEFAULT_SIM_OPTIONS)
+    for key, values in urllib.parse.parse_qs(parsed.query).items():
+        if key not in options: raise ValueError(f"Unknown simulator option '{key}' in {port}")
+        options[key] = type(options[key])(float(values[-1]))
+    return parsed.netloc or 'bench', options
+
+
+class SimulatedBench:
+    """Shared PSU output + resistive load seen by both simulated instruments."""
+    def __init__(self, load_ohms):
+        self.lock = threading.Lock(); self.load_ohms = load_ohms
+        self.set_voltage = 0.0; self.current_limit = 1.0; self.output_on = False
+        self.energy_wh = 0.0; self.energy_running = False; self.last_energy_time = time.monotonic()
+
+    def readings(self, noise):
+        """(voltage, current, power, energy) right now, with relative Gaussian noise."""
+        with self.lock:
+            self.integrate_energy()
+            voltage = self.set_voltage if self.output_on else 0.0
+            current = min(voltage / self.load_ohms, self.current_limit) if self.load_ohms > 0 else self.current_limit
+            if current >= self.current_limit: voltage = current * self.load_ohms # Constant-current mode
+            voltage *= 1 + random.gauss(0, noise); current *= 1 + random.gauss(0, noise)
+            return voltage, current, voltage * current, self.energy_wh
+
+    def integrate_energy(self):
+        now = time.monotonic()
+        if self.energy_running and self.output_on:
+            voltage = self.set_voltage; current = min(voltage / self.load_ohms, self.current_limit)
+            self.energy_wh += voltage * current * (now - self.last_energy_time) / 3600
+        self.last_energy_time = now
+
+
+_benches = {}; _benches_lock = threading.Lock()
+
+def get_bench(name, load_ohms=DEFAULT_SIM_OPTIONS['load_ohms']):
+    with _benches_lock:
+        if name not in _benches: _benches[name] = SimulatedBench(load_ohms)
+        return _benches[name]
+
+
+class SimulatedInstrument:
+    """Common command counting, latency and fault injection."""
+    def __init__(self, bench, options):
+        self.bench = bench; self.options = options; self.command_count = 0; self.closed = False
+
+    def check_alive(self):
+        self.command_count += 1
+        fail_after = self.options['fail_after']
+        if self.closed or (fail_after and self.command_count > fail_after): raise self.port_failure()
+
+    def response_delay(self):
+        return max(0.0, random.gauss(self.options['latency_ms'], self.options['jitter_ms'])) / 1000
+
+    def reading_text(self, value):
+        if random.random() < self.options['garble_rate']: return "#ERR"
+        return f"{value:.5f}"
+
+
+class SimulatedMeter(SimulatedInstrument):
+    """pyserial.Serial stand-in: write() queues responses that arrive after the simulated latency."""
+    @staticmethod
+    def port_failure(): return serial.SerialException("Simulated port failure")
+
+    def __init__(self, port, timeout=2):
+        bench_name, options = parse_sim_port(port)
+        super().__init__(get_bench(bench_name, options['load_ohms']), options)
+        self.name = port; self.timeout = timeout
+        self.responses = [] # [ready_time (monotonic), bytes]
+        self.lock = threading.Lock(); self.busy_until = time.monotonic()
+        self.log_interval = 1.0; self.log_start = None; self.log_stop = None # Internal log, monotonic times
+
+    def write(self, data):
+        for line in data.decode('utf-8').splitlines():
+            if line.strip(): self.handle_command(line.strip())
+        return len(data)
+
+    def handle_command(self, command):
+        self.check_alive(); lower = command.lower()
+        response = None
+        if lower == '*idn?': response = "SIMULATED,POWER-METER,0,1.0"
+        elif lower.startswith(':fetch '):
+            quantity = lower.split(None, 1)[1]
+            voltage, current, power, energy = self.bench.readings(self.options['noise'])
+            value = {'voltage': voltage, 'current': current, 'power': power, 'energy': energy}.get(quantity)
+            if value is None: response = "#ERR"
+            elif random.random() >= self.options['drop_rate']: response = self.reading_text(value)
+        elif lower.startswith(':function:energy '):
+            action = lower.split(None, 1)[1]
+            with self.bench.lock:
+                self.bench.integrate_energy()
+                if action == 'run': self.bench.energy_running = True
+                elif action == 'stop': self.bench.energy_running = False
+                elif action == 'reset': self.bench.energy_wh = 0.0
+        elif lower.startswith(':log:'): response = self.handle_log_command(lower[len(':log:'):])
+        # :FUNCtion:mode, :FUNCtion:ecmode and :SYSTem:* are accepted silently
+        if response is not None:
+            data = (response + "\n").encode('utf-8')
+            transfer = len(data) * 10 / self.options['baud'] if self.options['baud'] else 0.0
+            with self.lock: # Responses come out in order, each one latency after the previous
+                self.busy_until = max(self.busy_until, time.monotonic()) + self.response_delay() + transfer
+                self.responses.append([self.busy_until, data])
+
+    def handle_log_command(self, command):
+        """:LOG:INTerval/CLEar/STARt/STOP/COUNt?/DATA? (lower-cased, prefix stripped). Returns the response text or None."""
+        keyword, _, argument = command.partition(' ')
+        if keyword.startswith('int'): self.log_interval = max(float(argument), 1e-4)
+        elif keyword.startswith('cle'): self.log_start = None; self.log_stop = None
+        elif keyword.startswith('star'): self.log_start = time.monotonic(); self.log_stop = None
+        elif keyword.startswith('stop'):
+            if self.log_start is not None and self.log_stop is None: self.log_stop = time.monotonic()
+        elif keyword.startswith('coun'): return str(self.log_count()) if random.random() >= self.options['drop_rate'] else None
+        elif keyword.startswith('data'):
+            if random.random() < self.options['drop_rate']: return None
+            start, count = (int(part) for part in argument.split(','))
+            response = self.log_records(start, count)
+            if response and random.random() < self.options['garble_rate']: return response[:len(response) // 2] # Cut short mid-transfer
+            return response
+        return None
+
+    def log_count(self):
+        if self.log_start is None: return 0
+        end = self.log_stop if self.log_stop is not None else time.monotonic()
+        return int((end - self.log_start) // self.log_interval) + 1
+
+    def log_records(self, start, count):
+        """Records start..start+count-1 (those logged so far) as 't,V,I,P,E,...'. The bench is read once;
+        earlier records get their own noise and the energy counter as it was at their time."""
+        count = max(0, min(count, self.log_count() - start))
+        if not count: return ""
+        t = (start + np.arange(count)) * self.log_interval
+        voltage, current, _, energy = self.bench.readings(0.0); noise = self.options['noise']
+        age = time.monotonic() - (self.log_start + t)
+        volts = voltage * (1 + np.random.normal(0, noise, count)); amps = current * (1 + np.random.normal(0, noise, count))
+        records = np.column_stack([t, volts, amps, volts * amps, np.maximum(0.0, energy - voltage * current * np.maximum(age, 0) / 3600)])
+        return ",".join("%.4f,%.6g,%.6g,%.6g,%.6g" % tuple(record) for record in records)
+
+    @property
+    def in_waiting(self):
+        now = time.monotonic()
+        with self.lock: return sum(len(data) for ready, data in self.responses if ready <= now)
+
+    def reset_input_buffer(self):
+        now = time.monotonic()
+        with self.lock: self.responses = [item for item in self.responses if item[0] > now] # Not yet "received"
+
+    def readline(self):
+        if self.closed: raise serial.SerialException("Port closed")
+        deadline = time.monotonic() + (self.timeout if self.timeout is not None else 3600)
+        with self.lock: next_ready = self.responses[0][0] if self.responses else None
+        if next_ready is None or next_ready > deadline:
+            time.sleep(max(0.0, deadline - time.monotonic())); return b""
+        time.sleep(max(0.0, next_ready - time.monotonic()))
+        with self.lock: return self.responses.pop(0)[1]
+
+    def close(self):
+        self.closed = True
+
+
+class SimulatedPsu(SimulatedInstrument):
+    """pyvisa resource stand-in for the PSU."""
+    @staticmethod
+    def port_failure():
+        import pyvisa
+        return pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_connection_lost)
+
+    def __init__(self, port):
+        bench_name, options = parse_sim_port(port)
+        super().__init__(get_bench(bench_name, options['load_ohms']), options)
+        self.read_termination = '\n'; self.write_termination = '\n'; self.timeout = 5000
+
+    def write(self, command):
+        self.check_alive(); parts = command.strip().split(); keyword = parts[0].lower() if parts else ''
+        with self.bench.lock:
+            self.bench.integrate_energy()
+            if keyword.startswith('volt') and len(parts) > 1: self.bench.set_voltage = float(parts[1])
+            elif keyword.startswith('curr') and len(parts) > 1: self.bench.current_limit = float(parts[1])
+            elif keyword.startswith('outp') and len(parts) > 1: self.bench.output_on = parts[1].upper() in ('ON', '1')
+
+    def query(self, command):
+        self.check_alive(); time.sleep(self.response_delay())
+        lower = command.strip().lower()
+        if lower == '*idn?': return "SIMULATED,PSU,0,1.0\n"
+        voltage, current, _, _ = self.bench.readings(self.options['noise'])
+        if lower.startswith('meas:volt'): return self.reading_text(voltage) + "\n"
+        if lower.startswith('meas:curr'): return self.reading_text(current) + "\n"
+        import pyvisa
+        raise pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_timeout)
+
+    def close(self):
+        self.closed = True
+
+
+class SimulatedResourceManager:
+    def close(self): pass
+
+
+def open_simulated_psu(port):
+    """Same return shape as connect_psu: (resource manager, psu)."""
+    return SimulatedResourceManager(), SimulatedPsu(port)
+
+
+def open_simulated_meter(port, timeout=2):
+    return SimulatedMeter(port, timeout)
@@ -0,0 +1,79 @@
+"""Per-stage timing histograms for the acquisition path.
+
+Every stage (one SCPI command, a whole sample, a CSV batch write, a DB flush, ...) records
+its durations into fixed log-spaced buckets, so memory stays constant however long a run is.
+Percentiles are interpolated within the buckets, mean and max are exact.
+A run's metrics are published to the rig status for the Measurement page and written to a
+JSON file next to the run's CSV (see metrics_filename_for).
+"""
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+
+HISTOGRAM_BOUNDS_MS = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+METRICS_FILE_SUFFIX = ".metrics.json"
+
+
+def metrics_filename_for(csv_filename):
+    return os.path.splitext(csv_filename)[0] + METRICS_FILE_SUFFIX
+
+
+class StageHistogram:
+    """Duration histogram of one stage, in milliseconds."""
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1) # Last bucket: above the largest bound
+        self.count = 0; self.total_ms = 0.0; self.max_ms = 0.0
+
+    def record(self, ms):
+        self.counts[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, ms)] += 1
+        self.count += 1; self.total_ms += ms; self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q):
+        if not self.count: return None
+        target = q * self.count; cumulative = 0; lower = 0.0
+        for upper, bucket_count in zip(HISTOGRAM_BOUNDS_MS, self.counts):
+            if bucket_count and cumulative + bucket_count >= target: # Linear within the bucket
+                return min(lower + (upper - lower) * (target - cumulative) / bucket_count, self.max_ms)
+            cumulative += bucket_count; lower = upper
+        return self.max_ms
+
+    def summary(self):
+        return {'count': self.count, 'mean_ms': self.total_ms / self.count if self.count else None,
+                'p50_ms': self.quantile(0.5), 'p95_ms': self.quantile(0.95), 'p99_ms': self.quantile(0.99),
+                'max_ms': self.max_ms, 'histogram': self.counts}
+
+
+class TimingMetrics:
+    """Thread-safe set of stage histograms plus event counters (e.g. overruns) for one run."""
+    def __init__(self):
+        self.lock = threading.Lock(); self.stages = {}; self.counters = {}
+
+    def record(self, stage, seconds):
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None: histogram = self.stages[stage] = StageHistogram()
+            histogram.record(seconds * 1000)
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        started = time.perf_counter()
+        try: yield
+        finally: self.record(stage, time.perf_counter() - started)
+
+    def increment(self, counter, amount=1):
+        with self.lock: self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def snapshot(self):
+        """{'counters': {...}, 'stages': {stage: summary}}, JSON-serializable."""
+        with self.lock:
+            return {'counters': dict(self.counters), 'stages': {stage: histogram.summary() for stage, histogram in self.stages.items()}}
+
+    def write_json(self, path, extra=None):
+        """Writes the snapshot (plus extra keys) to path atomically."""
+        data = dict(extra or {}); data.update(self.snapshot()); data['histogram_bounds_ms'] = HISTOGRAM_BOUNDS_MS
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as metrics_file: json.dump(data, metrics_file, indent=1)
+        os.replace(temp_path, path)